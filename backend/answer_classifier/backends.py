@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import inspect
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence
+
+import torch
+
+from answer_classifier.evaluation import benchmark
+
+ONNX_FILE = "model.onnx"
+SOURCE_FILE = "source.json"
+PROBE = (["What is the mean? [SEP] The average value.", "Define variance"], ["the average", "spread of data around the mean"])
+
+
+def _onnxruntime():
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("The ONNX grader backend needs onnxruntime: poetry install --with onnx") from e
+    return onnxruntime
+
+
+def is_onnx_dir(path: str | Path) -> bool:
+    return (Path(path) / ONNX_FILE).is_file()
+
+
+class GraderOutput:
+    def __init__(self, logits: torch.Tensor):
+        self.logits = logits
+
+
+class OnnxGrader:
+    def __init__(self, path: str | Path, intra_op_threads: int = 0):
+        from transformers import AutoConfig
+
+        ort = _onnxruntime()
+        self.path = Path(path)
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(str(self.path / ONNX_FILE), options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.config = AutoConfig.from_pretrained(self.path)
+        self.device = torch.device("cpu")
+        self.model_bytes = sum(f.stat().st_size for f in self.path.glob(f"{ONNX_FILE}*"))
+
+    def __call__(self, **inputs) -> GraderOutput:
+        feed = {name: inputs[name].cpu().numpy() for name in self.input_names}
+        return GraderOutput(torch.from_numpy(self.session.run(None, feed)[0]))
+
+    def parameters(self):
+        return iter(())
+
+    def to(self, device) -> "OnnxGrader":
+        return self
+
+    def eval(self) -> "OnnxGrader":
+        return self
+
+
+def load_onnx(path: str | Path):
+    from transformers import AutoTokenizer
+
+    return OnnxGrader(path), AutoTokenizer.from_pretrained(path)
+
+
+def _export_graph(model, inputs: Dict[str, torch.Tensor], path: Path) -> None:
+    names = list(inputs)
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        batch, seq = torch.export.Dim("batch"), torch.export.Dim("sequence")
+        torch.onnx.export(
+            model, (), str(path), kwargs=inputs, input_names=names, output_names=["logits"],
+            dynamic_shapes={k: {0: batch, 1: seq} for k in names}, dynamo=True,
+        )
+    else:
+        torch.onnx.export(
+            model, (inputs,), str(path), input_names=names, output_names=["logits"],
+            dynamic_axes={**{k: {0: "batch", 1: "sequence"} for k in names}, "logits": {0: "batch"}},
+            opset_version=17,
+        )
+
+
+def _check_probe(torch_model, onnx_dir: Path, tokenizer, atol: float) -> float:
+    enc = tokenizer(*PROBE, padding=True, truncation=True, return_tensors="pt")
+    with torch.no_grad():
+        expected = torch_model(**enc).logits.float()
+    got = OnnxGrader(onnx_dir)(**enc).logits
+    diff = float((expected - got).abs().max())
+    if diff > atol:
+        raise RuntimeError(f"ONNX export diverges from PyTorch on the probe batch (max |dlogit| = {diff:.4g})")
+    return diff
+
+
+def export_onnx(model, tokenizer, out_dir: str | Path, source: Optional[str] = None, atol: float = 1e-3) -> Path:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    model = getattr(model, "backbone", model).cpu().eval()
+
+    inputs = dict(tokenizer(*PROBE, padding=True, truncation=True, return_tensors="pt"))
+    _export_graph(model, inputs, out_dir / ONNX_FILE)
+    model.config.save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+
+    diff = _check_probe(model, out_dir, tokenizer, atol)
+    (out_dir / SOURCE_FILE).write_text(
+        json.dumps({"checkpoint": source, "quantized": False, "probe_max_abs_diff": diff}), encoding="utf-8"
+    )
+    return out_dir
+
+
+def quantize_onnx(src_dir: str | Path, out_dir: str | Path) -> Path:
+    _onnxruntime()
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    src_dir, out_dir = Path(src_dir), Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for f in src_dir.iterdir():
+        if f.is_file() and not f.name.startswith(ONNX_FILE):
+            shutil.copy2(f, out_dir / f.name)
+
+    graph = onnx.load(str(src_dir / ONNX_FILE))
+    del graph.graph.value_info[:]
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        plain = Path(tmp) / ONNX_FILE
+        onnx.save(graph, str(plain))
+        quantize_dynamic(str(plain), str(out_dir / ONNX_FILE), weight_type=QuantType.QInt8)
+
+    source = json.loads((out_dir / SOURCE_FILE).read_text(encoding="utf-8")) if (out_dir / SOURCE_FILE).exists() else {}
+    source.update({"quantized": True, "weight_type": "int8"})
+    (out_dir / SOURCE_FILE).write_text(json.dumps(source), encoding="utf-8")
+    return out_dir
+
+
+def parity_report(
+    torch_model,
+    onnx_model,
+    tokenizer,
+    rows: Sequence[Dict[str, Any]],
+    num_classes: int,
+    batch_size: int = 32,
+    max_length: int = 128,
+    single_samples: int = 100,
+) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"rows": len(rows)}
+    logits = {}
+    for name, model in (("torch", torch_model.cpu().eval()), ("onnx", onnx_model)):
+        report[name], logits[name] = benchmark(model, tokenizer, rows, num_classes, batch_size, max_length, single_samples)
+
+    preds = {name: values.argmax(-1) for name, values in logits.items()}
+    report["agreement"] = round(float((preds["torch"] == preds["onnx"]).float().mean()), 4)
+    report["max_abs_logit_diff"] = round(float((logits["torch"] - logits["onnx"]).abs().max()), 6)
+    report["speedup_batch"] = round(report["torch"]["batch_p50_ms"] / report["onnx"]["batch_p50_ms"], 2)
+    report["speedup_single"] = round(report["torch"]["single_p50_ms"] / report["onnx"]["single_p50_ms"], 2)
+    return report
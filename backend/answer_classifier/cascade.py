@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from common.metrics import REGISTRY
+
+CASCADE_DECISIONS = REGISTRY.counter(
+    "grader_cascade_total", "Answers decided by the cascade stage, or deferred to the grader model", ["stage"]
+)
+
+STAGES = ("empty", "verbatim", "unrelated")
+_WORD = re.compile(r"[<>]=?|[!=]=|[=≠≤≥]|[-+]?\d+(?:\.\d+)?|\w+")
+NEGATIONS = frozenset("not no never none nor cannot without".split())
+STOPWORDS = frozenset(
+    "a an the of to in on at by for with from and or but is are was were be been being it its this that these "
+    "those as if than then so such which who whom what when where why how do does did can could will "
+    "would should may might must i you he she we they them their there here".split()
+)
+
+
+def content_tokens(text: Optional[str]) -> List[str]:
+    return [t for t in _WORD.findall((text or "").casefold()) if t not in STOPWORDS]
+
+
+def markers(tokens: Sequence[str]) -> Counter:
+    # Negations, operators and numbers flip the meaning of otherwise identical answers.
+    return Counter(t for t in tokens if t in NEGATIONS or not any(c.isalpha() for c in t))
+
+
+def token_f1(answer: Sequence[str], reference: Sequence[str]) -> float:
+    common = sum((Counter(answer) & Counter(reference)).values())
+    if not common:
+        return 0.0
+    precision, recall = common / len(answer), common / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+
+def similarity(student_answer: str, ref_answers: Sequence[str], same_markers: bool = False) -> Optional[float]:
+    answer = content_tokens(student_answer)
+    refs = [r for r in (content_tokens(ref) for ref in ref_answers or []) if r]
+    if not answer or not refs:
+        return None
+    if same_markers:
+        refs = [r for r in refs if markers(r) == markers(answer)]
+    return max((token_f1(answer, ref) for ref in refs), default=0.0)
+
+
+def is_empty(student_answer: Optional[str]) -> bool:
+    return not _WORD.search(student_answer or "")
+
+
+class Cascade:
+    def __init__(
+        self,
+        num_classes: int,
+        empty_score: Optional[int] = None,
+        verbatim: Optional[Dict[str, float]] = None,
+        unrelated: Optional[Dict[str, float]] = None,
+        calibration: Optional[Dict[str, Any]] = None,
+    ):
+        self.num_classes = num_classes
+        self.empty_score = empty_score
+        self.verbatim = verbatim
+        self.unrelated = unrelated
+        self.calibration = calibration or {}
+        self._counts = {stage: 0 for stage in (*STAGES, "deferred")}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Cascade":
+        return cls(**json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def save(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "num_classes": self.num_classes,
+            "empty_score": self.empty_score,
+            "verbatim": self.verbatim,
+            "unrelated": self.unrelated,
+            "calibration": self.calibration,
+        }
+        path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        return path
+
+    def decide(self, student_answer: str, ref_answers: Sequence[str]) -> Optional[Tuple[int, str]]:
+        if is_empty(student_answer):
+            return None if self.empty_score is None else (self.empty_score, "empty")
+        sim = similarity(student_answer, ref_answers)
+        if sim is None:
+            return None
+        if self.verbatim and similarity(student_answer, ref_answers, same_markers=True) >= self.verbatim["threshold"]:
+            return int(self.verbatim["score"]), "verbatim"
+        if self.unrelated and sim <= self.unrelated["threshold"]:
+            return int(self.unrelated["score"]), "unrelated"
+        return None
+
+    def grade(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        decision = self.decide(item["student_answer"], item.get("ref_answers") or [])
+        stage = decision[1] if decision else "deferred"
+        with self._lock:
+            self._counts[stage] += 1
+        CASCADE_DECISIONS.inc(stage=stage)
+        if decision is None:
+            return None
+
+        score = decision[0]
+        return {
+            "question": item["question"],
+            "student_answer": item["student_answer"],
+            "predicted_score": score,
+            "probabilities": [1.0 if c == score else 0.0 for c in range(self.num_classes)],
+            "stage": stage,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        decided = total - counts["deferred"]
+        return {**counts, "short_circuit_fraction": round(decided / total, 4) if total else None}
+
+
+def _label(row: Dict[str, Any]) -> int:
+    return int(row["score"])
+
+
+def _best_cut(
+    pairs: List[Tuple[float, int]], descending: bool, target_precision: float, min_support: int
+) -> Optional[Dict[str, float]]:
+    ordered = sorted(pairs, key=lambda p: p[0], reverse=descending)
+    best, labels = None, Counter()
+    for i, (sim, label) in enumerate(ordered):
+        labels[label] += 1
+        if i + 1 < len(ordered) and ordered[i + 1][0] == sim:
+            continue
+        score, hits = labels.most_common(1)[0]
+        support = i + 1
+        if support >= min_support and hits / support >= target_precision:
+            best = {"threshold": round(sim, 6), "score": score, "support": support, "precision": round(hits / support, 4)}
+    return best
+
+
+def calibrate(
+    rows: Sequence[Dict[str, Any]], num_classes: int, target_precision: float = 0.95, min_support: int = 20
+) -> Cascade:
+    empty = Counter(_label(r) for r in rows if is_empty(r["student_answer"]))
+    empty_score = None
+    if sum(empty.values()) >= min_support:
+        score, hits = empty.most_common(1)[0]
+        if hits / sum(empty.values()) >= target_precision:
+            empty_score = score
+
+    def pairs(same_markers: bool) -> List[Tuple[float, int]]:
+        return [
+            (sim, _label(r))
+            for r in rows
+            if not is_empty(r["student_answer"])
+            for sim in [similarity(r["student_answer"], r.get("ref_answers") or [], same_markers)]
+            if sim is not None
+        ]
+
+    verbatim = _best_cut(pairs(True), True, target_precision, min_support)
+    unrelated = _best_cut(pairs(False), False, target_precision, min_support)
+    if verbatim and unrelated and unrelated["threshold"] >= verbatim["threshold"]:
+        unrelated = None
+
+    return Cascade(
+        num_classes,
+        empty_score=empty_score,
+        verbatim=verbatim,
+        unrelated=unrelated,
+        calibration={"rows": len(rows), "target_precision": target_precision, "min_support": min_support},
+    )
+
+
+def evaluate(
+    cascade: Cascade, rows: Sequence[Dict[str, Any]], model_scores: Optional[Sequence[int]] = None
+) -> Dict[str, Any]:
+    labels = [_label(r) for r in rows]
+    decisions = [cascade.decide(r["student_answer"], r.get("ref_answers") or []) for r in rows]
+    decided = [(d, y) for d, y in zip(decisions, labels) if d]
+
+    report: Dict[str, Any] = {
+        "rows": len(rows),
+        "short_circuit_fraction": round(len(decided) / len(rows), 4) if rows else None,
+        "short_circuit_accuracy": round(sum(d[0] == y for d, y in decided) / len(decided), 4) if decided else None,
+        "by_stage": dict(Counter(d[1] for d, _ in decided)),
+    }
+    if model_scores is not None and rows:
+        cascaded = [d[0] if d else m for d, m in zip(decisions, model_scores)]
+        report["model_accuracy"] = round(sum(m == y for m, y in zip(model_scores, labels)) / len(rows), 4)
+        report["cascade_accuracy"] = round(sum(c == y for c, y in zip(cascaded, labels)) / len(rows), 4)
+        report["accuracy_delta"] = round(report["cascade_accuracy"] - report["model_accuracy"], 4)
+    return report
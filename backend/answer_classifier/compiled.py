@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import logging
+from typing import Dict, Optional, Sequence
+
+import torch
+
+from answer_classifier.backends import GraderOutput
+from common.metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+MODES = ("trace", "compile")
+BUCKET_CALLS = REGISTRY.counter(
+    "grader_bucket_calls_total", "Compiled grader forward passes by sequence-length bucket", ["bucket"]
+)
+
+
+class _Logits(torch.nn.Module):
+    def __init__(self, model, names: Sequence[str]):
+        super().__init__()
+        self.model = model
+        self.names = tuple(names)
+
+    def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+        return self.model(**dict(zip(self.names, inputs))).logits
+
+
+class CompiledGrader:
+    def __init__(self, model, pad_token_id: int, buckets: Sequence[int] = (32, 64, 96, 128), mode: str = "trace"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown compile mode {mode!r}; expected one of {MODES}")
+        self.model = model.eval()
+        self.config = model.config
+        self.pad_token_id = pad_token_id
+        self.buckets = tuple(sorted(int(b) for b in buckets))
+        self.mode = mode
+        self.names = ["input_ids", "attention_mask"] + (["token_type_ids"] if self.config.type_vocab_size > 1 else [])
+        self._graphs: Dict[int, torch.nn.Module] = {}
+        self._compiled: Optional[torch.nn.Module] = None
+
+    @property
+    def device(self) -> torch.device:
+        return self.model.device
+
+    def parameters(self):
+        return self.model.parameters()
+
+    def to(self, device) -> "CompiledGrader":
+        self.model.to(device)
+        self._graphs.clear()
+        self._compiled = None
+        return self
+
+    def eval(self) -> "CompiledGrader":
+        return self
+
+    def bucket(self, length: int) -> Optional[int]:
+        return next((b for b in self.buckets if b >= length), None)
+
+    def _pad(self, inputs: Dict[str, torch.Tensor], width: int) -> list:
+        values = {"input_ids": self.pad_token_id}
+        padded = []
+        for name in self.names:
+            tensor = inputs.get(name)
+            if tensor is None:
+                tensor = torch.zeros_like(inputs["input_ids"])
+            extra = width - tensor.shape[1]
+            padded.append(torch.nn.functional.pad(tensor, (0, extra), value=values.get(name, 0)) if extra else tensor)
+        return padded
+
+    def _graph(self, width: int, example: list) -> torch.nn.Module:
+        if self.mode == "compile":
+            if self._compiled is None:
+                limit = 2 * len(self.buckets) + 2
+                torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, limit)
+                self._compiled = torch.compile(_Logits(self.model, self.names).eval())
+            for tensor in example:
+                torch._dynamo.maybe_mark_dynamic(tensor, 0)
+            return self._compiled
+        graph = self._graphs.get(width)
+        if graph is None:
+            with torch.no_grad():
+                graph = torch.jit.trace(_Logits(self.model, self.names).eval(), tuple(example), check_trace=False)
+            self._graphs[width] = graph = torch.jit.freeze(graph)
+        return graph
+
+    def __call__(self, **inputs: torch.Tensor) -> GraderOutput:
+        width = self.bucket(inputs["input_ids"].shape[1])
+        if width is None:
+            BUCKET_CALLS.inc(bucket="eager")
+            return GraderOutput(self.model(**inputs).logits)
+
+        padded = self._pad(inputs, width)
+        BUCKET_CALLS.inc(bucket=width)
+        with torch.no_grad():
+            return GraderOutput(self._graph(width, padded)(*padded))
+
+    def warm_buckets(self, batch_sizes: Sequence[int] = (1, 8)) -> None:
+        for width in self.buckets:
+            for batch in batch_sizes:
+                ids = torch.full((batch, width), self.pad_token_id, dtype=torch.long, device=self.device)
+                inputs = {"input_ids": ids, "attention_mask": torch.ones_like(ids), "token_type_ids": torch.zeros_like(ids)}
+                self(**inputs)
+        log.info("Compiled grader (%s) warmed for buckets %s", self.mode, self.buckets)
+
+
+def compile_grader(model, tokenizer, mode: Optional[str], buckets: Sequence[int] = (32, 64, 96, 128)):
+    if mode in (None, "none") or not isinstance(model, torch.nn.Module):
+        return model
+    if hasattr(model, "exit_heads"):
+        log.warning("Early-exit grader has data-dependent depth; running it uncompiled")
+        return model
+    return CompiledGrader(model, tokenizer.pad_token_id, buckets, mode)
@@ -4,7 +4,7 @@ import json
 import random
 import os
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 import pytorch_lightning as pl
 import torch
@@ -14,6 +14,14 @@ from transformers import AutoTokenizer
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
+def heldout_split(rows: List[Dict], val_split: float = 0.1, seed: int = 42) -> Tuple[List[Dict], List[Dict]]:
+    # Replays GradedAnswerDM's shuffle of (row, ref) pairs: held-out rows have no pair in its train split.
+    owners = [i for i, row in enumerate(rows) for _ in row["ref_answers"]]
+    random.Random(seed).shuffle(owners)
+    trained = set(owners[: int(len(owners) * (1 - val_split))])
+    return [r for i, r in enumerate(rows) if i in trained], [r for i, r in enumerate(rows) if i not in trained]
+
+
 class GradedAnswerDM(pl.LightningDataModule):
     def __init__(
         self,
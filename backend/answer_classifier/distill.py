@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import mlflow
+import pytorch_lightning as pl
+import torch
+from omegaconf import DictConfig, OmegaConf
+
+from answer_classifier.datamodule import GradedAnswerDM
+from answer_classifier.evaluation import benchmark
+from answer_classifier.infer import _latest_artifact, load_classifier
+from answer_classifier.model import DistilledGrader
+from common.checkpoint_utils import find_latest_checkpoint_by_epoch
+from common.logger_selector import get_logger
+from common.plotter import MetricPlotterCallback
+
+log = logging.getLogger(__name__)
+
+STUDENT_PREFIX = "student-grader"
+
+
+class TeacherLogits:
+    def __init__(
+        self,
+        checkpoint: Optional[str],
+        model_root: str,
+        cache_dir: Optional[str] = None,
+        batch_size: int = 32,
+        max_length: int = 128,
+    ):
+        self.path = Path(checkpoint) if checkpoint else _latest_artifact(model_root)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._teacher = None
+        self._memo: Dict[str, torch.Tensor] = {}
+
+    def teacher(self):
+        if self._teacher is None:
+            self._teacher = load_classifier(str(self.path))
+            log.info("Distillation teacher: %s", self.path)
+        return self._teacher
+
+    def key(self, rows: Sequence[Dict[str, Any]]) -> str:
+        stat = self.path.stat()
+        digest = hashlib.sha1(json.dumps([str(self.path.resolve()), stat.st_size, stat.st_mtime_ns, self.max_length]).encode())
+        for row in rows:
+            digest.update(json.dumps([row["context"], row["student"]]).encode())
+        return digest.hexdigest()[:16]
+
+    @torch.no_grad()
+    def compute(self, rows: Sequence[Dict[str, Any]]) -> torch.Tensor:
+        model, tokenizer, _ = self.teacher()
+        logits = []
+        for i in range(0, len(rows), self.batch_size):
+            chunk = rows[i: i + self.batch_size]
+            enc = tokenizer(
+                [r["context"] for r in chunk], [r["student"] for r in chunk],
+                truncation=True, padding=True, max_length=self.max_length, return_tensors="pt",
+            ).to(model.device)
+            logits.append(model(**enc).logits.float().cpu())
+        return torch.cat(logits) if logits else torch.empty(0)
+
+    def __call__(self, rows: Sequence[Dict[str, Any]]) -> torch.Tensor:
+        key = self.key(rows)
+        if key in self._memo:
+            return self._memo[key]
+
+        path = self.cache_dir / f"{key}.pt" if self.cache_dir else None
+        if path is not None and path.exists():
+            logits = torch.load(path, map_location="cpu")
+            log.info("Loaded %d cached teacher logits from %s", len(logits), path)
+        else:
+            logits = self.compute(rows)
+            if path is not None:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                torch.save(logits, path)
+                log.info("Cached %d teacher logits to %s", len(logits), path)
+        self._memo[key] = logits
+        return logits
+
+
+class DistillationDM(GradedAnswerDM):
+    def __init__(self, teacher_logits: TeacherLogits, **kwargs):
+        super().__init__(**kwargs)
+        self.teacher_logits = teacher_logits
+
+    def setup(self, stage: Optional[str] = None) -> None:
+        super().setup(stage)
+        for row, logits in zip(self.train_rows, self.teacher_logits(self.train_rows)):
+            row["teacher_logits"] = logits
+
+    def _encode(self, item: Dict[str, Any]) -> Dict[str, torch.Tensor]:
+        tokens = super()._encode(item)
+        if "teacher_logits" in item:
+            tokens["teacher_logits"] = item["teacher_logits"]
+        return tokens
+
+
+def compare(teacher, student, rows: List[Dict[str, Any]], num_classes: int, batch_size: int, max_length: int):
+    report: Dict[str, Any] = {"rows": len(rows)}
+    logits = {}
+    for name, (model, tokenizer) in (("teacher", teacher), ("student", student)):
+        model = model.to("cpu").eval()
+        report[name], logits[name] = benchmark(model, tokenizer, rows, num_classes, batch_size, max_length)
+        report[name]["params"] = sum(p.numel() for p in model.parameters())
+
+    report["agreement"] = round(float((logits["teacher"].argmax(-1) == logits["student"].argmax(-1)).float().mean()), 4)
+    report["speedup_batch"] = round(report["teacher"]["batch_p50_ms"] / report["student"]["batch_p50_ms"], 2)
+    report["speedup_single"] = round(report["teacher"]["single_p50_ms"] / report["student"]["single_p50_ms"], 2)
+    return report
+
+
+def _log_report(logger, report: Dict[str, Any]) -> None:
+    if not (hasattr(logger, "experiment") and hasattr(logger, "run_id")):
+        return
+    client, run_id = logger.experiment, logger.run_id
+    for name in ("teacher", "student"):
+        for metric, value in report[name].items():
+            client.log_metric(run_id, f"{name}_{metric}", value)
+    for metric in ("agreement", "speedup_batch", "speedup_single"):
+        client.log_metric(run_id, metric, report[metric])
+    client.log_dict(run_id, report, "distillation.json")
+
+
+def train_distilled(cfg: DictConfig, resume: bool = False) -> Dict[str, Any]:
+    cl = cfg.classifier
+    d = cl.distill
+
+    mlflow.set_experiment(cl.experiment_name)
+
+    teacher_logits = TeacherLogits(d.teacher_checkpoint, cl.model_dir, d.cache_dir, cl.batch_size, cl.max_len)
+    dm = DistillationDM(
+        teacher_logits,
+        file_path=cl.data_file,
+        use_ref_answers=cl.use_ref_answers,
+        model_name=d.student_model,
+        batch_size=cl.batch_size,
+        max_len=cl.max_len,
+        num_workers=cl.num_workers,
+        val_split=cl.val_split,
+        seed=cl.seed,
+    )
+
+    model = DistilledGrader(
+        model_name=d.student_model,
+        num_classes=cl.num_classes,
+        lr=d.lr or cl.lr,
+        max_len=cl.max_len,
+    )
+    model.temperature = d.temperature
+    model.alpha = d.alpha
+
+    logger = get_logger(OmegaConf.merge(cl, {"run_name": d.run_name}))
+
+    ckpt_cb = pl.callbacks.ModelCheckpoint(
+        monitor="val_loss",
+        dirpath=cl.model_dir,
+        filename=STUDENT_PREFIX + "-{epoch:02d}-{val_loss:.3f}",
+        save_top_k=1,
+        mode="min",
+        save_last=False
+    )
+
+    resume_ckpt_path = None
+    if resume:
+        resume_ckpt_path = find_latest_checkpoint_by_epoch(cl.model_dir, STUDENT_PREFIX)
+
+    trainer = pl.Trainer(
+        accelerator=cl.accelerator,
+        devices=cl.devices,
+        max_epochs=d.epochs or cl.epochs,
+        precision=cl.precision,
+        gradient_clip_val=cl.grad_clip,
+        accumulate_grad_batches=cl.accum_grad,
+        logger=logger,
+        callbacks=[ckpt_cb, MetricPlotterCallback()],
+    )
+
+    trainer.fit(model, dm, ckpt_path=resume_ckpt_path)
+    trainer.validate(model, datamodule=dm)
+
+    result: Dict[str, Any] = {"best_model_path": ckpt_cb.best_model_path}
+    if dm.val_rows and ckpt_cb.best_model_path:
+        student, student_tok, _ = load_classifier(ckpt_cb.best_model_path)
+        teacher, teacher_tok, _ = teacher_logits.teacher()
+        result["comparison"] = compare(
+            (teacher, teacher_tok), (student, student_tok), dm.val_rows, cl.num_classes, cl.batch_size, cl.max_len
+        )
+        _log_report(logger, result["comparison"])
+    return result
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import statistics
+import time
+from typing import Any, Dict, List, Sequence
+
+import torch
+from torch import nn
+
+from answer_classifier.backends import GraderOutput
+from answer_classifier.evaluation import accuracy, macro_f1
+from common.metrics import REGISTRY
+
+EXIT_PAIRS = REGISTRY.counter("grader_exit_pairs_total", "Graded pairs by the encoder layer they exited at", ["layer"])
+
+
+def default_exit_layers(num_hidden_layers: int) -> List[int]:
+    return list(range(num_hidden_layers - 1))
+
+
+def build_exit_heads(hidden_size: int, num_classes: int, layers: Sequence[int], dropout: float = 0.1) -> nn.ModuleList:
+    return nn.ModuleList(nn.Sequential(nn.Dropout(dropout), nn.Linear(hidden_size, num_classes)) for _ in layers)
+
+
+class EarlyExitModel(nn.Module):
+    def __init__(self, backbone, exit_heads: nn.ModuleList, exit_layers: Sequence[int], threshold: float = 0.9):
+        super().__init__()
+        base = backbone.base_model
+        if not all(hasattr(base, a) for a in ("embeddings", "encoder", "pooler")) or not hasattr(backbone, "classifier"):
+            raise ValueError(f"Early exit needs a BERT-style encoder, got {type(backbone).__name__}")
+        self.backbone = backbone
+        self.exit_heads = exit_heads
+        self.exit_layers = list(exit_layers)
+        self.threshold = threshold
+        self.config = backbone.config
+        self.layers_used = 0
+        self.pairs = 0
+
+    @property
+    def device(self) -> torch.device:
+        return self.backbone.device
+
+    @property
+    def num_layers(self) -> int:
+        return self.config.num_hidden_layers
+
+    @torch.no_grad()
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, **_) -> GraderOutput:
+        base = self.backbone.base_model
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        hidden = base.embeddings(input_ids=input_ids, token_type_ids=token_type_ids)
+        mask = base.get_extended_attention_mask(attention_mask, input_ids.shape)
+
+        logits = torch.empty(input_ids.shape[0], self.config.num_labels, device=input_ids.device)
+        depth = torch.full((input_ids.shape[0],), self.num_layers, device=input_ids.device)
+        active = torch.arange(input_ids.shape[0], device=input_ids.device)
+        heads = dict(zip(self.exit_layers, self.exit_heads))
+
+        for i, layer in enumerate(base.encoder.layer):
+            hidden = layer(hidden, attention_mask=mask)[0]
+            head = heads.get(i)
+            if head is None or i == self.num_layers - 1:
+                continue
+            exit_logits = head(hidden[:, 0]).float()
+            done = exit_logits.softmax(-1).amax(-1) >= self.threshold
+            if done.any():
+                logits[active[done]] = exit_logits[done]
+                depth[active[done]] = i + 1
+                keep = ~done
+                hidden, mask, active = hidden[keep], mask[keep], active[keep]
+                if not len(active):
+                    break
+
+        if len(active):
+            pooled = base.pooler(hidden)
+            logits[active] = self.backbone.classifier(self.backbone.dropout(pooled)).float()
+
+        self.layers_used += int(depth.sum())
+        self.pairs += len(depth)
+        for layer_count, n in zip(*torch.unique(depth, return_counts=True)):
+            EXIT_PAIRS.inc(int(n), layer=int(layer_count))
+        return GraderOutput(logits)
+
+    def reset_stats(self) -> None:
+        self.layers_used = self.pairs = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "avg_layers": round(self.layers_used / self.pairs, 3) if self.pairs else None,
+            "num_layers": self.num_layers,
+        }
+
+
+def threshold_curve(
+    model: EarlyExitModel,
+    tokenizer,
+    rows: Sequence[Dict[str, Any]],
+    num_classes: int,
+    thresholds: Sequence[float],
+    batch_size: int = 32,
+    max_length: int = 128,
+) -> List[Dict[str, Any]]:
+    batches = [
+        tokenizer(
+            [r["context"] for r in rows[i: i + batch_size]],
+            [r["student"] for r in rows[i: i + batch_size]],
+            truncation=True, padding=True, max_length=max_length, return_tensors="pt",
+        ).to(model.device)
+        for i in range(0, len(rows), batch_size)
+    ]
+    labels = [r["label"] for r in rows]
+    original = model.threshold
+
+    curve = []
+    try:
+        for threshold in [*thresholds, float("inf")]:
+            model.threshold = threshold
+            model(**batches[0])
+            model.reset_stats()
+            preds, batch_ms = [], []
+            for enc in batches:
+                start = time.perf_counter()
+                preds.extend(model(**enc).logits.argmax(-1).tolist())
+                batch_ms.append((time.perf_counter() - start) * 1000)
+            curve.append({
+                "threshold": "full" if threshold == float("inf") else threshold,
+                "accuracy": round(accuracy(preds, labels), 4),
+                "f1_macro": round(macro_f1(preds, labels, num_classes), 4),
+                "avg_layers": model.stats()["avg_layers"],
+                "batch_p50_ms": round(statistics.median(batch_ms), 3),
+            })
+    finally:
+        model.threshold = original
+        model.reset_stats()
+    return curve
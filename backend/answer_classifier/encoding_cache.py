@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from transformers import BatchEncoding
+
+from common.metrics import REGISTRY
+
+PREFIX_CACHE = REGISTRY.counter(
+    "grader_prefix_cache_total",
+    "Question/reference prefix encodings served from cache, encoded, or bypassed for truncation",
+    ["result"],
+)
+PREFIX_SAVED = REGISTRY.counter(
+    "grader_prefix_cache_saved_seconds_total", "Estimated tokenization time saved by prefix cache hits"
+)
+
+LEARN = ("what is the mean ? [SEP] the average value", "sum divided by count")
+PROBES = [
+    ("what is a p-value? [SEP] probability of data this extreme under the null", "The chance, if H0 holds."),
+    ("Define variance", "spread of the data around its mean"),
+    ("x", ""),
+]
+
+
+class PairTemplate:
+    def __init__(self, pre: List[int], mid: List[int], post: List[int], types: Optional[Tuple[int, ...]]):
+        self.pre, self.mid, self.post = pre, mid, post
+        self.types = types
+        self.special = len(pre) + len(mid) + len(post)
+
+    def build(self, a: List[int], b: List[int]) -> Tuple[List[int], Optional[List[int]]]:
+        ids = self.pre + a + self.mid + b + self.post
+        if self.types is None:
+            return ids, None
+        lengths = (len(self.pre), len(a), len(self.mid), len(b), len(self.post))
+        return ids, [t for t, n in zip(self.types, lengths) for _ in range(n)]
+
+    @classmethod
+    def learn(cls, tokenizer) -> Optional["PairTemplate"]:
+        full = {k: v[0] for k, v in tokenizer([LEARN[0]], [LEARN[1]]).items()}
+        a, b = tokenizer(list(LEARN), add_special_tokens=False)["input_ids"]
+        ids = full["input_ids"]
+        i = next((i for i in range(len(ids)) if ids[i: i + len(a)] == a), None)
+        if i is None:
+            return None
+        j = next((j for j in range(i + len(a), len(ids)) if ids[j: j + len(b)] == b), None)
+        if j is None:
+            return None
+
+        bounds = (0, i, i + len(a), j, j + len(b), len(ids))
+        types = None
+        if "token_type_ids" in full:
+            regions = [full["token_type_ids"][s:e] for s, e in zip(bounds, bounds[1:])]
+            if any(len(set(r)) > 1 for r in regions):
+                return None
+            types = tuple(r[0] if r else 0 for r in regions)
+        template = cls(ids[:i], ids[i + len(a): j], ids[j + len(b):], types)
+
+        prefixes, answers = (list(texts) for texts in zip(*PROBES))
+        expected = tokenizer(prefixes, answers)
+        segments = zip(
+            tokenizer(prefixes, add_special_tokens=False)["input_ids"],
+            tokenizer(answers, add_special_tokens=False)["input_ids"],
+        )
+        for k, (a, b) in enumerate(segments):
+            built, built_types = template.build(a, b)
+            if built != expected["input_ids"][k] or (types and built_types != expected["token_type_ids"][k]):
+                return None
+        return template
+
+
+def tokenizer_identity(tokenizer) -> str:
+    return f"{type(tokenizer).__name__}:{tokenizer.name_or_path}:{len(tokenizer)}"
+
+
+class PrefixEncodingCache:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[List[int], float]]" = OrderedDict()
+        self._templates: Dict[str, Optional[PairTemplate]] = {}
+        self._counts = {"hit": 0, "miss": 0, "overflow": 0}
+        self._saved = 0.0
+        self._lock = threading.Lock()
+
+    def template(self, tokenizer) -> Optional[PairTemplate]:
+        identity = tokenizer_identity(tokenizer)
+        if identity not in self._templates:
+            self._templates[identity] = PairTemplate.learn(tokenizer)
+        return self._templates[identity]
+
+    def _prefixes(self, tokenizer, prompts: Sequence[str]) -> List[List[int]]:
+        identity = tokenizer_identity(tokenizer)
+        found: Dict[str, List[int]] = {}
+        saved, hits = 0.0, 0
+        with self._lock:
+            for text in prompts:
+                entry = self._entries.get((identity, text))
+                if entry is not None:
+                    self._entries.move_to_end((identity, text))
+                    found[text] = entry[0]
+                    saved += entry[1]
+                    hits += 1
+
+        missing = list(dict.fromkeys(p for p in prompts if p not in found))
+        if missing:
+            start = time.perf_counter()
+            encoded = tokenizer(missing, add_special_tokens=False)["input_ids"]
+            cost = (time.perf_counter() - start) / len(missing)
+            saved += cost * (len(prompts) - hits - len(missing))
+            with self._lock:
+                for text, ids in zip(missing, encoded):
+                    found[text] = ids
+                    self._entries[(identity, text)] = (ids, cost)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        hits = len(prompts) - len(missing)
+        with self._lock:
+            self._counts["hit"] += hits
+            self._counts["miss"] += len(missing)
+            self._saved += saved
+        PREFIX_CACHE.inc(hits, result="hit")
+        PREFIX_CACHE.inc(len(missing), result="miss")
+        PREFIX_SAVED.inc(saved)
+        return [found[p] for p in prompts]
+
+    def encode(self, tokenizer, prompts: Sequence[str], answers: Sequence[str], max_length: int) -> BatchEncoding:
+        template = self.template(tokenizer)
+        if template is None:
+            return tokenizer(
+                list(prompts), list(answers), truncation=True, padding=True, max_length=max_length, return_tensors="pt"
+            )
+
+        prefixes = self._prefixes(tokenizer, prompts)
+        students = tokenizer(list(answers), add_special_tokens=False)["input_ids"]
+        rows: List[Optional[Tuple[List[int], Optional[List[int]]]]] = [
+            template.build(a, b) if len(a) + len(b) + template.special <= max_length else None
+            for a, b in zip(prefixes, students)
+        ]
+
+        overflow = [i for i, row in enumerate(rows) if row is None]
+        if overflow:
+            full = tokenizer(
+                [prompts[i] for i in overflow], [answers[i] for i in overflow], truncation=True, max_length=max_length
+            )
+            for k, i in enumerate(overflow):
+                rows[i] = (full["input_ids"][k], full["token_type_ids"][k] if template.types else None)
+            with self._lock:
+                self._counts["overflow"] += len(overflow)
+            PREFIX_CACHE.inc(len(overflow), result="overflow")
+
+        return self._pad(tokenizer, rows, template.types is not None)
+
+    @staticmethod
+    def _pad(tokenizer, rows: List[Tuple[List[int], Optional[List[int]]]], with_types: bool) -> BatchEncoding:
+        width = max(len(ids) for ids, _ in rows)
+        left = tokenizer.padding_side == "left"
+
+        def pad(seq: List[int], value: int) -> List[int]:
+            fill = [value] * (width - len(seq))
+            return fill + seq if left else seq + fill
+
+        data: Dict[str, Any] = {"input_ids": [pad(ids, tokenizer.pad_token_id) for ids, _ in rows]}
+        if with_types:
+            data["token_type_ids"] = [pad(types, tokenizer.pad_token_type_id) for _, types in rows]
+        data["attention_mask"] = [pad([1] * len(ids), 0) for ids, _ in rows]
+        return BatchEncoding(data, tensor_type="pt")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, saved, entries = dict(self._counts), self._saved, len(self._entries)
+        lookups = counts["hit"] + counts["miss"]
+        return {
+            "entries": entries,
+            **counts,
+            "hit_ratio": round(counts["hit"] / lookups, 4) if lookups else None,
+            "saved_seconds": round(saved, 4),
+            "templates": {k: v is not None for k, v in self._templates.items()},
+        }
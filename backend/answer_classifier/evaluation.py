@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import statistics
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import torch
+
+
+def accuracy(preds: Sequence[int], labels: Sequence[int]) -> float:
+    preds, labels = np.asarray(preds), np.asarray(labels)
+    return float((preds == labels).mean()) if len(labels) else 0.0
+
+
+def macro_f1(preds: Sequence[int], labels: Sequence[int], num_classes: int) -> float:
+    preds, labels = np.asarray(preds), np.asarray(labels)
+    scores = []
+    for c in range(num_classes):
+        tp = int(((preds == c) & (labels == c)).sum())
+        fp = int(((preds == c) & (labels != c)).sum())
+        fn = int(((preds != c) & (labels == c)).sum())
+        scores.append(2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0)
+    return float(np.mean(scores))
+
+
+def _run(model, tokenizer, contexts: List[str], answers: List[str], batch_size: int, max_length: int):
+    logits, batch_ms = [], []
+    for i in range(0, len(contexts), batch_size):
+        enc = tokenizer(
+            contexts[i: i + batch_size], answers[i: i + batch_size],
+            truncation=True, padding=True, max_length=max_length, return_tensors="pt",
+        )
+        start = time.perf_counter()
+        with torch.no_grad():
+            logits.append(model(**enc).logits.float().cpu())
+        batch_ms.append((time.perf_counter() - start) * 1000)
+    return torch.cat(logits), batch_ms
+
+
+def _single_ms(model, tokenizer, contexts: List[str], answers: List[str], max_length: int) -> List[float]:
+    samples = []
+    for context, answer in zip(contexts, answers):
+        enc = tokenizer(context, answer, truncation=True, max_length=max_length, return_tensors="pt")
+        start = time.perf_counter()
+        with torch.no_grad():
+            model(**enc)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def benchmark(
+    model,
+    tokenizer,
+    rows: Sequence[Dict[str, Any]],
+    num_classes: int,
+    batch_size: int = 32,
+    max_length: int = 128,
+    single_samples: int = 100,
+) -> Tuple[Dict[str, Any], torch.Tensor]:
+    contexts = [r["context"] for r in rows]
+    answers = [r["student"] for r in rows]
+    labels = [r["label"] for r in rows]
+
+    _run(model, tokenizer, contexts[:batch_size], answers[:batch_size], batch_size, max_length)
+    logits, batch_ms = _run(model, tokenizer, contexts, answers, batch_size, max_length)
+    single_ms = _single_ms(model, tokenizer, contexts[:single_samples], answers[:single_samples], max_length)
+    preds = logits.argmax(-1).numpy()
+    return {
+        "accuracy": round(accuracy(preds, labels), 4),
+        "f1_macro": round(macro_f1(preds, labels, num_classes), 4),
+        "batch_p50_ms": round(statistics.median(batch_ms), 3),
+        "single_p50_ms": round(statistics.median(single_ms), 3),
+    }, logits
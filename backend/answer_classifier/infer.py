@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Any, Dict, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-import numpy as np
 import torch
 from transformers import AutoTokenizer, AutoModelForSequenceClassification
 
-from answer_classifier.model import AnswerGrader
+from answer_classifier.backends import is_onnx_dir, load_onnx
+from answer_classifier.cascade import Cascade
+from answer_classifier.encoding_cache import PrefixEncodingCache
+from common.metrics import INFERENCE_BATCH, INFERENCE_STAGE, INFERENCE_TOKENS
+from common.shared_weights import is_shared_dir, load_shared
 
 
 def _latest_artifact(root: str | Path) -> Path:
@@ -19,8 +22,16 @@ def _latest_artifact(root: str | Path) -> Path:
 
 
 def _load_ckpt(path: Path):
-    module: AnswerGrader = AnswerGrader.load_from_checkpoint(path, map_location="cpu", strict=False)
+    from answer_classifier.model import AnswerGrader, EarlyExitGrader
+
+    ckpt = torch.load(path, map_location="cpu", weights_only=False)
+    hparams = ckpt.get("hyper_parameters", {})
+    cls = EarlyExitGrader if hparams.get("early_exit") else AnswerGrader
+    module: AnswerGrader = cls(**hparams)
+    module.load_state_dict(ckpt["state_dict"], strict=False)
     tok = AutoTokenizer.from_pretrained(module.hparams.model_name)
+    if isinstance(module, EarlyExitGrader):
+        return module.inference_model(), tok
     return module.model, tok
 
 
@@ -30,6 +41,114 @@ def _load_dir(path: Path):
     return mdl, tok
 
 
+def load_classifier(
+    checkpoint: Optional[str] = None,
+    model_root: str = "./models",
+) -> Tuple[AutoModelForSequenceClassification, AutoTokenizer, Path]:
+    with INFERENCE_STAGE.time(model="grader", stage="discover"):
+        path = Path(checkpoint) if checkpoint else _latest_artifact(model_root)
+
+    with INFERENCE_STAGE.time(model="grader", stage="load"):
+        model, tokenizer = (
+            load_onnx(path) if is_onnx_dir(path)
+            else load_shared(path, AutoModelForSequenceClassification) if is_shared_dir(path)
+            else _load_dir(path) if path.is_dir()
+            else _load_ckpt(path) if path.suffix == ".ckpt"
+            else (_ for _ in ()).throw(ValueError(f"Unknown checkpoint type: {path}"))
+        )
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model.to(device).eval()
+
+    return model, tokenizer, path
+
+
+def _checkpoint_used(checkpoint: Optional[str], model_root: str, model=None, tokenizer=None) -> str:
+    if checkpoint:
+        return str(Path(checkpoint))
+    if model is not None and tokenizer is not None:
+        return str(getattr(model, "name_or_path", "") or tokenizer.name_or_path)
+    with INFERENCE_STAGE.time(model="grader", stage="discover"):
+        return str(_latest_artifact(model_root))
+
+
+def _count_tokens(toks, batch: int) -> None:
+    INFERENCE_BATCH.observe(batch, model="grader")
+    INFERENCE_TOKENS.inc(int(toks["attention_mask"].sum()), model="grader", direction="in")
+
+
+REDUCTIONS = ("mean", "max", "weighted")
+
+
+def reduce_logits(logits: torch.Tensor, owners: torch.Tensor, n_items: int, reduction: str = "mean") -> torch.Tensor:
+    if reduction not in REDUCTIONS:
+        raise ValueError(f"Unknown reduction {reduction!r}, expected one of {REDUCTIONS}")
+    index = owners.unsqueeze(1).expand_as(logits)
+
+    if reduction == "max":
+        out = logits.new_full((n_items, logits.size(1)), float("-inf"))
+        return out.scatter_reduce(0, index, logits, reduce="amax")
+
+    if reduction == "mean":
+        weights = torch.ones_like(owners, dtype=logits.dtype)
+    else:
+        weights = logits.softmax(-1).amax(-1)
+    totals = logits.new_zeros(n_items).index_add(0, owners, weights)
+    summed = logits.new_zeros((n_items, logits.size(1))).index_add(0, owners, logits * weights.unsqueeze(1))
+    return summed / totals.unsqueeze(1)
+
+
+def _summarize(question: str, student_answer: str, logits: torch.Tensor) -> Dict[str, Any]:
+    return {
+        "question": question,
+        "student_answer": student_answer,
+        "predicted_score": int(logits.argmax()),
+        "probabilities": logits.double().softmax(-1).round(decimals=4).tolist(),
+        "stage": "model",
+    }
+
+
+def _grade_items(
+    model: AutoModelForSequenceClassification,
+    tokenizer: AutoTokenizer,
+    items: Sequence[Dict[str, Any]],
+    reduction: str = "mean",
+    max_length: int = 128,
+    encoding_cache: Optional[PrefixEncodingCache] = None,
+) -> List[Dict[str, Any]]:
+    prompts, answers, owners = [], [], []
+    for i, item in enumerate(items):
+        for ref in item.get("ref_answers") or [None]:
+            prompts.append(f"{item['question']} [SEP] {ref}" if ref else item["question"])
+            answers.append(item["student_answer"])
+            owners.append(i)
+
+    device = model.device
+    with INFERENCE_STAGE.time(model="grader", stage="tokenize"):
+        if encoding_cache is not None:
+            toks = encoding_cache.encode(tokenizer, prompts, answers, max_length).to(device)
+        else:
+            toks = tokenizer(
+                prompts,
+                answers,
+                truncation=True,
+                padding=True,
+                max_length=max_length,
+                return_tensors="pt",
+            ).to(device)
+
+    with INFERENCE_STAGE.time(model="grader", stage="forward"), torch.no_grad():
+        logits_all = model(**toks).logits.float().cpu()
+    _count_tokens(toks, batch=len(prompts))
+
+    with INFERENCE_STAGE.time(model="grader", stage="postprocess"):
+        reduced = reduce_logits(logits_all, torch.tensor(owners), len(items), reduction)
+        return [
+            _summarize(item["question"], item["student_answer"], logits)
+            for item, logits in zip(items, reduced)
+        ]
+
+
 def infer_classifier(
     question: str,
     student_answer: str,
@@ -37,41 +156,58 @@ def infer_classifier(
     checkpoint: Optional[str] = None,
     model_root: str = "./models",
     reduction: str = "mean",
+    model: Optional[AutoModelForSequenceClassification] = None,
+    tokenizer: Optional[AutoTokenizer] = None,
+    cascade: Optional[Cascade] = None,
+    encoding_cache: Optional[PrefixEncodingCache] = None,
 ) -> Dict[str, Any]:
-    path = Path(checkpoint) if checkpoint else _latest_artifact(model_root)
-    model, tokenizer = (
-        _load_dir(path) if path.is_dir()
-        else _load_ckpt(path) if path.suffix == ".ckpt"
-        else (_ for _ in ()).throw(ValueError(f"Unknown checkpoint type: {path}"))
-    )
-
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device).eval()
-
-    ref_answers = ref_answers or [None]
-
-    logits_stack = []
-    for ref in ref_answers:
-        prompt = f"{question} [SEP] {ref}" if ref else question
-        toks = tokenizer(
-            prompt,
-            student_answer,
-            truncation=True,
-            padding="max_length",
-            max_length=128,
-            return_tensors="pt",
-        ).to(device)
-        with torch.no_grad():
-            logits_stack.append(model(**toks).logits[0].cpu().numpy())
-
-    logits_arr = np.stack(logits_stack)
-    logits = logits_arr.mean(0) if reduction == "mean" else logits_arr.max(0)
-
-    probs = (np.exp(logits) / np.exp(logits).sum()).round(4).tolist()
-    return {
-        "question": question,
-        "student_answer": student_answer,
-        "predicted_score": int(np.argmax(logits)),
-        "probabilities": probs,
-        "checkpoint_used": str(path),
-    }
+    item = {"question": question, "student_answer": student_answer, "ref_answers": list(ref_answers or [])}
+    checkpoint = _checkpoint_used(checkpoint, model_root, model, tokenizer)
+    result = cascade.grade(item) if cascade else None
+    if result is None:
+        if model is None or tokenizer is None:
+            model, tokenizer, _ = load_classifier(checkpoint)
+        result = _grade_items(model, tokenizer, [item], reduction, encoding_cache=encoding_cache)[0]
+    result["checkpoint_used"] = checkpoint
+    return result
+
+
+def _chunks(items: Sequence[Dict[str, Any]], chunk_size: int) -> List[List[Dict[str, Any]]]:
+    chunks, current, pairs = [], [], 0
+    for item in items:
+        n = max(len(item.get("ref_answers") or []), 1)
+        if current and pairs + n > chunk_size:
+            chunks.append(current)
+            current, pairs = [], 0
+        current.append(item)
+        pairs += n
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def infer_classifier_batch(
+    items: Sequence[Dict[str, Any]],
+    checkpoint: Optional[str] = None,
+    model_root: str = "./models",
+    reduction: str = "mean",
+    chunk_size: int = 64,
+    model: Optional[AutoModelForSequenceClassification] = None,
+    tokenizer: Optional[AutoTokenizer] = None,
+    cascade: Optional[Cascade] = None,
+    encoding_cache: Optional[PrefixEncodingCache] = None,
+) -> List[Dict[str, Any]]:
+    checkpoint = _checkpoint_used(checkpoint, model_root, model, tokenizer)
+    results: List[Optional[Dict[str, Any]]] = [cascade.grade(item) if cascade else None for item in items]
+    pending = [i for i, result in enumerate(results) if result is None]
+    if pending and (model is None or tokenizer is None):
+        model, tokenizer, _ = load_classifier(checkpoint)
+
+    graded = []
+    for chunk in _chunks([items[i] for i in pending], chunk_size):
+        graded.extend(_grade_items(model, tokenizer, chunk, reduction, encoding_cache=encoding_cache))
+    for i, result in zip(pending, graded):
+        results[i] = result
+    for result in results:
+        result["checkpoint_used"] = checkpoint
+    return results
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
 import json
+from typing import List, Optional
+
 import torch
 import pytorch_lightning as pl
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 import torchmetrics
 
+from answer_classifier.early_exit import EarlyExitModel, build_exit_heads, default_exit_layers
+
 
 class AnswerGrader(pl.LightningModule):
     def __init__(
@@ -38,9 +42,12 @@ class AnswerGrader(pl.LightningModule):
     def forward(self, batch):
         return self.model(**batch).logits
 
-    def _shared_step(self, batch, stage: str):
+    def _logits_and_loss(self, batch):
         logits = self(batch)
-        loss = self.loss_fn(logits, batch["labels"])
+        return logits, self.loss_fn(logits, batch["labels"])
+
+    def _shared_step(self, batch, stage: str):
+        logits, loss = self._logits_and_loss(batch)
         preds = logits.argmax(dim=-1)
 
         if stage == "train":
@@ -96,3 +103,61 @@ class AnswerGrader(pl.LightningModule):
 
     def configure_optimizers(self):
         return torch.optim.AdamW(self.parameters(), lr=self.hparams.lr)
+
+
+class EarlyExitGrader(AnswerGrader):
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        num_classes: int = 4,
+        lr: float = 2e-5,
+        max_len: int = 128,
+        early_exit: bool = True,
+        exit_layers: Optional[List[int]] = None,
+        exit_loss_weight: float = 0.5,
+        exit_threshold: float = 0.9,
+    ):
+        super().__init__(model_name=model_name, num_classes=num_classes, lr=lr, max_len=max_len)
+        self.save_hyperparameters()
+
+        cfg = self.model.config
+        self.exit_layers = list(exit_layers) if exit_layers is not None else default_exit_layers(cfg.num_hidden_layers)
+        self.exit_heads = build_exit_heads(cfg.hidden_size, num_classes, self.exit_layers, cfg.hidden_dropout_prob)
+
+    def _logits_and_loss(self, batch):
+        inputs = {k: v for k, v in batch.items() if k != "labels"}
+        out = self.model(**inputs, output_hidden_states=True)
+        loss = self.loss_fn(out.logits, batch["labels"])
+
+        exit_losses = [
+            self.loss_fn(head(out.hidden_states[layer + 1][:, 0]), batch["labels"])
+            for layer, head in zip(self.exit_layers, self.exit_heads)
+        ]
+        if exit_losses:
+            exit_loss = torch.stack(exit_losses).mean()
+            self.log("exit_loss", exit_loss, on_step=False, on_epoch=True, sync_dist=True)
+            loss = loss + self.hparams.exit_loss_weight * exit_loss
+        return out.logits, loss
+
+    def inference_model(self, threshold: Optional[float] = None) -> EarlyExitModel:
+        threshold = self.hparams.exit_threshold if threshold is None else threshold
+        return EarlyExitModel(self.model, self.exit_heads, self.exit_layers, threshold).eval()
+
+
+class DistilledGrader(AnswerGrader):
+    temperature: float = 2.0
+    alpha: float = 0.5
+
+    def _logits_and_loss(self, batch):
+        teacher = batch.get("teacher_logits")
+        if teacher is None:
+            return super()._logits_and_loss(batch)
+
+        logits = self({k: v for k, v in batch.items() if k != "teacher_logits"})
+        hard = self.loss_fn(logits, batch["labels"])
+        t = self.temperature
+        soft = torch.nn.functional.kl_div(
+            torch.log_softmax(logits / t, dim=-1), torch.softmax(teacher / t, dim=-1), reduction="batchmean"
+        ) * t * t
+        self.log("kd_loss", soft, on_step=False, on_epoch=True, sync_dist=True)
+        return logits, self.alpha * hard + (1 - self.alpha) * soft
@@ -6,7 +6,7 @@ from omegaconf import DictConfig
 import mlflow
 
 from answer_classifier.datamodule import GradedAnswerDM
-from answer_classifier.model import AnswerGrader
+from answer_classifier.model import AnswerGrader, EarlyExitGrader
 from common.logger_selector import get_logger
 from common.plotter import MetricPlotterCallback
 from common.checkpoint_utils import find_latest_checkpoint_by_epoch
@@ -27,12 +27,23 @@ def train_classifier(cfg: DictConfig, resume: bool = False) -> Dict[str, Any]:
         seed=cl.seed,
     )
 
-    model = AnswerGrader(
-        model_name=cl.model_name,
-        num_classes=cl.num_classes,
-        lr=cl.lr,
-        max_len=cl.max_len,
-    )
+    if cl.early_exit.enabled:
+        model = EarlyExitGrader(
+            model_name=cl.model_name,
+            num_classes=cl.num_classes,
+            lr=cl.lr,
+            max_len=cl.max_len,
+            exit_layers=list(cl.early_exit.layers) if cl.early_exit.layers is not None else None,
+            exit_loss_weight=cl.early_exit.loss_weight,
+            exit_threshold=cl.early_exit.threshold,
+        )
+    else:
+        model = AnswerGrader(
+            model_name=cl.model_name,
+            num_classes=cl.num_classes,
+            lr=cl.lr,
+            max_len=cl.max_len,
+        )
 
     logger = get_logger(cl)
     
@@ -1,25 +1,147 @@
 from __future__ import annotations
 
-import json
-from fastapi import FastAPI, HTTPException, Query, Body
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+from typing import Literal, Optional
+from fastapi import Depends, FastAPI, HTTPException, Query, Body, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Any
 
-from question_generator.infer import infer_qgen
-from answer_classifier.infer import infer_classifier
+from api.batching import GradingBatcher
+from api.checkpoint_watcher import CheckpointWatcher
+from api.executor import DeadlineExceeded, ExecutorSaturated, InferenceExecutor
+from api.grading_cache import GradingCache
+from api.model_registry import registry
+from api.question_pool import QuestionPool
+from api.review_store import ReviewStore
+from api.rooms import RoomError, RoomManager
+from api.sessions import SessionFinished, SessionLimitReached, SessionManager, SessionNotFound
+from common.metrics import INFERENCE_STAGE, REGISTRY as METRICS
+from question_generator.prompts import QUESTION_PROMPT
 
-from hydra import compose, initialize
 from omegaconf import DictConfig
 
 def load_config() -> DictConfig:
+    from hydra import compose, initialize
+
     with initialize(version_base=None, config_path="../conf"):
         cfg = compose(config_name="config")
     return cfg
 
-cfg = load_config()
+cfg: Optional[DictConfig] = None
+executor: Optional[InferenceExecutor] = None
+batcher: Optional[GradingBatcher] = None
+pool: Optional[QuestionPool] = None
+grading_cache: Optional[GradingCache] = None
+watcher: Optional[CheckpointWatcher] = None
+review_store: Optional[ReviewStore] = None
+sessions: Optional[SessionManager] = None
+rooms: Optional[RoomManager] = None
+
+
+def configure(config: Optional[DictConfig] = None) -> DictConfig:
+    global cfg, executor, batcher, pool, grading_cache, watcher, review_store, sessions, rooms
+    cfg = config if config is not None else load_config()
+    sv = cfg.serving
+
+    executor = InferenceExecutor(
+        max_workers=sv.executor.max_workers,
+        max_queue=sv.executor.max_queue,
+        retry_after=sv.executor.retry_after_s,
+        background_workers=sv.executor.background_workers,
+        background_queue=sv.executor.background_queue,
+    )
+
+    batcher = GradingBatcher(
+        functools.partial(registry.grade_batch, cascade=False),
+        max_batch_size=sv.batching.max_batch_size,
+        max_wait_ms=sv.batching.max_wait_ms,
+        runner=executor.run,
+    )
+
+    pool = QuestionPool(
+        registry.generate_batch,
+        topics=cfg.dataparser.subtopics,
+        prompt_template=QUESTION_PROMPT,
+        capacity=sv.question_pool.capacity,
+        low_watermark=sv.question_pool.low_watermark,
+        refill_per_topic=sv.question_pool.refill_per_topic,
+        topics_per_refill=sv.question_pool.topics_per_refill,
+        runner=executor.run_background,
+    )
+
+    grading_cache = GradingCache(
+        max_entries=sv.grading_cache.max_entries,
+        max_bytes=sv.grading_cache.max_mb * 2 ** 20,
+        ttl_s=sv.grading_cache.ttl_s,
+    )
+
+    watcher = CheckpointWatcher(
+        registry,
+        sv.model_root,
+        interval_s=sv.watcher.interval_s,
+        settle_s=sv.watcher.settle_s,
+    )
+
+    review_store = ReviewStore(
+        sv.reviews.db_path,
+        max_batch=sv.reviews.max_batch,
+        flush_interval_ms=sv.reviews.flush_interval_ms,
+    )
+
+    sessions = SessionManager(
+        registry.generate_batch,
+        prompt_template=QUESTION_PROMPT,
+        prefetch=sv.sessions.prefetch,
+        ttl_s=sv.sessions.ttl_s,
+        max_sessions=sv.sessions.max_sessions,
+        reap_interval_s=sv.sessions.reap_interval_s,
+        pool=pool if sv.question_pool.enabled else None,
+        runner=executor.run_background,
+    )
+
+    rooms = RoomManager(
+        grade_round,
+        round_s=sv.rooms.round_s,
+        max_round_s=sv.rooms.max_round_s,
+        max_players=sv.rooms.max_players,
+    )
+    return cfg
+
 
-app = FastAPI(title="QA-Grader API", version="1.0", docs_url="/docs", redoc_url="/redoc")
+def on_model_swap(name: str) -> None:
+    if name == "qgen":
+        pool.clear()
+
+
+registry.on_swap.append(on_model_swap)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    if cfg is None:
+        configure()
+    review_store.start()
+    registry.load(cfg)
+    await batcher.start()
+    await sessions.start()
+    if cfg.serving.question_pool.enabled and registry.qgen:
+        await pool.start()
+    if cfg.serving.watcher.enabled and cfg.serving.weights != "mmap":
+        await watcher.start()
+    yield
+    await watcher.stop()
+    await sessions.stop()
+    await pool.stop()
+    await batcher.stop()
+    review_store.stop()
+
+
+app = FastAPI(title="QA-Grader API", version="1.0", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +151,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+HTTP_REQUESTS = METRICS.counter("http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+HTTP_LATENCY = METRICS.histogram("http_request_duration_seconds", "HTTP request latency by route", ["method", "route"])
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(method=request.method, route=path, status=status)
+        HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, route=path)
+
+
+@app.exception_handler(ExecutorSaturated)
+async def executor_saturated(_: Request, exc: ExecutorSaturated):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": exc.retry_after_header},
+    )
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded(_: Request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+
+def request_deadline(request: Request) -> Optional[float]:
+    timeout = request.headers.get("X-Request-Timeout") or cfg.serving.executor.default_timeout_s
+    try:
+        timeout = float(timeout)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid X-Request-Timeout header")
+    return time.monotonic() + timeout if timeout > 0 else None
+
+
+def require_admin(request: Request) -> None:
+    token = cfg.serving.admin_token
+    if token and request.headers.get("X-Admin-Token") != token:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+ModelName = Literal["qgen", "grader"]
+
 
 class QuestionResponse(BaseModel):
     prompt: str
@@ -39,11 +211,25 @@ class QuestionResponse(BaseModel):
 class ClassifyRequest(BaseModel):
     question: str
     student_answer: str
+    ref_answers: List[str] = []
 
 class ClassifyResponse(BaseModel):
     question: str
     predicted_score: int
 
+class ClassifyBatchRequest(BaseModel):
+    items: List[ClassifyRequest]
+
+class ClassifyBatchItem(BaseModel):
+    question: str
+    student_answer: str
+    predicted_score: int
+    probabilities: List[float]
+    stage: str = "model"
+
+class ClassifyBatchResponse(BaseModel):
+    results: List[ClassifyBatchItem]
+
 class ReviewedQuestionItem(BaseModel):
     question: Dict[str, Any]
     userAnswer: str
@@ -52,23 +238,220 @@ class ReviewedQuestionItem(BaseModel):
 class ReviewSubmissionRequest(BaseModel):
     reviewed_items: List[ReviewedQuestionItem]
 
-USER_REVIEWS_FILE = "./user_reviews.jsonl"
+class SessionRequest(BaseModel):
+    topics: List[str]
+    count: int
+
+class SessionResponse(BaseModel):
+    session_id: str
+    total: int
+    prefetch: int
+
+class SessionQuestionResponse(BaseModel):
+    index: int
+    total: int
+    remaining: int
+    prompt: str
+    topic: str
+    context: Optional[str] = None
+    generated_question: str
+
+class PinRequest(BaseModel):
+    checkpoint: str
+
+@app.get("/v1/health")
+async def health():
+    return {
+        **registry.state(),
+        "question_pool": pool.stats(), "executor": executor.stats(),
+        "grading_cache": grading_cache.stats(), "sessions": sessions.stats(), "rooms": rooms.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/v1/stats")
+async def stats():
+    return METRICS.snapshot()
+
 
 @app.get("/v1/generate_question", response_model=QuestionResponse)
-async def generate_question(topic: str = Query(..., min_length=1)):
-    prompt = f"Generate a question about: {topic}"
-    result = infer_qgen(prompt, cfg=cfg)
+async def generate_question(request: Request, topic: str = Query(..., min_length=1)):
+    result = pool.take(topic)
+    if result is None:
+        result = await executor.run(
+            registry.infer_qgen, QUESTION_PROMPT.format(topic=topic), cfg=cfg, deadline=request_deadline(request)
+        )
     try:
-        return QuestionResponse.model_validate(result)
+        with INFERENCE_STAGE.time(model="qgen", stage="validate"):
+            return QuestionResponse.model_validate(result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Invalid response: {e}")
 
 
+@app.get("/v1/generate_question/stream")
+async def generate_question_stream(request: Request, topic: str = Query(..., min_length=1)):
+    qgen = registry.qgen
+    if qgen is None:
+        raise HTTPException(status_code=503, detail="Question generator is not loaded")
+
+    from api.streaming import CancelOnDisconnect, CountingStreamer, stream_events
+
+    started = time.perf_counter()
+    streamer = CountingStreamer(qgen.tokenizer, skip_special_tokens=True)
+    cancel = CancelOnDisconnect()
+    generation = executor.submit(
+        registry.infer_qgen,
+        QUESTION_PROMPT.format(topic=topic),
+        qgen=qgen,
+        streamer=streamer,
+        stopping_criteria=cancel.as_list(),
+        deadline=request_deadline(request),
+    )
+    return StreamingResponse(
+        stream_events(generation, streamer, cancel, started),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/v1/sessions", response_model=SessionResponse, status_code=201)
+async def create_session(req: SessionRequest):
+    topics = [t.strip() for t in req.topics if t.strip()]
+    if not topics:
+        raise HTTPException(status_code=400, detail="At least one topic is required")
+    if not 1 <= req.count <= cfg.serving.sessions.max_questions:
+        raise HTTPException(
+            status_code=400, detail=f"count must be between 1 and {cfg.serving.sessions.max_questions}"
+        )
+    if registry.qgen is None:
+        raise HTTPException(status_code=503, detail="Question generator is not loaded")
+    try:
+        session = sessions.create(topics, req.count)
+    except SessionLimitReached as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return {"session_id": session.id, "total": session.total, "prefetch": sessions.prefetch}
+
+
+@app.get("/v1/sessions/{session_id}/next", response_model=SessionQuestionResponse)
+async def next_session_question(session_id: str, request: Request):
+    try:
+        return await sessions.next(session_id, deadline=request_deadline(request))
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SessionFinished as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+
+@app.get("/v1/sessions/{session_id}")
+async def get_session(session_id: str):
+    try:
+        return sessions.get(session_id).state()
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.delete("/v1/sessions/{session_id}", status_code=204)
+async def close_session(session_id: str):
+    if not sessions.close(session_id):
+        raise HTTPException(status_code=404, detail=f"Unknown or expired session: {session_id}")
+
+
 @app.post("/v1/classify_answer", response_model=ClassifyResponse)
-async def classify_answer(req: ClassifyRequest):
-    result = infer_classifier(req.question, req.student_answer)
+async def classify_answer(req: ClassifyRequest, request: Request):
+    deadline = request_deadline(request)
+
+    async def grade():
+        if cfg.serving.batching.enabled:
+            return await batcher.submit(req.question, req.student_answer, req.ref_answers, deadline=deadline)
+        return await executor.run(
+            registry.infer_classifier, req.question, req.student_answer, req.ref_answers,
+            cascade=False, deadline=deadline,
+        )
+
+    result = registry.cascade.grade(req.model_dump()) if registry.cascade else None
+    if result is None and cfg.serving.grading_cache.enabled:
+        key = grading_cache.key(req.question, req.student_answer, req.ref_answers, registry.grader_identity())
+        result = await grading_cache.get_or_compute(key, grade)
+        result = {**result, "question": req.question, "student_answer": req.student_answer}
+    elif result is None:
+        result = await grade()
+    try:
+        with INFERENCE_STAGE.time(model="grader", stage="validate"):
+            return ClassifyResponse.model_validate(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Invalid response: {e}")
+
+async def grade_cached(items: List[Dict[str, Any]], deadline: Optional[float]) -> List[Dict[str, Any]]:
+    identity = registry.grader_identity()
+    keys = [grading_cache.key(i["question"], i["student_answer"], i["ref_answers"], identity) for i in items]
+    results: List[Optional[Dict[str, Any]]] = [grading_cache.get(k) for k in keys]
+    for result in results:
+        grading_cache.record("miss" if result is None else "hit")
+
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        graded = await executor.run(registry.grade_batch, [items[i] for i in missing], deadline=deadline)
+        for i, result in zip(missing, graded):
+            grading_cache.put(keys[i], result)
+            results[i] = result
+
+    return [
+        {**result, "question": item["question"], "student_answer": item["student_answer"]}
+        for item, result in zip(items, results)
+    ]
+
+
+async def grade_round(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    deadline = time.monotonic() + cfg.serving.executor.default_timeout_s
+    if cfg.serving.grading_cache.enabled:
+        return await grade_cached(items, deadline)
+    return await executor.run(registry.grade_batch, items, deadline=deadline)
+
+
+@app.websocket("/v1/rooms/{room_id}/ws")
+async def room_socket(websocket: WebSocket, room_id: str, player_id: str = Query(..., min_length=1)):
+    await websocket.accept()
     try:
-        return ClassifyResponse.model_validate(result)
+        await rooms.join(room_id, player_id, websocket.send_json)
+    except RoomError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=1008)
+        return
+
+    try:
+        while True:
+            try:
+                message = await websocket.receive_json()
+                if not isinstance(message, dict):
+                    raise RoomError("Messages must be JSON objects")
+                await rooms.handle(room_id, player_id, message)
+            except (RoomError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await rooms.leave(room_id, player_id)
+
+
+@app.post("/v1/classify_answers", response_model=ClassifyBatchResponse)
+async def classify_answers(req: ClassifyBatchRequest, request: Request):
+    if not req.items:
+        raise HTTPException(status_code=400, detail="No items submitted")
+    if len(req.items) > cfg.serving.batching.max_bulk_items:
+        raise HTTPException(status_code=413, detail=f"At most {cfg.serving.batching.max_bulk_items} items per call")
+
+    items = [item.model_dump() for item in req.items]
+    if cfg.serving.grading_cache.enabled:
+        results = await grade_cached(items, request_deadline(request))
+    else:
+        results = await executor.run(registry.grade_batch, items, deadline=request_deadline(request))
+    try:
+        with INFERENCE_STAGE.time(model="grader", stage="validate"):
+            return ClassifyBatchResponse.model_validate({"results": results})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Invalid response: {e}")
 
@@ -78,9 +461,53 @@ async def submit_review_questions(submission: ReviewSubmissionRequest = Body(...
         raise HTTPException(status_code=400, detail="No items submitted")
 
     try:
-        with open(USER_REVIEWS_FILE, "a", encoding="utf-8") as f:
-            for item in submission.reviewed_items:
-                f.write(json.dumps(item.dict()) + "\n")
-        return {"message": f"{len(submission.reviewed_items)} items submitted"}
+        saved = await asyncio.wrap_future(
+            review_store.submit([item.model_dump() for item in submission.reviewed_items])
+        )
+        return {"message": f"{saved} items submitted"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error saving review: {e}")
+
+
+@app.get("/v1/reviews")
+async def list_reviews(
+    topic: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    return await asyncio.to_thread(review_store.query, topic, min_score, max_score, limit, offset)
+
+
+@app.get("/v1/admin/models", dependencies=[Depends(require_admin)])
+async def admin_models():
+    return {"models": registry.rollout_state(), "watcher": watcher.stats()}
+
+
+@app.post("/v1/admin/models/{name}/pin", dependencies=[Depends(require_admin)])
+async def admin_pin(name: ModelName, req: PinRequest):
+    try:
+        await asyncio.to_thread(registry.pin, name, req.checkpoint)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Checkpoint rejected: {e}")
+    return registry.rollout_state()[name]
+
+
+@app.delete("/v1/admin/models/{name}/pin", dependencies=[Depends(require_admin)])
+async def admin_unpin(name: ModelName):
+    registry.unpin(name)
+    return registry.rollout_state()[name]
+
+
+@app.post("/v1/admin/models/{name}/rollback", dependencies=[Depends(require_admin)])
+async def admin_rollback(name: ModelName):
+    try:
+        await asyncio.to_thread(registry.rollback, name)
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error saving review: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=422, detail=f"Checkpoint rejected: {e}")
+    return registry.rollout_state()[name]
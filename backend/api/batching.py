@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from api.executor import DeadlineExceeded
+from common.metrics import REGISTRY, SIZE_BUCKETS
+
+log = logging.getLogger(__name__)
+
+BATCH_SIZE = REGISTRY.histogram(
+    "grader_batch_size", "Grading requests per batched forward pass", buckets=SIZE_BUCKETS
+)
+BATCH_PAIRS = REGISTRY.histogram(
+    "grader_batch_pairs", "(question, reference, answer) pairs per batched forward pass", buckets=SIZE_BUCKETS
+)
+QUEUE_WAIT = REGISTRY.histogram("grader_queue_wait_seconds", "Time a grading request waits for its batch")
+BATCH_SECONDS = REGISTRY.histogram("grader_batch_seconds", "Duration of a batched grading forward pass")
+
+GradeFn = Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]
+Runner = Callable[..., Awaitable[Any]]
+
+
+class GradingBatcher:
+    def __init__(
+        self,
+        grade_fn: GradeFn,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        runner: Runner = asyncio.to_thread,
+    ):
+        self.grade_fn = grade_fn
+        self.runner = runner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue and not self._queue.empty():
+            _, fut, _, _ = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Grading batcher stopped"))
+
+    async def submit(
+        self,
+        question: str,
+        student_answer: str,
+        ref_answers: Sequence[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        if self._task is None:
+            raise RuntimeError("Grading batcher is not running")
+        item = {"question": question, "student_answer": student_answer, "ref_answers": list(ref_answers or [])}
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut, time.perf_counter(), deadline))
+        if deadline is None:
+            return await fut
+        try:
+            return await asyncio.wait_for(fut, max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded() from None
+
+    async def _collect(self) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = self._live(await self._collect())
+            if not batch:
+                continue
+
+            now = time.perf_counter()
+            for _, _, enqueued, _ in batch:
+                QUEUE_WAIT.observe(now - enqueued)
+            items = [item for item, _, _, _ in batch]
+            BATCH_SIZE.observe(len(items))
+            BATCH_PAIRS.observe(sum(max(len(item["ref_answers"]), 1) for item in items))
+
+            try:
+                with BATCH_SECONDS.time():
+                    results = await self.runner(self.grade_fn, items)
+            except Exception as e:
+                if not isinstance(e, DeadlineExceeded):
+                    log.exception("Batched grading failed")
+                for _, fut, _, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for (_, fut, _, _), result in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(result)
+
+    @staticmethod
+    def _live(batch: List[tuple]) -> List[tuple]:
+        now = time.monotonic()
+        live = []
+        for entry in batch:
+            _, fut, _, deadline = entry
+            if fut.done():
+                continue
+            if deadline is not None and now >= deadline:
+                fut.set_exception(DeadlineExceeded("Request deadline passed while queued"))
+                continue
+            live.append(entry)
+        return live
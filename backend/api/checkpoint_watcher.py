@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from common.metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+SWAPS = REGISTRY.counter("model_swaps_total", "Checkpoint hot-swaps by model and result", ["model", "result"])
+
+PATTERNS = {"qgen": ("qgen*", "checkpoint-*"), "grader": ("grader*", "checkpoint-*")}
+
+Fingerprint = Tuple[int, float]
+Runner = Callable[..., Awaitable[Any]]
+
+
+def fingerprint(path: Path) -> Optional[Fingerprint]:
+    try:
+        if path.is_dir():
+            stats = [p.stat() for p in path.rglob("*") if p.is_file()]
+            if not stats:
+                return None
+            return sum(s.st_size for s in stats), max(s.st_mtime for s in stats)
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime) if stat.st_size else None
+
+
+class CheckpointWatcher:
+    def __init__(
+        self,
+        registry,
+        model_root: str | Path,
+        interval_s: float = 10.0,
+        settle_s: float = 5.0,
+        runner: Runner = asyncio.to_thread,
+    ):
+        self.registry = registry
+        self.model_root = Path(model_root)
+        self.interval = interval_s
+        self.settle = settle_s
+        self.runner = runner
+        self._seen: Dict[Path, Fingerprint] = {}
+        self._rejected: Set[Tuple[Path, Fingerprint]] = set()
+        self._last_poll: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _candidates(self, name: str) -> List[Path]:
+        paths = {p for pattern in PATTERNS[name] for p in self.model_root.rglob(pattern)}
+        return [p for p in paths if not p.name.endswith((".tmp", ".partial"))]
+
+    def _stable(self, path: Path, now: float) -> Optional[Fingerprint]:
+        current = fingerprint(path)
+        previous, self._seen[path] = self._seen.get(path), current
+        if current is None or current != previous or now - current[1] < self.settle:
+            return None
+        return current
+
+    def latest_validated(self, name: str) -> Optional[Tuple[Path, Fingerprint]]:
+        now = time.time()
+        ready = []
+        for path in self._candidates(name):
+            fp = self._stable(path, now)
+            if fp is not None and (path, fp) not in self._rejected:
+                ready.append((path, fp))
+        return max(ready, key=lambda c: c[1][1], default=None)
+
+    async def poll_once(self) -> None:
+        self._last_poll = time.time()
+        for name in ("qgen", "grader"):
+            candidate = self.latest_validated(name)
+            if candidate is None or self.registry.pinned[name]:
+                continue
+
+            path, fp = candidate
+            current = getattr(self.registry, name)
+            if current is not None and Path(current.checkpoint).resolve() == path.resolve():
+                continue
+            if current is not None and (fingerprint(Path(current.checkpoint)) or (0, 0.0))[1] >= fp[1]:
+                continue
+
+            log.info("New %s checkpoint %s, loading in background", name, path)
+            try:
+                await self.runner(self.registry.swap, name, str(path))
+            except Exception:
+                log.exception("Rejected %s checkpoint %s", name, path)
+                self._rejected.add((path, fp))
+                SWAPS.inc(model=name, result="rejected")
+            else:
+                SWAPS.inc(model=name, result="swapped")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                log.exception("Checkpoint watcher poll failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "model_root": str(self.model_root),
+            "last_poll": self._last_poll,
+            "rejected": sorted(str(p) for p, _ in self._rejected),
+        }
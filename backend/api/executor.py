@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from common.metrics import REGISTRY
+
+EXECUTOR_QUEUED = REGISTRY.gauge("inference_queue_length", "Inference jobs admitted but not yet running")
+EXECUTOR_RUNNING = REGISTRY.gauge("inference_running", "Inference jobs currently running")
+EXECUTOR_REJECTED = REGISTRY.counter("inference_rejected_total", "Inference jobs rejected because the queue was full")
+EXECUTOR_EXPIRED = REGISTRY.counter(
+    "inference_expired_total", "Inference jobs dropped after their deadline", ["stage"]
+)
+EXECUTOR_BACKGROUND = REGISTRY.gauge(
+    "inference_background_jobs", "Background inference jobs (pool refills, prefetch) admitted"
+)
+EXECUTOR_WAIT = REGISTRY.histogram("inference_queue_wait_seconds", "Time an inference job waits for a worker")
+
+
+class ExecutorSaturated(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Inference queue is full, retry later")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, message: str = "Request deadline exceeded"):
+        super().__init__(message)
+
+
+class InferenceExecutor:
+    def __init__(
+        self,
+        max_workers: int = 1,
+        max_queue: int = 32,
+        retry_after: float = 1.0,
+        background_workers: int = 1,
+        background_queue: int = 4,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.background_workers = background_workers
+        self.background_queue = background_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._background_pool = ThreadPoolExecutor(max_workers=background_workers, thread_name_prefix="inference-bg")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._admitted = 0
+        self._background = 0
+        self._background_rejected = 0
+        self._running = 0
+        self._rejected = 0
+        self._expired = 0
+
+    async def run(self, fn: Callable[..., Any], *args, deadline: Optional[float] = None, **kwargs) -> Any:
+        fut = self.submit(fn, *args, deadline=deadline, **kwargs)
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self._expire("timeout")
+            raise DeadlineExceeded() from None
+
+    def submit(self, fn: Callable[..., Any], *args, deadline: Optional[float] = None, **kwargs) -> asyncio.Future:
+        with self._lock:
+            if self._admitted >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                EXECUTOR_REJECTED.inc()
+                raise ExecutorSaturated(self.retry_after)
+            self._admitted += 1
+            self._publish()
+
+        enqueued = time.monotonic()
+
+        def job():
+            with self._lock:
+                self._running += 1
+                self._publish()
+            EXECUTOR_WAIT.observe(time.monotonic() - enqueued)
+            try:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self._expire("queued")
+                    raise DeadlineExceeded("Request deadline passed while queued")
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._publish()
+
+        cf = self._pool.submit(job)
+        cf.add_done_callback(self._release)
+        return asyncio.wrap_future(cf)
+
+    async def run_background(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        # Background work has its own cap, does not count toward max_queue and
+        # only starts while no foreground job is waiting for a worker.
+        with self._lock:
+            if self._background >= self.background_workers + self.background_queue:
+                self._background_rejected += 1
+                raise ExecutorSaturated(self.retry_after)
+            self._background += 1
+            EXECUTOR_BACKGROUND.set(self._background)
+
+        def job():
+            with self._idle:
+                self._idle.wait_for(lambda: self._admitted == self._running)
+            return fn(*args, **kwargs)
+
+        cf = self._background_pool.submit(job)
+        cf.add_done_callback(self._release_background)
+        return await asyncio.wrap_future(cf)
+
+    def _release(self, _: Future) -> None:
+        with self._lock:
+            self._admitted -= 1
+            self._publish()
+
+    def _release_background(self, _: Future) -> None:
+        with self._lock:
+            self._background -= 1
+            EXECUTOR_BACKGROUND.set(self._background)
+
+    def _expire(self, stage: str) -> None:
+        with self._lock:
+            self._expired += 1
+        EXECUTOR_EXPIRED.inc(stage=stage)
+
+    def _publish(self) -> None:
+        if self._admitted == self._running:
+            self._idle.notify_all()
+        EXECUTOR_QUEUED.set(self._admitted - self._running)
+        EXECUTOR_RUNNING.set(self._running)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._admitted - self._running,
+                "running": self._running,
+                "rejected": self._rejected,
+                "expired": self._expired,
+                "background": {
+                    "max_workers": self.background_workers,
+                    "max_queue": self.background_queue,
+                    "admitted": self._background,
+                    "rejected": self._background_rejected,
+                },
+            }
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+from api.executor import DeadlineExceeded
+from common.metrics import REGISTRY
+
+CACHE_REQUESTS = REGISTRY.counter("grading_cache_requests_total", "Grading cache lookups by result", ["result"])
+CACHE_EVICTIONS = REGISTRY.counter("grading_cache_evictions_total", "Grading cache evictions by reason", ["reason"])
+CACHE_ENTRIES = REGISTRY.gauge("grading_cache_entries", "Entries held in the grading cache")
+CACHE_BYTES = REGISTRY.gauge("grading_cache_bytes", "Approximate memory held by the grading cache")
+
+_TRAILING_PUNCT = re.compile(r"[.!?;,\s]+$")
+
+
+def normalize(text: Optional[str]) -> str:
+    return _TRAILING_PUNCT.sub("", " ".join((text or "").casefold().split()))
+
+
+class GradingCache:
+    def __init__(self, max_entries: int = 50000, max_bytes: int = 64 * 2 ** 20, ttl_s: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_s
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._counts = {"hit": 0, "miss": 0, "coalesced": 0}
+        self._evictions = {"lru": 0, "ttl": 0}
+
+    @staticmethod
+    def key(question: str, student_answer: str, ref_answers: Sequence[str], checkpoint: str) -> str:
+        payload = json.dumps(
+            [normalize(question), normalize(student_answer), sorted(normalize(r) for r in ref_answers or []), checkpoint]
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, _, result = entry
+            if time.monotonic() - stored_at > self.ttl:
+                self._evict(key, "ttl")
+                return None
+            self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        size = len(key) + len(json.dumps(result))
+        with self._lock:
+            if key in self._entries:
+                self._evict(key, None)
+            self._entries[key] = (time.monotonic(), size, result)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._evict(next(iter(self._entries)), "lru")
+            self._publish()
+
+    def _evict(self, key: str, reason: Optional[str]) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        if reason:
+            self._evictions[reason] += 1
+            CACHE_EVICTIONS.inc(reason=reason)
+        self._publish()
+
+    def _publish(self) -> None:
+        CACHE_ENTRIES.set(len(self._entries))
+        CACHE_BYTES.set(self._bytes)
+
+    def record(self, result: str) -> None:
+        with self._lock:
+            self._counts[result] += 1
+        CACHE_REQUESTS.inc(result=result)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        cached = self.get(key)
+        if cached is not None:
+            self.record("hit")
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.record("coalesced")
+            try:
+                return await asyncio.shield(task)
+            except DeadlineExceeded:
+                # The leader ran out of its own deadline; ours may still allow a fresh attempt.
+                return await self.get_or_compute(key, compute)
+        else:
+            self.record("miss")
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._settle(key, t))
+        return await asyncio.shield(task)
+
+    def _settle(self, key: str, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = sum(self._counts.values())
+            served = self._counts["hit"] + self._counts["coalesced"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                **self._counts,
+                "hit_ratio": round(served / lookups, 4) if lookups else None,
+                "evictions": dict(self._evictions),
+            }
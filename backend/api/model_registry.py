@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import gc
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from omegaconf import DictConfig
+
+from common.metrics import MODEL_INFO
+from common.shared_weights import memory_report
+
+log = logging.getLogger(__name__)
+
+WARMUP_PROMPT = "Generate a question about: mean"
+WARMUP_QUESTION = "What is the mean?"
+WARMUP_ANSWER = "The average value."
+
+
+class LoadedModel:
+    def __init__(self, name: str, model: Any, tokenizer: Any, checkpoint: Path, load_seconds: float):
+        self.name = name
+        self.model = model
+        self.tokenizer = tokenizer
+        self.checkpoint = checkpoint
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.warmup_seconds: Optional[float] = None
+
+    @property
+    def device(self) -> str:
+        return str(self.model.device)
+
+    @property
+    def param_bytes(self) -> int:
+        if hasattr(self.model, "model_bytes"):
+            return self.model.model_bytes
+        return sum(p.numel() * p.element_size() for p in self.model.parameters())
+
+    def state(self) -> Dict[str, Any]:
+        extra = {"early_exit": self.model.stats()} if hasattr(self.model, "exit_heads") else {}
+        return {
+            **extra,
+            "checkpoint": str(self.checkpoint),
+            "device": self.device,
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3),
+            "warmup_seconds": None if self.warmup_seconds is None else round(self.warmup_seconds, 3),
+            "param_mb": round(self.param_bytes / 2 ** 20, 1),
+        }
+
+
+class ModelRegistry:
+    def __init__(self):
+        self.qgen: Optional[LoadedModel] = None
+        self.grader: Optional[LoadedModel] = None
+        self.contexts: Mapping[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.model_root = "./models"
+        self.chunk_size = 64
+        self.reduction = "mean"
+        self.warmup_enabled = True
+        self.history_size = 5
+        self.cascade = None
+        self.encoding_cache = None
+        self.encoder_cache = None
+        self.compile_mode = "none"
+        self.buckets = (32, 64, 96, 128)
+        self.bucket_batch_sizes = (1, 8)
+        self.exit_threshold = None
+        self.pinned: Dict[str, Optional[str]] = {"qgen": None, "grader": None}
+        self.history: Dict[str, List[str]] = {"qgen": [], "grader": []}
+        self.on_swap: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+
+    def load(self, cfg: DictConfig) -> None:
+        sv = cfg.serving
+        with self._lock:
+            self.model_root = sv.model_root
+            self.chunk_size = sv.batching.chunk_size
+            self.reduction = sv.grader_reduction
+            self.warmup_enabled = sv.warmup
+            self.history_size = sv.watcher.history
+            self.compile_mode = sv.grader_compile.mode
+            self.buckets = tuple(sv.grader_compile.buckets)
+            self.bucket_batch_sizes = tuple(sv.grader_compile.warm_batch_sizes)
+            self.exit_threshold = sv.grader_exit_threshold
+            self.contexts = self._load_contexts(cfg)
+            self.cascade = self._load_cascade(sv)
+            if sv.encoding_cache.enabled and self.encoding_cache is None:
+                from answer_classifier.encoding_cache import PrefixEncodingCache
+
+                self.encoding_cache = PrefixEncodingCache(sv.encoding_cache.max_entries)
+            if sv.qgen_encoder_cache.enabled and self.encoder_cache is None:
+                from question_generator.encoder_cache import EncoderOutputCache
+
+                self.encoder_cache = EncoderOutputCache(sv.qgen_encoder_cache.max_mb)
+            self.qgen = self._load("qgen", sv.model_root, self._checkpoint(sv, "qgen"))
+            self.grader = self._load("grader", sv.model_root, self._checkpoint(sv, "grader"))
+            for loaded in (self.qgen, self.grader):
+                if loaded:
+                    self._publish(loaded)
+            if self.grader and sv.grader_backend == "onnx":
+                self.pinned["grader"] = str(self.grader.checkpoint)
+            if sv.warmup:
+                self.warmup()
+
+    @staticmethod
+    def _checkpoint(sv: DictConfig, name: str) -> Optional[str]:
+        checkpoint = sv.get(f"{name}_checkpoint")
+        if checkpoint:
+            return checkpoint
+        if name == "grader" and sv.grader_backend == "onnx":
+            return sv.onnx_dir
+        if sv.weights == "mmap":
+            return str(Path(sv.shared_weights_dir) / name)
+        return None
+
+    def _load_cascade(self, sv: DictConfig):
+        if not sv.cascade.enabled:
+            return None
+        from answer_classifier.cascade import Cascade
+
+        try:
+            return Cascade.load(sv.cascade.path)
+        except FileNotFoundError:
+            log.warning("Cascade enabled but %s is missing; run `commands.py calibrate_cascade`", sv.cascade.path)
+            return None
+
+    def _load_contexts(self, cfg: DictConfig) -> Mapping[str, str]:
+        from common.context_store import qa_context_store
+
+        return qa_context_store(cfg) if cfg.qa.use_context else {}
+
+    def _load(self, name: str, model_root: str, checkpoint: Optional[str]) -> Optional[LoadedModel]:
+        try:
+            loaded = self._load_model(name, model_root, checkpoint)
+        except (FileNotFoundError, ValueError) as e:
+            log.warning("Model %s not loaded: %s", name, e)
+            self.errors[name] = str(e)
+            return None
+
+        self.errors.pop(name, None)
+        return loaded
+
+    def _load_model(self, name: str, model_root: str, checkpoint: Optional[str]) -> LoadedModel:
+        if name == "qgen":
+            from question_generator.infer import load_qgen as loader
+        else:
+            from answer_classifier.infer import load_classifier as loader
+
+        start = time.perf_counter()
+        model, tokenizer, path = loader(checkpoint, model_root)
+        if name == "grader" and self.exit_threshold is not None and hasattr(model, "exit_heads"):
+            model.threshold = self.exit_threshold
+        if name == "grader" and self.compile_mode != "none":
+            from answer_classifier.compiled import compile_grader
+
+            model = compile_grader(model, tokenizer, self.compile_mode, self.buckets)
+        loaded = LoadedModel(name, model, tokenizer, path, time.perf_counter() - start)
+        log.info("Loaded %s from %s in %.2fs", name, path, loaded.load_seconds)
+        return loaded
+
+    def _publish(self, loaded: LoadedModel) -> None:
+        MODEL_INFO.set(1, model=loaded.name, device=loaded.device, checkpoint=str(loaded.checkpoint))
+
+    def warmup(self) -> None:
+        for loaded in (self.qgen, self.grader):
+            if loaded:
+                self._warm(loaded)
+
+    def _warm(self, loaded: LoadedModel) -> None:
+        start = time.perf_counter()
+        if loaded.name == "qgen":
+            self.infer_qgen(WARMUP_PROMPT, qgen=loaded)
+        else:
+            if hasattr(loaded.model, "warm_buckets"):
+                loaded.model.warm_buckets(self.bucket_batch_sizes)
+            self.infer_classifier(WARMUP_QUESTION, WARMUP_ANSWER, [WARMUP_ANSWER], grader=loaded, cascade=False)
+        loaded.warmup_seconds = time.perf_counter() - start
+
+    def swap(self, name: str, checkpoint: str, record: bool = True) -> LoadedModel:
+        with self._swap_lock:
+            loaded = self._load_model(name, self.model_root, checkpoint)
+            if self.warmup_enabled:
+                self._warm(loaded)
+
+            old = getattr(self, name)
+            setattr(self, name, loaded)
+            self.errors.pop(name, None)
+            if name == "qgen" and self.encoder_cache is not None:
+                self.encoder_cache.clear()
+            self._publish(loaded)
+
+            if old is not None:
+                MODEL_INFO.set(0, model=name, device=old.device, checkpoint=str(old.checkpoint))
+                if record:
+                    self.history[name] = (self.history[name] + [str(old.checkpoint)])[-self.history_size:]
+                del old
+                self._release()
+
+        log.info("Swapped %s to %s", name, loaded.checkpoint)
+        for callback in self.on_swap:
+            callback(name)
+        return loaded
+
+    @staticmethod
+    def _release() -> None:
+        import torch
+
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def pin(self, name: str, checkpoint: str) -> LoadedModel:
+        if not Path(checkpoint).exists():
+            raise FileNotFoundError(f"No such checkpoint: {checkpoint}")
+        current = getattr(self, name)
+        if current is None or Path(current.checkpoint).resolve() != Path(checkpoint).resolve():
+            current = self.swap(name, checkpoint)
+        self.pinned[name] = str(current.checkpoint)
+        return current
+
+    def unpin(self, name: str) -> None:
+        self.pinned[name] = None
+
+    def rollback(self, name: str) -> LoadedModel:
+        if not self.history[name]:
+            raise LookupError(f"No previous {name} checkpoint to roll back to")
+        loaded = self.swap(name, self.history[name][-1], record=False)
+        self.history[name].pop()
+        self.pinned[name] = str(loaded.checkpoint)
+        return loaded
+
+    def rollout_state(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "checkpoint": str(loaded.checkpoint) if loaded else None,
+                "loaded_at": loaded.loaded_at if loaded else None,
+                "pinned": self.pinned[name],
+                "history": list(self.history[name]),
+            }
+            for name, loaded in (("qgen", self.qgen), ("grader", self.grader))
+        }
+
+    def infer_qgen(self, prompt: str, cfg: DictConfig = None, qgen: Optional[LoadedModel] = None, **kwargs) -> Dict[str, Any]:
+        from question_generator.infer import infer_qgen
+
+        qgen = qgen or self.qgen
+        if qgen is None:
+            return infer_qgen(prompt, cfg=cfg, model_root=self.model_root, **kwargs)
+        return infer_qgen(
+            prompt,
+            checkpoint=str(qgen.checkpoint),
+            model=qgen.model,
+            tokenizer=qgen.tokenizer,
+            contexts=self.contexts,
+            encoder_cache=self.encoder_cache,
+            **kwargs,
+        )
+
+    def generate_batch(self, prompts: List[str], num_return_sequences: int = 1) -> List[Dict[str, Any]]:
+        from question_generator.infer import infer_qgen_batch
+
+        qgen = self.qgen
+        if qgen is None:
+            raise RuntimeError("Question generator is not loaded")
+        return infer_qgen_batch(
+            prompts,
+            checkpoint=str(qgen.checkpoint),
+            num_return_sequences=num_return_sequences,
+            model=qgen.model,
+            tokenizer=qgen.tokenizer,
+            contexts=self.contexts,
+            encoder_cache=self.encoder_cache,
+        )
+
+    def infer_classifier(
+        self,
+        question: str,
+        student_answer: str,
+        ref_answers=None,
+        grader: Optional[LoadedModel] = None,
+        cascade: bool = True,
+    ) -> Dict[str, Any]:
+        from answer_classifier.infer import infer_classifier
+
+        grader = grader or self.grader
+        cascade = self.cascade if cascade else None
+        if grader is None:
+            return infer_classifier(
+                question, student_answer, ref_answers, model_root=self.model_root, reduction=self.reduction,
+                cascade=cascade,
+                encoding_cache=self.encoding_cache,
+            )
+        return infer_classifier(
+            question,
+            student_answer,
+            ref_answers,
+            checkpoint=str(grader.checkpoint),
+            reduction=self.reduction,
+            model=grader.model,
+            tokenizer=grader.tokenizer,
+            cascade=cascade,
+            encoding_cache=self.encoding_cache,
+        )
+
+    def grade_batch(
+        self, items: List[Dict[str, Any]], reduction: Optional[str] = None, cascade: bool = True
+    ) -> List[Dict[str, Any]]:
+        from answer_classifier.infer import infer_classifier_batch
+
+        reduction = reduction or self.reduction
+        grader = self.grader
+        cascade = self.cascade if cascade else None
+        if grader is None:
+            return infer_classifier_batch(
+                items, model_root=self.model_root, reduction=reduction, chunk_size=self.chunk_size, cascade=cascade,
+                encoding_cache=self.encoding_cache,
+            )
+        return infer_classifier_batch(
+            items,
+            checkpoint=str(grader.checkpoint),
+            reduction=reduction,
+            chunk_size=self.chunk_size,
+            model=grader.model,
+            tokenizer=grader.tokenizer,
+            cascade=cascade,
+            encoding_cache=self.encoding_cache,
+        )
+
+    def grader_identity(self) -> str:
+        grader = self.grader
+        if grader is None:
+            return "unloaded"
+        return f"{grader.checkpoint}@{grader.loaded_at}"
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "status": "ok" if self.qgen and self.grader else "degraded",
+            "models": {
+                "qgen": self.qgen.state() if self.qgen else None,
+                "grader": self.grader.state() if self.grader else None,
+            },
+            "contexts": len(self.contexts),
+            "context_store": self.contexts.stats() if hasattr(self.contexts, "stats") else None,
+            "errors": dict(self.errors),
+            "cascade": self.cascade.stats() if self.cascade else None,
+            "encoding_cache": self.encoding_cache.stats() if self.encoding_cache else None,
+            "qgen_encoder_cache": self.encoder_cache.stats() if self.encoder_cache else None,
+            "memory": {"pid": os.getpid(), **memory_report()},
+        }
+
+
+registry = ModelRegistry()
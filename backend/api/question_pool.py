@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence
+
+from api.executor import ExecutorSaturated
+from common.metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+POOL_REQUESTS = REGISTRY.counter("question_pool_requests_total", "Pool lookups by result", ["result"])
+POOL_DEPTH = REGISTRY.gauge("question_pool_depth", "Questions buffered per topic", ["topic"])
+POOL_REFILLED = REGISTRY.counter("question_pool_refilled_total", "Questions generated by the refill worker")
+POOL_REFILL_SECONDS = REGISTRY.histogram("question_pool_refill_seconds", "Duration of one batched refill")
+
+GenerateFn = Callable[[List[str], int], List[Dict[str, Any]]]
+Runner = Callable[..., Awaitable[Any]]
+
+
+class QuestionPool:
+    def __init__(
+        self,
+        generate_fn: GenerateFn,
+        topics: Sequence[str],
+        prompt_template: str,
+        capacity: int = 8,
+        low_watermark: int = 2,
+        refill_per_topic: int = 4,
+        topics_per_refill: int = 16,
+        runner: Runner = asyncio.to_thread,
+    ):
+        self.generate_fn = generate_fn
+        self.runner = runner
+        self.prompt_template = prompt_template
+        self.capacity = capacity
+        self.low_watermark = low_watermark
+        self.refill_per_topic = refill_per_topic
+        self.topics_per_refill = topics_per_refill
+        self._buffers: Dict[str, Deque[Dict[str, Any]]] = {t: deque(maxlen=capacity) for t in topics}
+        self._hits = 0
+        self._misses = 0
+        self._refilled = 0
+        self._started_at: Optional[float] = None
+        self._generation = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def take(self, topic: str) -> Optional[Dict[str, Any]]:
+        buf = self._buffers.get(topic)
+        if not buf:
+            self._misses += 1
+            POOL_REQUESTS.inc(result="miss")
+            if buf is not None and self._wakeup:
+                self._wakeup.set()
+            return None
+
+        item = buf.popleft()
+        self._hits += 1
+        POOL_REQUESTS.inc(result="hit")
+        POOL_DEPTH.set(len(buf), topic=topic)
+        if len(buf) < self.low_watermark and self._wakeup:
+            self._wakeup.set()
+        return item
+
+    def clear(self) -> None:
+        # Model swaps call this from a worker thread; buffers and the wakeup event belong to the loop.
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is not None and running is not self._loop:
+            if not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._clear)
+            return
+        self._clear()
+
+    def _clear(self) -> None:
+        self._generation += 1
+        for topic, buf in self._buffers.items():
+            buf.clear()
+            POOL_DEPTH.set(0, topic=topic)
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        self._started_at = time.monotonic()
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _needy(self) -> List[str]:
+        low = [t for t, buf in self._buffers.items() if len(buf) < self.low_watermark]
+        return sorted(low, key=lambda t: len(self._buffers[t]))[: self.topics_per_refill]
+
+    async def _run(self) -> None:
+        while True:
+            topics = self._needy()
+            if not topics:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            prompts = [self.prompt_template.format(topic=t) for t in topics]
+            generation = self._generation
+            try:
+                with POOL_REFILL_SECONDS.time():
+                    results = await self.runner(self.generate_fn, prompts, self.refill_per_topic)
+            except ExecutorSaturated as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            except Exception:
+                log.exception("Question pool refill failed")
+                await asyncio.sleep(5)
+                continue
+
+            if generation != self._generation:
+                continue
+            for topic, result in zip(topics, results):
+                self._fill(topic, result)
+
+    def _fill(self, topic: str, result: Dict[str, Any]) -> None:
+        buf = self._buffers[topic]
+        for question in result["generated_questions"]:
+            if not question.strip():
+                continue
+            buf.append(
+                {
+                    "prompt": result["prompt"],
+                    "topic": result["topic"] or topic,
+                    "context": result["context"],
+                    "generated_question": question,
+                }
+            )
+            self._refilled += 1
+            POOL_REFILLED.inc()
+        POOL_DEPTH.set(len(buf), topic=topic)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        depths = [len(buf) for buf in self._buffers.values()]
+        return {
+            "running": self._task is not None,
+            "topics": len(self._buffers),
+            "buffered": sum(depths),
+            "empty_topics": sum(1 for d in depths if d == 0),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+            "refilled": self._refilled,
+            "refill_per_second": round(self._refilled / uptime, 3) if uptime else None,
+        }
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from common.metrics import REGISTRY, SIZE_BUCKETS
+
+log = logging.getLogger(__name__)
+
+REVIEW_WRITE_BATCH = REGISTRY.histogram(
+    "review_write_batch_size", "Review items committed per transaction", buckets=SIZE_BUCKETS
+)
+REVIEW_WRITE_SECONDS = REGISTRY.histogram("review_write_seconds", "Duration of a review write transaction")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    topic TEXT,
+    score INTEGER,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reviews_topic ON reviews (topic, created_at);
+CREATE INDEX IF NOT EXISTS idx_reviews_score ON reviews (score, created_at);
+CREATE INDEX IF NOT EXISTS idx_reviews_created_at ON reviews (created_at);
+"""
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def _row_fields(item: Dict[str, Any]) -> Tuple[Optional[str], Optional[int]]:
+    question = item.get("question") or {}
+    evaluation = item.get("evaluation") or {}
+    topic = question.get("topic") if isinstance(question, dict) else None
+    score = evaluation.get("score") if isinstance(evaluation, dict) else None
+    try:
+        score = int(score) if score is not None else None
+    except (TypeError, ValueError):
+        score = None
+    return topic, score
+
+
+class ReviewStore:
+    def __init__(self, db_path: str | Path, max_batch: int = 256, flush_interval_ms: float = 50.0):
+        self.db_path = Path(db_path)
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: "queue.Queue[Optional[Tuple[List[Dict[str, Any]], Future]]]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._stopping = False
+        self._submit_lock = threading.Lock()
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.Lock()
+
+    def start(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = _connect(self.db_path)
+        conn.executescript(SCHEMA)
+        conn.close()
+        self._read_conn = _connect(self.db_path)
+        self._stopping = False
+        self._writer = threading.Thread(target=self._write_loop, name="review-writer", daemon=True)
+        self._writer.start()
+
+    def stop(self) -> None:
+        with self._submit_lock:
+            self._stopping = True
+            writer = self._writer
+            if writer:
+                self._queue.put(None)
+        if writer:
+            writer.join()
+            self._writer = None
+        if self._read_conn:
+            self._read_conn.close()
+            self._read_conn = None
+
+    def submit(self, items: Sequence[Dict[str, Any]]) -> Future:
+        fut: Future = Future()
+        with self._submit_lock:
+            if self._writer is None or self._stopping:
+                raise RuntimeError("Review store is not running")
+            self._queue.put((list(items), fut))
+        return fut
+
+    def _drain(self, first) -> Tuple[List[Tuple[List[Dict[str, Any]], Future]], bool]:
+        pending, stopping = [first], False
+        size = len(first[0])
+        deadline = time.monotonic() + self.flush_interval
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if entry is None:
+                stopping = True
+                break
+            pending.append(entry)
+            size += len(entry[0])
+        return pending, stopping
+
+    def _write_loop(self) -> None:
+        conn = _connect(self.db_path)
+        try:
+            while True:
+                first = self._queue.get()
+                if first is None:
+                    return
+                pending, stopping = self._drain(first)
+                try:
+                    self._commit(conn, pending)
+                except Exception as e:
+                    log.exception("Review write failed")
+                    for _, fut in pending:
+                        if not fut.done():
+                            fut.set_exception(e)
+                if stopping:
+                    return
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, pending: List[Tuple[List[Dict[str, Any]], Future]]) -> None:
+        now = time.time()
+        rows, accepted = [], []
+        for items, fut in pending:
+            try:
+                encoded = [(now, *_row_fields(item), json.dumps(item, ensure_ascii=False)) for item in items]
+            except (TypeError, ValueError) as e:
+                fut.set_exception(e)
+                continue
+            rows.extend(encoded)
+            accepted.append((items, fut))
+
+        if rows:
+            with REVIEW_WRITE_SECONDS.time(), conn:
+                conn.executemany(
+                    "INSERT INTO reviews (created_at, topic, score, payload) VALUES (?, ?, ?, ?)", rows
+                )
+            REVIEW_WRITE_BATCH.observe(len(rows))
+        for items, fut in accepted:
+            fut.set_result(len(items))
+
+    def query(
+        self,
+        topic: Optional[str] = None,
+        min_score: Optional[int] = None,
+        max_score: Optional[int] = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        clauses, params = [], []
+        if topic is not None:
+            clauses.append("topic = ?")
+            params.append(topic)
+        if min_score is not None:
+            clauses.append("score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            clauses.append("score <= ?")
+            params.append(max_score)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with self._read_lock:
+            total = self._read_conn.execute(f"SELECT COUNT(*) FROM reviews {where}", params).fetchone()[0]
+            rows = self._read_conn.execute(
+                f"SELECT id, created_at, payload FROM reviews {where} "
+                "ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "items": [{"id": i, "created_at": ts, **json.loads(payload)} for i, ts, payload in rows],
+        }
+
+
+def export_jsonl(db_path: str | Path, out_path: str | Path) -> int:
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = _connect(Path(db_path))
+    count = 0
+    try:
+        with out_path.open("w", encoding="utf-8") as f:
+            for (payload,) in conn.execute("SELECT payload FROM reviews ORDER BY id"):
+                f.write(json.dumps(json.loads(payload)) + "\n")
+                count += 1
+    finally:
+        conn.close()
+    return count
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from common.metrics import REGISTRY, SIZE_BUCKETS
+
+log = logging.getLogger(__name__)
+
+ROOMS_ACTIVE = REGISTRY.gauge("rooms_active", "Multiplayer rooms with at least one connected player")
+ROUNDS_CLOSED = REGISTRY.counter("room_rounds_total", "Multiplayer rounds graded, by how they closed", ["reason"])
+ROUND_ANSWERS = REGISTRY.histogram(
+    "room_round_answers", "Answers graded together in one multiplayer round", buckets=SIZE_BUCKETS
+)
+ROUND_GRADE_SECONDS = REGISTRY.histogram("room_round_grade_seconds", "Time to grade all answers of a round")
+
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+GradeFn = Callable[[List[Dict[str, Any]]], Awaitable[List[Dict[str, Any]]]]
+
+
+class RoomError(Exception):
+    pass
+
+
+class Round:
+    def __init__(self, number: int, question: str, ref_answers: Sequence[str], players: Sequence[str], duration: float):
+        self.number = number
+        self.question = question
+        self.ref_answers = list(ref_answers)
+        self.expected = set(players)
+        self.answers: Dict[str, str] = {}
+        self.deadline = time.time() + duration
+        self.duration = duration
+        self.complete = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+
+    def check_complete(self) -> None:
+        if self.expected and self.expected <= set(self.answers):
+            self.complete.set()
+
+
+class Room:
+    def __init__(self, room_id: str):
+        self.id = room_id
+        self.players: Dict[str, Send] = {}
+        self.rounds = 0
+        self.round: Optional[Round] = None
+
+    async def broadcast(self, message: Dict[str, Any]) -> None:
+        sends = list(self.players.items())
+        results = await asyncio.gather(*[send(message) for _, send in sends], return_exceptions=True)
+        for (player_id, _), result in zip(sends, results):
+            if isinstance(result, Exception):
+                log.debug("Dropping message to %s in room %s: %s", player_id, self.id, result)
+
+
+class RoomManager:
+    def __init__(self, grade_fn: GradeFn, round_s: float = 30.0, max_round_s: float = 120.0, max_players: int = 16):
+        self.grade_fn = grade_fn
+        self.round_s = round_s
+        self.max_round_s = max_round_s
+        self.max_players = max_players
+        self._rooms: Dict[str, Room] = {}
+
+    async def join(self, room_id: str, player_id: str, send: Send) -> Room:
+        room = self._rooms.get(room_id)
+        if room is None:
+            room = self._rooms[room_id] = Room(room_id)
+            ROOMS_ACTIVE.set(len(self._rooms))
+        if player_id in room.players:
+            raise RoomError(f"Player {player_id} is already in room {room_id}")
+        if len(room.players) >= self.max_players:
+            raise RoomError(f"Room {room_id} is full")
+        room.players[player_id] = send
+        await room.broadcast({"type": "players", "players": sorted(room.players)})
+        return room
+
+    async def leave(self, room_id: str, player_id: str) -> None:
+        room = self._rooms.get(room_id)
+        if room is None or room.players.pop(player_id, None) is None:
+            return
+        if room.round:
+            room.round.expected.discard(player_id)
+            room.round.check_complete()
+        if not room.players:
+            if room.round and room.round.task:
+                room.round.task.cancel()
+            del self._rooms[room_id]
+            ROOMS_ACTIVE.set(len(self._rooms))
+            return
+        await room.broadcast({"type": "players", "players": sorted(room.players)})
+
+    async def handle(self, room_id: str, player_id: str, message: Dict[str, Any]) -> None:
+        room = self._rooms[room_id]
+        kind = message.get("type")
+        if kind == "round":
+            await self.start_round(room, message.get("question"), message.get("ref_answers"), message.get("duration_s"))
+        elif kind == "answer":
+            await self.answer(room, player_id, message.get("answer"))
+        else:
+            raise RoomError(f"Unknown message type: {kind}")
+
+    async def start_round(
+        self, room: Room, question: Optional[str], ref_answers: Optional[Sequence[str]], duration_s: Optional[float]
+    ) -> Round:
+        if room.round is not None:
+            raise RoomError("A round is already in progress")
+        if not isinstance(question, str) or not question.strip():
+            raise RoomError("Round needs a question")
+        if ref_answers is None:
+            ref_answers = []
+        if not isinstance(ref_answers, list) or not all(isinstance(ref, str) for ref in ref_answers):
+            raise RoomError("ref_answers must be a list of strings")
+        duration = self.round_s if duration_s is None else duration_s
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or not 0 < duration <= self.max_round_s:
+            raise RoomError(f"duration_s must be a number in (0, {self.max_round_s}]")
+
+        room.rounds += 1
+        rnd = room.round = Round(room.rounds, question, ref_answers, list(room.players), float(duration))
+        rnd.task = asyncio.create_task(self._close_round(room, rnd))
+        await room.broadcast(
+            {
+                "type": "round_started",
+                "round": rnd.number,
+                "question": rnd.question,
+                "players": sorted(rnd.expected),
+                "deadline": rnd.deadline,
+                "duration_s": rnd.duration,
+            }
+        )
+        return rnd
+
+    async def answer(self, room: Room, player_id: str, answer: Optional[str]) -> None:
+        rnd = room.round
+        if rnd is None:
+            raise RoomError("No round in progress")
+        if rnd.closed:
+            raise RoomError("Round is closed, answers are being graded")
+        if player_id not in rnd.expected:
+            raise RoomError("You joined after this round started")
+        if player_id in rnd.answers:
+            raise RoomError("Answer already submitted for this round")
+        rnd.answers[player_id] = answer if isinstance(answer, str) else ""
+        await room.broadcast(
+            {"type": "answered", "round": rnd.number, "player_id": player_id,
+             "answered": len(rnd.answers), "expected": len(rnd.expected)}
+        )
+        rnd.check_complete()
+
+    async def _close_round(self, room: Room, rnd: Round) -> None:
+        try:
+            await asyncio.wait_for(rnd.complete.wait(), rnd.duration)
+            reason = "all_answered"
+        except asyncio.TimeoutError:
+            reason = "deadline"
+
+        rnd.closed = True
+        players = sorted(rnd.answers)
+        items = [
+            {"question": rnd.question, "student_answer": rnd.answers[p], "ref_answers": rnd.ref_answers}
+            for p in players
+        ]
+        message: Dict[str, Any] = {"type": "scores", "round": rnd.number, "reason": reason}
+        try:
+            start = time.perf_counter()
+            results = await self.grade_fn(items) if items else []
+            ROUND_GRADE_SECONDS.observe(time.perf_counter() - start)
+            message["results"] = {
+                p: {
+                    "student_answer": r["student_answer"],
+                    "predicted_score": r["predicted_score"],
+                    "probabilities": r["probabilities"],
+                }
+                for p, r in zip(players, results)
+            }
+            message["missing"] = sorted(rnd.expected - set(players))
+        except Exception as e:
+            log.exception("Grading round %s in room %s failed", rnd.number, room.id)
+            message = {"type": "error", "round": rnd.number, "detail": f"Grading failed: {e}"}
+        finally:
+            room.round = None
+
+        ROUNDS_CLOSED.inc(reason=reason)
+        ROUND_ANSWERS.observe(len(items))
+        await room.broadcast(message)
+
+    def stats(self) -> Dict[str, Any]:
+        rooms = list(self._rooms.values())
+        return {
+            "rooms": len(rooms),
+            "players": sum(len(r.players) for r in rooms),
+            "rounds_in_progress": sum(1 for r in rooms if r.round),
+        }
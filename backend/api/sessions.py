@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from api.executor import DeadlineExceeded, ExecutorSaturated
+from common.metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+SESSIONS_ACTIVE = REGISTRY.gauge("game_sessions_active", "Game sessions currently held in memory")
+SESSIONS_CLOSED = REGISTRY.counter("game_sessions_closed_total", "Game sessions closed by reason", ["reason"])
+SESSION_NEXT = REGISTRY.counter(
+    "game_session_next_total", "Session questions served, by whether they were already prefetched", ["result"]
+)
+SESSION_NEXT_WAIT = REGISTRY.histogram("game_session_next_wait_seconds", "Time a next call waited for its question")
+
+GenerateFn = Callable[[List[str], int], List[Dict[str, Any]]]
+Runner = Callable[..., Awaitable[Any]]
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+class SessionFinished(Exception):
+    pass
+
+
+class SessionLimitReached(Exception):
+    pass
+
+
+class GameSession:
+    def __init__(self, plan: List[str]):
+        self.id = uuid.uuid4().hex
+        self.plan = plan
+        self.ready: asyncio.Queue = asyncio.Queue()
+        self.produced = 0
+        self.served = 0
+        self.created_at = time.time()
+        self.last_seen = time.monotonic()
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def total(self) -> int:
+        return len(self.plan)
+
+    @property
+    def remaining(self) -> int:
+        return self.total - self.served
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "total": self.total,
+            "served": self.served,
+            "remaining": self.remaining,
+            "prefetched": self.ready.qsize(),
+            "created_at": self.created_at,
+        }
+
+
+class SessionManager:
+    def __init__(
+        self,
+        generate_fn: GenerateFn,
+        prompt_template: str,
+        prefetch: int = 3,
+        ttl_s: float = 600.0,
+        max_sessions: int = 1000,
+        reap_interval_s: float = 30.0,
+        pool=None,
+        runner: Runner = asyncio.to_thread,
+    ):
+        self.generate_fn = generate_fn
+        self.prompt_template = prompt_template
+        self.prefetch = prefetch
+        self.ttl = ttl_s
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval_s
+        self.pool = pool
+        self.runner = runner
+        self._sessions: Dict[str, GameSession] = {}
+        self._reaper: Optional[asyncio.Task] = None
+
+    def create(self, topics: Sequence[str], count: int) -> GameSession:
+        if len(self._sessions) >= self.max_sessions:
+            raise SessionLimitReached(f"At most {self.max_sessions} active sessions")
+        session = GameSession([random.choice(list(topics)) for _ in range(count)])
+        session.task = asyncio.create_task(self._produce(session))
+        self._sessions[session.id] = session
+        SESSIONS_ACTIVE.set(len(self._sessions))
+        return session
+
+    def get(self, session_id: str) -> GameSession:
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise SessionNotFound(f"Unknown or expired session: {session_id}")
+        return session
+
+    async def next(self, session_id: str, deadline: Optional[float] = None) -> Dict[str, Any]:
+        session = self.get(session_id)
+        if session.served >= session.total:
+            raise SessionFinished(f"Session {session_id} has no questions left")
+        session.last_seen = time.monotonic()
+
+        start = time.perf_counter()
+        SESSION_NEXT.inc(result="ready" if not session.ready.empty() else "waited")
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            question = await asyncio.wait_for(session.ready.get(), timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("Question for this session is not ready yet") from None
+        SESSION_NEXT_WAIT.observe(time.perf_counter() - start)
+
+        session.served += 1
+        session.last_seen = time.monotonic()
+        session.wakeup.set()
+        return {**question, "index": session.served, "total": session.total, "remaining": session.remaining}
+
+    def close(self, session_id: str, reason: str = "closed") -> bool:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.closed = True
+        if session.task and not session.task.done():
+            session.task.cancel()
+        SESSIONS_CLOSED.inc(reason=reason)
+        SESSIONS_ACTIVE.set(len(self._sessions))
+        return True
+
+    async def _produce(self, session: GameSession) -> None:
+        while session.produced < session.total:
+            if session.ready.qsize() >= self.prefetch:
+                session.wakeup.clear()
+                await session.wakeup.wait()
+                continue
+
+            want = min(self.prefetch - session.ready.qsize(), session.total - session.produced)
+            topics = session.plan[session.produced: session.produced + want]
+            questions = [self.pool.take(t) if self.pool else None for t in topics]
+            missing = [i for i, q in enumerate(questions) if q is None]
+
+            if missing:
+                prompts = [self.prompt_template.format(topic=topics[i]) for i in missing]
+                try:
+                    results = await self.runner(self._generate, session, prompts)
+                except ExecutorSaturated as e:
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception:
+                    log.exception("Session %s prefetch failed", session.id)
+                    await asyncio.sleep(1)
+                    continue
+                for i, result in zip(missing, results):
+                    questions[i] = {
+                        "prompt": result["prompt"],
+                        "topic": result["topic"] or topics[i],
+                        "context": result["context"],
+                        "generated_question": result["generated_questions"][0],
+                    }
+
+            for question in questions:
+                session.ready.put_nowait(question)
+            session.produced += want
+
+    def _generate(self, session: GameSession, prompts: List[str]) -> List[Dict[str, Any]]:
+        # Runs on a worker thread, possibly after the session was closed while the job was queued.
+        if session.closed:
+            return []
+        return self.generate_fn(prompts, 1)
+
+    def reap(self) -> int:
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_seen > self.ttl]
+        for sid in expired:
+            session = self._sessions[sid]
+            self.close(sid, "finished" if session.remaining == 0 else "expired")
+        return len(expired)
+
+    async def _reap_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reap_interval)
+            self.reap()
+
+    async def start(self) -> None:
+        self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def stop(self) -> None:
+        if self._reaper:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for sid in list(self._sessions):
+            self.close(sid, "shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        sessions = list(self._sessions.values())
+        return {
+            "active": len(sessions),
+            "prefetched": sum(s.ready.qsize() for s in sessions),
+            "producing": sum(1 for s in sessions if s.task and not s.task.done()),
+        }
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from typing import Any, AsyncIterator, Dict
+
+from transformers import AsyncTextIteratorStreamer, StoppingCriteria, StoppingCriteriaList
+
+from common.metrics import REGISTRY
+
+STREAM_TTFT = REGISTRY.histogram("qgen_stream_ttft_seconds", "Time to first streamed token")
+STREAM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "qgen_stream_tokens_per_second",
+    "Decoding throughput of streamed generations",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+
+class CountingStreamer(AsyncTextIteratorStreamer):
+    def __init__(self, tokenizer, **decode_kwargs):
+        super().__init__(tokenizer, skip_prompt=True, **decode_kwargs)
+        self.tokens = 0
+
+    def put(self, value):
+        if not self.next_tokens_are_prompt:
+            self.tokens += value.numel()
+        super().put(value)
+
+
+class CancelOnDisconnect(StoppingCriteria):
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.cancelled.is_set()
+
+    def as_list(self) -> StoppingCriteriaList:
+        return StoppingCriteriaList([self])
+
+
+def sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_events(
+    generation: asyncio.Future,
+    streamer: CountingStreamer,
+    cancel: CancelOnDisconnect,
+    started: float,
+) -> AsyncIterator[str]:
+    def finish(fut: asyncio.Future) -> None:
+        if fut.cancelled() or fut.exception() is not None:
+            streamer.end()
+
+    generation.add_done_callback(finish)
+
+    first_token_at = None
+    try:
+        async for text in streamer:
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                STREAM_TTFT.observe(first_token_at - started)
+            yield sse("token", {"text": text})
+
+        try:
+            result = await generation
+        except Exception as e:
+            yield sse("error", {"detail": str(e)})
+            return
+
+        decode_seconds = time.perf_counter() - (first_token_at or started)
+        tokens_per_second = streamer.tokens / decode_seconds if decode_seconds > 0 else None
+        if tokens_per_second:
+            STREAM_TOKENS_PER_SECOND.observe(tokens_per_second)
+
+        yield sse(
+            "done",
+            {
+                "prompt": result["prompt"],
+                "topic": result["topic"],
+                "context": result["context"],
+                "generated_question": result["generated_question"],
+                "ttft_ms": None if first_token_at is None else round((first_token_at - started) * 1000, 1),
+                "tokens": streamer.tokens,
+                "tokens_per_second": None if tokens_per_second is None else round(tokens_per_second, 1),
+            },
+        )
+    finally:
+        cancel.cancelled.set()
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import fire
+
+from benchmarks.grader_refs import _timed
+
+
+def run(
+    checkpoint: Optional[str] = None,
+    mode: str = "trace",
+    buckets: str = "32,64,96,128",
+    batch_size: int = 16,
+    repeats: int = 30,
+    out: Optional[str] = None,
+):
+    import torch
+
+    from answer_classifier.compiled import CompiledGrader
+    from answer_classifier.infer import load_classifier
+
+    if checkpoint is None:
+        from benchmarks.stub_models import build_stub_workdir
+
+        workdir = build_stub_workdir(tempfile.mkdtemp(prefix="qa-bench-"), ["variance"])
+        checkpoint = str(workdir / "models" / "grader-stub.ckpt")
+
+    model, tokenizer, path = load_classifier(checkpoint)
+    widths = [int(b) for b in str(buckets).split(",")] if isinstance(buckets, str) else list(buckets)
+    compiled = CompiledGrader(model, tokenizer.pad_token_id, widths, mode)
+
+    start = time.perf_counter()
+    compiled.warm_buckets((1, batch_size))
+    warmup_s = time.perf_counter() - start
+
+    rows: List[Dict[str, Any]] = []
+    generator = torch.Generator().manual_seed(0)
+    for width in widths:
+        ids = torch.randint(5, model.config.vocab_size, (batch_size, width - 3), generator=generator)
+        inputs = {
+            "input_ids": torch.cat([torch.full((batch_size, 1), tokenizer.cls_token_id or 0), ids,
+                                    torch.full((batch_size, 2), tokenizer.sep_token_id or 0)], dim=1),
+        }
+        inputs["attention_mask"] = torch.ones_like(inputs["input_ids"])
+        inputs["token_type_ids"] = torch.zeros_like(inputs["input_ids"])
+
+        with torch.no_grad():
+            eager = _timed(lambda: model(**inputs), repeats)
+            fast = _timed(lambda: compiled(**inputs), repeats)
+            drift = float((model(**inputs).logits - compiled(**inputs).logits).abs().max())
+        rows.append({
+            "bucket": width,
+            "eager": {**eager, "pairs_per_s": round(batch_size / eager["p50_ms"] * 1000, 1)},
+            "compiled": {**fast, "pairs_per_s": round(batch_size / fast["p50_ms"] * 1000, 1)},
+            "speedup": round(eager["p50_ms"] / fast["p50_ms"], 2),
+            "max_abs_logit_diff": drift,
+        })
+
+    report = json.dumps(
+        {"checkpoint": str(path), "mode": mode, "batch_size": batch_size, "warmup_s": round(warmup_s, 2),
+         "threads": torch.get_num_threads(), "results": rows},
+        indent=2,
+    )
+    if out:
+        Path(out).write_text(report + "\n", encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import fire
+
+QUESTION = "What is the variance of a sample?"
+ANSWER = "The average squared distance from the mean."
+REFS = [
+    "The mean of squared deviations from the mean.",
+    "Average of squared differences between values and their mean.",
+    "A measure of spread equal to the squared standard deviation.",
+    "How far values are spread out from the average, squared.",
+]
+
+
+def per_ref_loop(model, tokenizer, question: str, student_answer: str, ref_answers: List[str]) -> int:
+    import torch
+
+    device = next(model.parameters()).device
+    stack = []
+    for ref in ref_answers:
+        toks = tokenizer(
+            f"{question} [SEP] {ref}", student_answer,
+            truncation=True, padding="max_length", max_length=128, return_tensors="pt",
+        ).to(device)
+        with torch.no_grad():
+            stack.append(model(**toks).logits[0])
+    return int(torch.stack(stack).mean(0).argmax())
+
+
+def _timed(fn, repeats: int) -> Dict[str, float]:
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3)}
+
+
+def run(
+    checkpoint: Optional[str] = None,
+    refs: str = "1,2,4,8,16",
+    repeats: int = 30,
+    reduction: str = "mean",
+    out: Optional[str] = None,
+):
+    from answer_classifier.infer import infer_classifier, load_classifier
+
+    if checkpoint is None:
+        from benchmarks.stub_models import build_stub_workdir
+
+        workdir = build_stub_workdir(tempfile.mkdtemp(prefix="qa-bench-"), ["variance"])
+        checkpoint = str(workdir / "models" / "grader-stub.ckpt")
+
+    model, tokenizer, path = load_classifier(checkpoint)
+    counts = [int(n) for n in str(refs).split(",")] if isinstance(refs, str) else list(refs)
+
+    rows: List[Dict[str, Any]] = []
+    for n in counts:
+        ref_answers = [REFS[i % len(REFS)] for i in range(n)]
+        before = _timed(lambda: per_ref_loop(model, tokenizer, QUESTION, ANSWER, ref_answers), repeats)
+        after = _timed(
+            lambda: infer_classifier(
+                QUESTION, ANSWER, ref_answers, checkpoint=str(path), reduction=reduction, model=model, tokenizer=tokenizer
+            ),
+            repeats,
+        )
+        rows.append({"refs": n, "per_ref_loop": before, "single_pass": after,
+                     "speedup": round(before["p50_ms"] / after["p50_ms"], 2)})
+
+    report = json.dumps({"checkpoint": str(path), "reduction": reduction, "results": rows}, indent=2)
+    if out:
+        Path(out).write_text(report + "\n", encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+import fire
+import httpx
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+DEFAULT_MIX = "generate=0.6,classify=0.3,review=0.1"
+ANSWER_WORDS = "the a is of value data sample test average mean median mode variance probability".split()
+
+Sample = Tuple[str, float, Union[int, str]]
+
+
+def parse_mix(mix: Union[str, Dict[str, float]]) -> Dict[str, float]:
+    if isinstance(mix, str):
+        mix = {k.strip(): float(v) for k, v in (part.split("=") for part in mix.split(",") if part.strip())}
+    unknown = set(mix) - set(ENDPOINTS)
+    if unknown:
+        raise ValueError(f"Unknown endpoints in mix: {sorted(unknown)}")
+    total = sum(mix.values())
+    return {k: round(v / total, 4) for k, v in mix.items() if v > 0}
+
+
+def _answer(rng: random.Random, answer_space: int) -> str:
+    words = random.Random(rng.randrange(answer_space)).choices(ANSWER_WORDS, k=6)
+    return " ".join(words)
+
+
+async def _generate(client: httpx.AsyncClient, rng: random.Random, topics: List[str], answer_space: int):
+    return await client.get("/v1/generate_question", params={"topic": rng.choice(topics)})
+
+
+async def _classify(client: httpx.AsyncClient, rng: random.Random, topics: List[str], answer_space: int):
+    topic = rng.choice(topics)
+    return await client.post(
+        "/v1/classify_answer",
+        json={
+            "question": f"What is the {topic}?",
+            "student_answer": _answer(rng, answer_space),
+            "ref_answers": [f"the {topic} is a value of the data", "the average value"],
+        },
+    )
+
+
+async def _review(client: httpx.AsyncClient, rng: random.Random, topics: List[str], answer_space: int):
+    topic = rng.choice(topics)
+    return await client.post(
+        "/v1/review_questions",
+        json={
+            "reviewed_items": [
+                {
+                    "question": {"topic": topic, "question": f"What is the {topic}?"},
+                    "userAnswer": _answer(rng, answer_space),
+                    "evaluation": {"score": rng.randrange(4)},
+                }
+            ]
+        },
+    )
+
+
+ENDPOINTS: Dict[str, Callable[..., Any]] = {"generate": _generate, "classify": _classify, "review": _review}
+
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def _summary(samples: List[Sample], elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(s[1] * 1000 for s in samples)
+    statuses = Counter(str(s[2]) for s in samples)
+    errors = sum(1 for s in samples if not (isinstance(s[2], int) and s[2] < 400))
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else None,
+        "status": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": _round(_percentile(latencies, 0.50)),
+            "p95": _round(_percentile(latencies, 0.95)),
+            "p99": _round(_percentile(latencies, 0.99)),
+            "mean": _round(sum(latencies) / len(latencies)) if latencies else None,
+            "max": _round(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
+
+
+def _topics() -> List[str]:
+    from omegaconf import OmegaConf
+
+    return list(OmegaConf.load(BACKEND / "conf" / "dataparser" / "dataparser.yaml").subtopics)
+
+
+@asynccontextmanager
+async def inprocess_client(workdir: Path) -> AsyncIterator[httpx.AsyncClient]:
+    os.chdir(workdir)
+    sys.path.insert(0, str(BACKEND))
+    from api.api import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(workdir: Path, port: int, workers: int) -> AsyncIterator[httpx.AsyncClient]:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(BACKEND), os.environ.get("PYTHONPATH")]))}
+    cmd = [sys.executable, "-m", "uvicorn", "api.api:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+            deadline = time.monotonic() + 300
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"uvicorn exited with code {proc.returncode}")
+                try:
+                    if (await client.get("/v1/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise TimeoutError("uvicorn did not become healthy")
+                await asyncio.sleep(0.5)
+            yield client
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    mix: Dict[str, float],
+    topics: List[str],
+    concurrency: int,
+    duration_s: float,
+    rps: Optional[float],
+    warmup_s: float,
+    answer_space: int,
+    seed: int,
+) -> Tuple[Dict[str, List[Sample]], float]:
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    samples: Dict[str, List[Sample]] = defaultdict(list)
+    start = time.perf_counter()
+    measure_from = start + warmup_s
+    stop_at = measure_from + duration_s
+
+    async def one(name: str, scheduled: float) -> None:
+        try:
+            response = await ENDPOINTS[name](client, rng, topics, answer_space)
+            outcome: Union[int, str] = response.status_code
+        except httpx.HTTPError as e:
+            outcome = type(e).__name__
+        if scheduled >= measure_from:
+            samples[name].append((name, time.perf_counter() - scheduled, outcome))
+
+    if rps:
+        sem = asyncio.Semaphore(concurrency)
+        pending = set()
+
+        async def limited(name: str, scheduled: float) -> None:
+            async with sem:
+                await one(name, scheduled)
+
+        interval, next_at = 1.0 / rps, start
+        while next_at < stop_at:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            task = asyncio.create_task(limited(rng.choices(names, weights)[0], next_at))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            next_at += interval
+        await asyncio.gather(*pending)
+    else:
+
+        async def worker() -> None:
+            while time.perf_counter() < stop_at:
+                await one(rng.choices(names, weights)[0], time.perf_counter())
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    return samples, max(time.perf_counter(), stop_at) - measure_from
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    mode: str = "inprocess",
+    mix: Union[str, Dict[str, float]] = DEFAULT_MIX,
+    concurrency: int = 8,
+    rps: Optional[float] = None,
+    duration: float = 20.0,
+    warmup: float = 3.0,
+    answer_space: int = 1000,
+    workdir: Optional[str] = None,
+    port: int = 8799,
+    workers: int = 1,
+    seed: int = 0,
+    out: Optional[str] = None,
+):
+    from benchmarks.stub_models import build_stub_workdir
+
+    mix = parse_mix(mix)
+    topics = _topics()
+    workdir = Path(workdir or tempfile.mkdtemp(prefix="qa-bench-"))
+    if not (workdir / "models").exists():
+        build_stub_workdir(workdir, topics, seed=seed)
+
+    async def main():
+        client_cm = inprocess_client(workdir) if mode == "inprocess" else uvicorn_client(workdir, port, workers)
+        async with client_cm as client:
+            return await drive(client, mix, topics, concurrency, duration, rps, warmup, answer_space, seed)
+
+    if mode not in ("inprocess", "uvicorn"):
+        raise ValueError(f"Unknown mode: {mode}")
+    samples, elapsed = asyncio.run(main())
+
+    report = {
+        "meta": {
+            "commit": _commit(),
+            "mode": mode,
+            "workers": workers if mode == "uvicorn" else 1,
+            "mix": mix,
+            "concurrency": concurrency,
+            "rps": rps,
+            "duration_s": duration,
+            "warmup_s": warmup,
+            "answer_space": answer_space,
+            "seed": seed,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "overall": _summary([s for v in samples.values() for s in v], elapsed),
+        "endpoints": {name: _summary(samples.get(name, []), elapsed) for name in mix},
+    }
+    text = json.dumps(report, indent=2)
+    if out:
+        Path(out).write_text(text + "\n", encoding="utf-8")
+    return text
+
+
+def compare(before: str, after: str):
+    a, b = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (before, after))
+    rows = {}
+    for scope in ["overall"] + sorted(set(a["endpoints"]) | set(b["endpoints"])):
+        x = a["overall"] if scope == "overall" else a["endpoints"].get(scope)
+        y = b["overall"] if scope == "overall" else b["endpoints"].get(scope)
+        if not x or not y:
+            continue
+        row = {}
+        for key in ("p50", "p95", "p99"):
+            old, new = x["latency_ms"][key], y["latency_ms"][key]
+            row[f"{key}_ms"] = [old, new, None if not old or new is None else f"{(new - old) / old:+.1%}"]
+        old, new = x["throughput_rps"], y["throughput_rps"]
+        row["throughput_rps"] = [old, new, None if not old or new is None else f"{(new - old) / old:+.1%}"]
+        row["error_rate"] = [x["error_rate"], y["error_rate"]]
+        rows[scope] = row
+    return json.dumps({"before": a["meta"]["commit"], "after": b["meta"]["commit"], "delta": rows}, indent=2)
+
+
+if __name__ == "__main__":
+    fire.Fire({"run": run, "compare": compare})
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import json
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import fire
+
+from benchmarks.grader_refs import QUESTION, REFS, _timed
+
+ANSWERS = [
+    "The average squared distance from the mean.",
+    "It shows how spread out the values are around the average.",
+    "Standard deviation squared, computed over the sample.",
+    "No idea, maybe the median?",
+]
+
+
+def run(
+    checkpoint: Optional[str] = None,
+    answers: str = "1,8,32",
+    repeats: int = 200,
+    max_length: int = 128,
+    out: Optional[str] = None,
+):
+    import torch
+
+    from answer_classifier.encoding_cache import PrefixEncodingCache
+    from answer_classifier.infer import load_classifier
+
+    if checkpoint is None:
+        from benchmarks.stub_models import build_stub_workdir
+
+        workdir = build_stub_workdir(tempfile.mkdtemp(prefix="qa-bench-"), ["variance"])
+        checkpoint = str(workdir / "models" / "grader-stub.ckpt")
+
+    _, tokenizer, path = load_classifier(checkpoint)
+    counts = [int(n) for n in str(answers).split(",")] if isinstance(answers, str) else list(answers)
+
+    rows: List[Dict[str, Any]] = []
+    for n in counts:
+        prompts = [f"{QUESTION} [SEP] {ref}" for _ in range(n) for ref in REFS]
+        students = [ANSWERS[i % len(ANSWERS)] for i in range(n) for _ in REFS]
+        cache = PrefixEncodingCache()
+
+        expected = tokenizer(prompts, students, truncation=True, padding=True, max_length=max_length, return_tensors="pt")
+        got = cache.encode(tokenizer, prompts, students, max_length)
+        identical = set(expected) == set(got) and all(torch.equal(expected[k], got[k]) for k in expected)
+
+        full = _timed(
+            lambda: tokenizer(prompts, students, truncation=True, padding=True, max_length=max_length, return_tensors="pt"),
+            repeats,
+        )
+        cached = _timed(lambda: cache.encode(tokenizer, prompts, students, max_length), repeats)
+        rows.append({"answers": n, "pairs": len(prompts), "identical": identical, "full": full, "cached": cached,
+                     "speedup": round(full["p50_ms"] / cached["p50_ms"], 2), "cache": cache.stats()})
+
+    report = json.dumps({"checkpoint": str(path), "results": rows}, indent=2)
+    if out:
+        Path(out).write_text(report + "\n", encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import json
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import fire
+
+from benchmarks.grader_refs import _timed
+
+TOPICS = ["variance", "mean", "median", "p-value", "standard deviation", "confidence interval", "regression", "bias"]
+
+
+def run(
+    checkpoint: Optional[str] = None,
+    batch_sizes: str = "1,4,8,16,32",
+    num_return_sequences: int = 1,
+    repeats: int = 10,
+    threads: Optional[int] = None,
+    encoder_cache: bool = False,
+    out: Optional[str] = None,
+):
+    import torch
+
+    from question_generator.encoder_cache import EncoderOutputCache
+    from question_generator.infer import infer_qgen, infer_qgen_batch, load_qgen, topic_prompts
+
+    if threads:
+        torch.set_num_threads(threads)
+    if checkpoint is None:
+        from benchmarks.stub_models import build_stub_workdir
+
+        workdir = build_stub_workdir(tempfile.mkdtemp(prefix="qa-bench-"), TOPICS)
+        checkpoint = str(workdir / "models" / "qgen-stub.ckpt")
+
+    model, tokenizer, path = load_qgen(checkpoint)
+    model.cpu()
+    sizes = [int(b) for b in str(batch_sizes).split(",")] if isinstance(batch_sizes, str) else list(batch_sizes)
+
+    cache = EncoderOutputCache() if encoder_cache else None
+    prompts = topic_prompts(TOPICS)
+    sequential = _timed(
+        lambda: [infer_qgen(p, model=model, tokenizer=tokenizer, use_context=False, encoder_cache=cache) for p in prompts],
+        repeats,
+    )
+    rows: List[Dict[str, Any]] = [{
+        "batch_size": "sequential",
+        **sequential,
+        "questions_per_s": round(len(prompts) / sequential["p50_ms"] * 1000, 1),
+    }]
+    for size in sizes:
+        batch = [prompts[i % len(prompts)] for i in range(size)]
+        timing = _timed(
+            lambda: infer_qgen_batch(
+                batch, model=model, tokenizer=tokenizer, use_context=False, num_return_sequences=num_return_sequences,
+                encoder_cache=cache,
+            ),
+            repeats,
+        )
+        questions = size * num_return_sequences
+        rows.append({
+            "batch_size": size,
+            **timing,
+            "questions_per_s": round(questions / timing["p50_ms"] * 1000, 1),
+        })
+
+    report = json.dumps(
+        {"checkpoint": str(path), "num_return_sequences": num_return_sequences, "threads": torch.get_num_threads(),
+         "results": rows, "encoder_cache": cache.stats() if cache else None},
+        indent=2,
+    )
+    if out:
+        Path(out).write_text(report + "\n", encoding="utf-8")
+    return report
+
+
+if __name__ == "__main__":
+    fire.Fire(run)
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+BASE_WORDS = (
+    "the a is of what how why generate question about answer value data sample test average "
+    "mean median mode variance probability distribution : ? . , [SEP]"
+).split()
+
+BERT_SPECIALS = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"]
+BART_SPECIALS = ["<pad>", "<unk>", "<s>", "</s>", "<mask>"]
+
+
+def _words(topics: Iterable[str]) -> List[str]:
+    words = list(BASE_WORDS)
+    for topic in topics:
+        words.extend(re.findall(r"\w+|[^\w\s]", topic.lower()))
+    return list(dict.fromkeys(words))
+
+
+def _tokenizer(specials: Sequence[str], words: Sequence[str], single: str, pair: str, cls: str, sep: str):
+    from tokenizers import Tokenizer, models, normalizers, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {t: i for i, t in enumerate(list(specials) + [w for w in words if w not in specials])}
+    tok = Tokenizer(models.WordLevel(vocab, unk_token=specials[1]))
+    tok.normalizer = normalizers.Lowercase()
+    tok.pre_tokenizer = pre_tokenizers.Whitespace()
+    tok.post_processor = processors.TemplateProcessing(
+        single=single, pair=pair, special_tokens=[(cls, vocab[cls]), (sep, vocab[sep])]
+    )
+    return PreTrainedTokenizerFast(
+        tokenizer_object=tok,
+        pad_token=specials[0],
+        unk_token=specials[1],
+        mask_token=specials[4],
+        **({"cls_token": cls, "sep_token": sep} if cls == "[CLS]" else {"bos_token": cls, "eos_token": sep}),
+    )
+
+
+def _save_ckpt(module, path: Path) -> None:
+    import pytorch_lightning as pl
+    import torch
+
+    torch.save(
+        {
+            "state_dict": module.state_dict(),
+            "hyper_parameters": dict(module.hparams),
+            "pytorch-lightning_version": pl.__version__,
+        },
+        path,
+    )
+
+
+def build_stub_workdir(root: str | Path, topics: Sequence[str], seed: int = 0) -> Path:
+    import torch
+    from transformers import BartConfig, BartForConditionalGeneration, BertConfig, BertForSequenceClassification
+
+    from answer_classifier.model import AnswerGrader
+    from question_generator.model import QuestionGenerator
+
+    root = Path(root).resolve()
+    models_dir, data_dir, hf_dir = root / "models", root / "data", root / "hf"
+    for d in (models_dir, data_dir, hf_dir):
+        d.mkdir(parents=True, exist_ok=True)
+
+    torch.manual_seed(seed)
+    words = _words(topics)
+
+    bert_tok = _tokenizer(BERT_SPECIALS, words, "[CLS] $A [SEP]", "[CLS] $A [SEP] $B:1 [SEP]:1", "[CLS]", "[SEP]")
+    bert = BertForSequenceClassification(
+        BertConfig(
+            vocab_size=len(bert_tok), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+            intermediate_size=64, max_position_embeddings=160, num_labels=4,
+        )
+    )
+    bert_tok.save_pretrained(hf_dir / "grader")
+    bert.save_pretrained(hf_dir / "grader")
+
+    bart_tok = _tokenizer(BART_SPECIALS, words, "<s> $A </s>", "<s> $A </s> $B </s>", "<s>", "</s>")
+    bart = BartForConditionalGeneration(
+        BartConfig(
+            vocab_size=len(bart_tok), d_model=32, encoder_layers=2, decoder_layers=2,
+            encoder_attention_heads=2, decoder_attention_heads=2, encoder_ffn_dim=64, decoder_ffn_dim=64,
+            max_position_embeddings=128, pad_token_id=0, bos_token_id=2, eos_token_id=3,
+            decoder_start_token_id=3, forced_bos_token_id=None,
+        )
+    )
+    bart_tok.save_pretrained(hf_dir / "qgen")
+    bart.save_pretrained(hf_dir / "qgen")
+
+    _save_ckpt(AnswerGrader(model_name=str(hf_dir / "grader")), models_dir / "grader-stub.ckpt")
+    _save_ckpt(QuestionGenerator(model_name=str(hf_dir / "qgen")), models_dir / "qgen-stub.ckpt")
+
+    with (data_dir / "context_data.jsonl").open("w", encoding="utf-8") as f:
+        for topic in topics:
+            f.write(json.dumps({"topic": topic, "context": f"the {topic} is a value of the data"}) + "\n")
+
+    return root
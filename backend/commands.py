@@ -2,25 +2,13 @@ from __future__ import annotations
 
 import os
 
-from dataparser.question_context import run_generate_concept_context
-
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 import json
+import time
 from typing import List, Optional, Union
 
 import fire
-from hydra import compose, initialize
-import mlflow
-
-from dataparser.generate_synthetic_data import run_generate_synthetic
-from dataparser.build_graded_dataset import run_build_graded
-
-from question_generator.train import train_qgen
-from question_generator.infer import infer_qgen
-
-from answer_classifier.train import train_classifier
-from answer_classifier.infer import infer_classifier
 
 
 def _parse_refs(arg: Union[str, List[str]]) -> List[str]:
@@ -35,24 +23,54 @@ def _parse_refs(arg: Union[str, List[str]]) -> List[str]:
 
 class CLI:
     def __init__(self, config_name: str = "config", config_path: str = "conf"):
-        with initialize(version_base=None, config_path=config_path):
-            self.cfg = compose(config_name=config_name)
-            if hasattr(self.cfg, 'base') and hasattr(self.cfg.base, 'tracking_uri'):
-                 mlflow.set_tracking_uri(self.cfg.base.tracking_uri)
-            else:
-                print("MLflow using default config.")
+        self._config_name = config_name
+        self._config_path = config_path
+        self._cfg = None
+
+    @property
+    def cfg(self):
+        if self._cfg is None:
+            from hydra import compose, initialize
+
+            with initialize(version_base=None, config_path=self._config_path):
+                self._cfg = compose(config_name=self._config_name)
+        return self._cfg
+
+    def _init_mlflow(self):
+        import mlflow
+
+        if hasattr(self.cfg, 'base') and hasattr(self.cfg.base, 'tracking_uri'):
+             mlflow.set_tracking_uri(self.cfg.base.tracking_uri)
+        else:
+            print("MLflow using default config.")
 
     def parse(self, questions: bool = False, context: bool = False):
         if questions:
+            from dataparser.generate_synthetic_data import run_generate_synthetic
+
             run_generate_synthetic(self.cfg)
         elif context:
+            from dataparser.question_context import run_generate_concept_context
+
             run_generate_concept_context(self.cfg)
         else:
+            from dataparser.build_graded_dataset import run_build_graded
+
             run_build_graded(self.cfg)
 
-    def train(self, questions: bool = False, grader: bool = False, resume: bool = False):
+    def train(self, questions: bool = False, grader: bool = False, resume: bool = False, distill: bool = False):
+        self._init_mlflow()
         if questions:
+            from question_generator.train import train_qgen
+
             return train_qgen(self.cfg, resume=resume)
+        if distill:
+            from answer_classifier.distill import train_distilled
+
+            return train_distilled(self.cfg, resume=resume)
+
+        from answer_classifier.train import train_classifier
+
         return train_classifier(self.cfg, resume=resume)
 
     def infer(
@@ -64,18 +82,219 @@ class CLI:
         student_answer: Optional[str] = None,
         ref_answers: Optional[str] = None,
         checkpoint: Optional[str] = None,
+        reduction: str = "mean",
     ):
         if questions:
             if prompt is None:
                 raise ValueError("--prompt required with --questions")
+            from question_generator.infer import infer_qgen
+
             return infer_qgen(prompt, self.cfg)
 
+        from answer_classifier.infer import infer_classifier
+
         if None in (question, student_answer):
             raise ValueError("--question, --student_answer required")
         if ref_answers:
             refs = _parse_refs(ref_answers)
-            return infer_classifier(question, student_answer, refs, checkpoint)
-        return infer_classifier(question, student_answer, checkpoint)
+            return infer_classifier(question, student_answer, refs, checkpoint, reduction=reduction)
+        return infer_classifier(question, student_answer, checkpoint=checkpoint, reduction=reduction)
+
+    def generate(
+        self,
+        topics: Optional[str] = None,
+        num_return_sequences: int = 1,
+        batch_size: int = 16,
+        checkpoint: Optional[str] = None,
+        out: Optional[str] = None,
+    ):
+        from common.context_store import qa_context_store
+        from question_generator.infer import infer_qgen_batch, load_qgen, topic_prompts
+
+        sv, qa = self.cfg.serving, self.cfg.qa
+        if topics is None:
+            topics = list(self.cfg.dataparser.subtopics)
+        elif isinstance(topics, str):
+            topics = [t.strip() for t in topics.split(",") if t.strip()]
+        else:
+            topics = list(topics)
+        model, tokenizer, path = load_qgen(checkpoint or sv.qgen_checkpoint, sv.model_root)
+        contexts = qa_context_store(self.cfg) if qa.use_context else {}
+
+        prompts = topic_prompts(topics)
+        results = []
+        start = time.perf_counter()
+        for i in range(0, len(prompts), batch_size):
+            results.extend(infer_qgen_batch(
+                prompts[i: i + batch_size],
+                checkpoint=str(path),
+                use_context=qa.use_context,
+                num_return_sequences=num_return_sequences,
+                model=model,
+                tokenizer=tokenizer,
+                contexts=contexts,
+            ))
+        elapsed = time.perf_counter() - start
+
+        rows = [
+            {"topic": r["topic"], "context": r["context"], "prompt": r["prompt"], "generated_question": q}
+            for r in results
+            for q in r["generated_questions"]
+        ]
+        if out is None:
+            return rows
+        with open(out, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        return {
+            "file": out,
+            "topics": len(topics),
+            "questions": len(rows),
+            "questions_per_s": round(len(rows) / elapsed, 1) if elapsed else None,
+            "checkpoint": str(path),
+        }
+
+    def export_reviews(self, out: Optional[str] = None):
+        from api.review_store import export_jsonl
+
+        rv = self.cfg.serving.reviews
+        out = out or rv.export_file
+        count = export_jsonl(rv.db_path, out)
+        return {"exported": count, "file": out}
+
+    def export_weights(self, out: Optional[str] = None):
+        from answer_classifier.infer import load_classifier
+        from common.shared_weights import export_shared
+        from question_generator.infer import load_qgen
+
+        sv = self.cfg.serving
+        out = out or sv.shared_weights_dir
+        exported = {}
+        for name, loader, checkpoint in (
+            ("qgen", load_qgen, sv.qgen_checkpoint),
+            ("grader", load_classifier, sv.grader_checkpoint),
+        ):
+            model, tokenizer, path = loader(checkpoint, sv.model_root)
+            exported[name] = str(export_shared(model.cpu(), tokenizer, os.path.join(out, name), str(path)))
+        return exported
+
+    def early_exit_report(
+        self,
+        checkpoint: Optional[str] = None,
+        thresholds: str = "0.5,0.6,0.7,0.8,0.9,0.95,0.99",
+        batch_size: int = 32,
+        out: Optional[str] = None,
+    ):
+        from answer_classifier.datamodule import GradedAnswerDM
+        from answer_classifier.early_exit import threshold_curve
+        from answer_classifier.infer import load_classifier
+
+        sv, cl = self.cfg.serving, self.cfg.classifier
+        model, tokenizer, path = load_classifier(checkpoint or sv.grader_checkpoint, sv.model_root)
+        if not hasattr(model, "exit_heads"):
+            raise ValueError(f"{path} is not an early-exit grader; train it with classifier.early_exit.enabled=true")
+
+        dm = GradedAnswerDM(
+            file_path=cl.data_file,
+            model_name=tokenizer.name_or_path,
+            use_ref_answers=cl.use_ref_answers,
+            val_split=cl.val_split,
+            seed=cl.seed,
+        )
+        dm.setup()
+        levels = [float(t) for t in str(thresholds).split(",")] if isinstance(thresholds, str) else list(thresholds)
+        report = {
+            "checkpoint": str(path),
+            "rows": len(dm.val_rows),
+            "num_layers": model.num_layers,
+            "curve": threshold_curve(model, tokenizer, dm.val_rows, cl.num_classes, levels, batch_size, cl.max_len),
+        }
+        if out:
+            with open(out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return report
+
+    def calibrate_cascade(
+        self,
+        checkpoint: Optional[str] = None,
+        out: Optional[str] = None,
+        target_precision: Optional[float] = None,
+        min_support: Optional[int] = None,
+        evaluate_model: bool = True,
+    ):
+        from answer_classifier.cascade import calibrate, evaluate
+        from answer_classifier.datamodule import heldout_split
+
+        sv, cl = self.cfg.serving, self.cfg.classifier
+        with open(cl.data_file, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        train_rows, val_rows = heldout_split(rows, cl.val_split, cl.seed)
+
+        cascade = calibrate(
+            train_rows,
+            cl.num_classes,
+            target_precision=target_precision or sv.cascade.target_precision,
+            min_support=min_support or sv.cascade.min_support,
+        )
+        model_scores = None
+        if evaluate_model and val_rows:
+            from answer_classifier.infer import infer_classifier_batch
+
+            graded = infer_classifier_batch(
+                val_rows, checkpoint or sv.grader_checkpoint, sv.model_root, reduction=sv.grader_reduction
+            )
+            model_scores = [r["predicted_score"] for r in graded]
+
+        cascade.calibration["validation"] = evaluate(cascade, val_rows, model_scores)
+        path = cascade.save(out or sv.cascade.path)
+        return {"path": str(path), "empty_score": cascade.empty_score, "verbatim": cascade.verbatim,
+                "unrelated": cascade.unrelated, **cascade.calibration}
+
+    def export_onnx(self, checkpoint: Optional[str] = None, out: Optional[str] = None, quantize: bool = False):
+        from answer_classifier.backends import export_onnx, quantize_onnx
+        from answer_classifier.infer import load_classifier
+
+        sv = self.cfg.serving
+        out = out or sv.onnx_dir
+        model, tokenizer, path = load_classifier(checkpoint or sv.grader_checkpoint, sv.model_root)
+        exported = {"onnx": str(export_onnx(model, tokenizer, out, str(path)))}
+        if quantize:
+            exported["onnx_int8"] = str(quantize_onnx(out, f"{out.rstrip('/')}-int8"))
+        return exported
+
+    def onnx_parity(
+        self,
+        onnx_dir: Optional[str] = None,
+        checkpoint: Optional[str] = None,
+        batch_size: int = 32,
+        out: Optional[str] = None,
+    ):
+        from answer_classifier.backends import load_onnx, parity_report
+        from answer_classifier.datamodule import GradedAnswerDM
+        from answer_classifier.infer import load_classifier
+
+        sv, cl = self.cfg.serving, self.cfg.classifier
+        onnx_dir = onnx_dir or sv.onnx_dir
+        torch_model, _, path = load_classifier(checkpoint or sv.grader_checkpoint, sv.model_root)
+        onnx_model, tokenizer = load_onnx(onnx_dir)
+
+        dm = GradedAnswerDM(
+            file_path=cl.data_file,
+            model_name=onnx_dir,
+            use_ref_answers=cl.use_ref_answers,
+            val_split=cl.val_split,
+            seed=cl.seed,
+        )
+        dm.setup()
+        report = {
+            "checkpoint": str(path),
+            "onnx_dir": str(onnx_dir),
+            **parity_report(torch_model, onnx_model, tokenizer, dm.val_rows, cl.num_classes, batch_size, cl.max_len),
+        }
+        if out:
+            with open(out, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return report
 
 
 if __name__ == "__main__":
@@ -0,0 +1,220 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Tuple
+
+log = logging.getLogger(__name__)
+
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+HEAD_BYTES = 4096
+DUPLICATE_POLICIES = ("last", "first")
+
+
+class ContextStore(Mapping[str, str]):
+    def __init__(
+        self,
+        path: str | Path,
+        hot_entries: int = 256,
+        duplicates: str = "last",
+        reload_interval: float = 1.0,
+    ):
+        if duplicates not in DUPLICATE_POLICIES:
+            raise ValueError(f"Unknown duplicate policy {duplicates!r}, expected one of {DUPLICATE_POLICIES}")
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + INDEX_SUFFIX)
+        self.hot_entries = hot_entries
+        self.duplicates = duplicates
+        self.reload_interval = reload_interval
+
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._hot: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._head = ""
+        self._duplicate_lines = 0
+        self._checked = float("-inf")
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+        self._load_index()
+        self.refresh(force=True)
+
+    def _digest(self, length: int) -> str:
+        with self.path.open("rb") as f:
+            return hashlib.sha1(f.read(length)).hexdigest()
+
+    def _reset(self) -> None:
+        self._offsets.clear()
+        self._hot.clear()
+        self._size = 0
+        self._head = ""
+        self._duplicate_lines = 0
+
+    def _load_index(self) -> None:
+        try:
+            data = json.loads(self.index_path.read_text(encoding="utf-8"))
+            size = self.path.stat().st_size
+        except (OSError, ValueError):
+            return
+        if (
+            data.get("version") != INDEX_VERSION
+            or data.get("duplicates") != self.duplicates
+            or data.get("size", 0) > size
+            or data.get("head") != self._digest(min(data.get("size", 0), HEAD_BYTES))
+        ):
+            log.info("Context index %s is stale; rebuilding", self.index_path)
+            return
+        self._offsets = {topic: (offset, length) for topic, (offset, length) in data["offsets"].items()}
+        self._size = data["size"]
+        self._head = data["head"]
+        self._duplicate_lines = data.get("duplicate_lines", 0)
+
+    def _save_index(self) -> None:
+        data = {
+            "version": INDEX_VERSION,
+            "duplicates": self.duplicates,
+            "size": self._size,
+            "head": self._head,
+            "duplicate_lines": self._duplicate_lines,
+            "offsets": self._offsets,
+        }
+        tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+        try:
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+        except OSError as e:
+            log.warning("Context index %s not saved: %s", self.index_path, e)
+
+    def _scan(self, start: int) -> int:
+        added = 0
+        offset = start
+        with self.path.open("rb") as f:
+            f.seek(start)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    topic, _ = entry["topic"], entry["context"]
+                except (ValueError, KeyError, TypeError):
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+                    continue
+
+                if topic in self._offsets:
+                    self._duplicate_lines += 1
+                    log.warning(
+                        "Duplicate context for topic %r at byte %d of %s; keeping the %s one",
+                        topic, offset, self.path, self.duplicates,
+                    )
+                    if self.duplicates == "first":
+                        offset += len(line)
+                        continue
+                    self._hot.pop(topic, None)
+                else:
+                    added += 1
+                self._offsets[topic] = (offset, len(line))
+                offset += len(line)
+
+        self._size = offset
+        if start < HEAD_BYTES:
+            self._head = self._digest(min(self._size, HEAD_BYTES))
+        return added
+
+    def refresh(self, force: bool = False) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._checked < self.reload_interval:
+                return False
+            self._checked = now
+
+            try:
+                size = self.path.stat().st_size
+            except FileNotFoundError:
+                if self._offsets:
+                    log.warning("Context file %s disappeared", self.path)
+                    self._reset()
+                return False
+            if size == self._size:
+                return False
+            if size < self._size or self._size and self._digest(min(self._size, HEAD_BYTES)) != self._head:
+                log.info("Context file %s was rewritten; reindexing", self.path)
+                self._reset()
+
+            start = self._size
+            added = self._scan(start)
+            if self._size != start:
+                self._save_index()
+                log.info("Indexed %d new topics from %s (%d total)", added, self.path, len(self._offsets))
+            return True
+
+    def __getitem__(self, topic: str) -> str:
+        with self._lock:
+            self.refresh()
+            context = self._hot.get(topic)
+            if context is not None:
+                self._hot.move_to_end(topic)
+                self.hits += 1
+                return context
+
+            offset, length = self._offsets[topic]
+            with self.path.open("rb") as f:
+                f.seek(offset)
+                context = json.loads(f.read(length))["context"]
+            self.misses += 1
+            self._hot[topic] = context
+            while len(self._hot) > self.hot_entries:
+                self._hot.popitem(last=False)
+            return context
+
+    def __contains__(self, topic: object) -> bool:
+        with self._lock:
+            self.refresh()
+            return topic in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            self.refresh()
+            return iter(list(self._offsets))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self.refresh()
+            return len(self._offsets)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "path": str(self.path),
+                "topics": len(self._offsets),
+                "indexed_bytes": self._size,
+                "duplicate_lines": self._duplicate_lines,
+                "duplicates": self.duplicates,
+                "hot": len(self._hot),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_STORES: Dict[Path, ContextStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def open_context_store(path: str | Path, **options) -> ContextStore:
+    key = Path(path).resolve()
+    with _STORES_LOCK:
+        store = _STORES.get(key)
+        if store is None:
+            store = _STORES[key] = ContextStore(path, **options)
+        return store
+
+
+def qa_context_store(cfg) -> ContextStore:
+    return open_context_store(cfg.base.ctx_file, **cfg.qa.context_store)
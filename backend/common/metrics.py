@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _label_str(labelnames: Tuple[str, ...], key: Tuple[str, ...]) -> str:
+    return ",".join(f"{n}={v}" for n, v in zip(labelnames, key))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_block(pairs: Sequence[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {_label_str(self.labelnames, k): v for k, v in self._values.items()}
+
+    def _samples(self) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        with self._lock:
+            return [(self.name, list(zip(self.labelnames, k)), v) for k, v in self._values.items()]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self._samples():
+            lines.append(f"{name}{_label_block(labels)} {_number(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class _HistogramState:
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = _HistogramState(len(self.buckets))
+            state.counts[bisect.bisect_left(self.buckets, value)] += 1
+            state.sum += value
+            state.count += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _quantile(self, state: _HistogramState, q: float) -> Optional[float]:
+        if not state.count:
+            return None
+        rank = q * state.count
+        seen = 0
+        for i, c in enumerate(state.counts):
+            seen += c
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def _samples(self) -> List[Tuple[str, List[Tuple[str, str]], float]]:
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                labels = list(zip(self.labelnames, key))
+                running = 0
+                for le, c in zip(self.buckets, state.counts):
+                    running += c
+                    samples.append((f"{self.name}_bucket", labels + [("le", _number(le))], running))
+                samples.append((f"{self.name}_bucket", labels + [("le", "+Inf")], state.count))
+                samples.append((f"{self.name}_sum", labels, state.sum))
+                samples.append((f"{self.name}_count", labels, state.count))
+        return samples
+
+    def snapshot(self) -> Dict[str, Any]:
+        out = {}
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative, running = {}, 0
+                for le, c in zip(self.buckets, state.counts):
+                    running += c
+                    cumulative[str(le)] = running
+                cumulative["+Inf"] = state.count
+                out[_label_str(self.labelnames, key)] = {
+                    "count": state.count,
+                    "sum": round(state.sum, 6),
+                    "buckets": cumulative,
+                    "p50": self._quantile(state, 0.5),
+                    "p95": self._quantile(state, 0.95),
+                    "p99": self._quantile(state, 0.99),
+                }
+        return out
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, doc: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, doc, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as {metric.kind}")
+            return metric
+
+    def counter(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, doc, labelnames)
+
+    def gauge(self, name: str, doc: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, doc, labelnames)
+
+    def histogram(
+        self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, doc, labelnames, buckets=buckets)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+INFERENCE_STAGE = REGISTRY.histogram(
+    "inference_stage_seconds", "Time spent per inference stage", ["model", "stage"]
+)
+INFERENCE_BATCH = REGISTRY.histogram(
+    "inference_batch_size", "Sequences per model call", ["model"], buckets=SIZE_BUCKETS
+)
+INFERENCE_TOKENS = REGISTRY.counter("inference_tokens_total", "Tokens fed to and produced by models", ["model", "direction"])
+MODEL_INFO = REGISTRY.gauge("model_info", "Loaded serving model", ["model", "device", "checkpoint"])
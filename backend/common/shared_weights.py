@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+WEIGHTS_FILE = "weights.pt"
+SOURCE_FILE = "source.json"
+
+_SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def is_shared_dir(path: str | Path) -> bool:
+    return (Path(path) / WEIGHTS_FILE).is_file()
+
+
+def export_shared(model, tokenizer, out_dir: str | Path, source: Optional[str] = None) -> Path:
+    import torch
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    model.config.save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+
+    state = {k: v.detach().cpu().contiguous() for k, v in model.state_dict().items()}
+    tmp = out_dir / f"{WEIGHTS_FILE}.tmp"
+    torch.save(state, tmp)
+    tmp.replace(out_dir / WEIGHTS_FILE)
+
+    (out_dir / SOURCE_FILE).write_text(json.dumps({"checkpoint": source}), encoding="utf-8")
+    return out_dir
+
+
+def load_shared(path: str | Path, auto_cls) -> Tuple[Any, Any]:
+    import torch
+    from transformers import AutoConfig, AutoTokenizer
+
+    path = Path(path)
+    model = auto_cls.from_config(AutoConfig.from_pretrained(path))
+    state = torch.load(path / WEIGHTS_FILE, map_location="cpu", mmap=True, weights_only=True)
+    model.load_state_dict(state, assign=True)
+    model.requires_grad_(False)
+    return model.eval(), AutoTokenizer.from_pretrained(path)
+
+
+def _parse_smaps(lines) -> Dict[str, int]:
+    totals = dict.fromkeys(_SMAPS_FIELDS, 0)
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in totals:
+            totals[key] += int(rest.split()[0])
+    return totals
+
+
+def memory_report() -> Dict[str, Any]:
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            totals = _parse_smaps(f)
+    except OSError:
+        return {}
+
+    weights = dict.fromkeys(_SMAPS_FIELDS, 0)
+    try:
+        with open("/proc/self/smaps") as f:
+            in_weights = False
+            for line in f:
+                first = line.split(maxsplit=1)[0]
+                if "-" in first and not first.endswith(":"):
+                    in_weights = line.rstrip().endswith(WEIGHTS_FILE)
+                elif in_weights:
+                    for key, value in _parse_smaps([line]).items():
+                        weights[key] += value
+    except OSError:
+        pass
+
+    mb = lambda kb: round(kb / 1024, 1)
+    return {
+        "rss_mb": mb(totals["Rss"]),
+        "pss_mb": mb(totals["Pss"]),
+        "unique_mb": mb(totals["Private_Clean"] + totals["Private_Dirty"]),
+        "shared_mb": mb(totals["Shared_Clean"] + totals["Shared_Dirty"]),
+        "mapped_weights": {
+            "rss_mb": mb(weights["Rss"]),
+            "shared_mb": mb(weights["Shared_Clean"] + weights["Shared_Dirty"]),
+            "unique_mb": mb(weights["Private_Clean"] + weights["Private_Dirty"]),
+        },
+    }
@@ -1,6 +1,5 @@
 from torchmetrics import Metric
 import torch
-from bert_score import score as bert_score
 
 
 class BERTScoreMetric(Metric):
@@ -13,6 +12,8 @@ class BERTScoreMetric(Metric):
         self.add_state("f1_scores", default=[], dist_reduce_fx="cat")
 
     def update(self, preds: list[str], targets: list[str]):
+        from bert_score import score as bert_score
+
         P, R, F1 = bert_score(preds, targets, lang=self.lang, model_type=self.model_type, verbose=False)
         f1_tensor = F1.to(torch.float32).to(self.device)
         self.f1_scores.append(f1_tensor)
@@ -2,14 +2,14 @@ from __future__ import annotations
 
 import json, random, re, os
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Mapping, Optional
 
 import pytorch_lightning as pl
 import torch
 from torch.utils.data import DataLoader
 from transformers import AutoTokenizer
 
-from common.context_provider import load_qa_contexts
+from common.context_store import ContextStore, open_context_store
 
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
@@ -31,6 +31,7 @@ class QuestionDataModule(pl.LightningDataModule):
         num_workers: int = 4,
         val_split: float = 0.1,
         seed: int = 42,
+        context_store: Optional[ContextStore] = None,
     ):
         super().__init__()
         self.file_path = Path(file_path)
@@ -44,13 +45,14 @@ class QuestionDataModule(pl.LightningDataModule):
         self.tokenizer = AutoTokenizer.from_pretrained(model_name, legacy=True)
         self.train_rows: List[Dict] = []
         self.val_rows: List[Dict] = []
-        self.contexts: Dict[str, str] = {}
+        self.context_store = context_store
+        self.contexts: Mapping[str, str] = {}
 
     def setup(self, stage: Optional[str] = None):
         rows = [json.loads(l) for l in self.file_path.open()]
 
         if self.use_context:
-            self.contexts = load_qa_contexts(self.context_file_path)
+            self.contexts = self.context_store if self.context_store is not None else open_context_store(self.context_file_path)
 
         processed_rows = []
         for row in rows:
@@ -63,7 +65,8 @@ class QuestionDataModule(pl.LightningDataModule):
                     topic = match.group(2).strip()
 
                 context = self.contexts.get(topic)
-                row['input'] = f"{original_input} [SEP] {context}" if self.use_context else original_input,
+                if context:
+                    row['input'] = f"{original_input} [SEP] {context}"
 
             processed_rows.append(row)
 
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+from common.metrics import REGISTRY
+
+ENCODER_CACHE = REGISTRY.counter(
+    "qgen_encoder_cache_total", "Question generator encoder outputs served from cache or computed", ["result"]
+)
+ENCODER_SAVED = REGISTRY.counter(
+    "qgen_encoder_cache_saved_seconds_total", "Estimated encoder time saved by encoder output cache hits"
+)
+ENCODER_BYTES = REGISTRY.gauge("qgen_encoder_cache_bytes", "Memory held by cached encoder outputs")
+
+
+class EncoderOutputCache:
+    def __init__(self, max_mb: float = 64):
+        self.max_bytes = int(max_mb * 2 ** 20)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[torch.Tensor, float]]" = OrderedDict()
+        self._bytes = 0
+        self._counts = {"hit": 0, "miss": 0, "evicted": 0}
+        self._saved = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(hidden: torch.Tensor) -> int:
+        return hidden.numel() * hidden.element_size()
+
+    def _store(self, key: Tuple[str, str], hidden: torch.Tensor, cost: float) -> None:
+        size = self._size(hidden)
+        if size > self.max_bytes or key in self._entries:
+            return
+        self._entries[key] = (hidden, cost)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (old, _) = self._entries.popitem(last=False)
+            self._bytes -= self._size(old)
+            self._counts["evicted"] += 1
+
+    def encode(self, model, tokenizer, texts: Sequence[str], checkpoint: str) -> Tuple[BaseModelOutput, torch.Tensor]:
+        found: Dict[str, torch.Tensor] = {}
+        saved, hits = 0.0, 0
+        with self._lock:
+            for text in texts:
+                entry = self._entries.get((checkpoint, text))
+                if entry is not None:
+                    self._entries.move_to_end((checkpoint, text))
+                    found[text] = entry[0]
+                    saved += entry[1]
+                    hits += 1
+
+        missing = list(dict.fromkeys(t for t in texts if t not in found))
+        if missing:
+            device = next(model.parameters()).device
+            enc = tokenizer(missing, return_tensors="pt", padding=True, padding_side="right").to(device)
+            start = time.perf_counter()
+            with torch.no_grad():
+                hidden = model.get_encoder()(input_ids=enc.input_ids, attention_mask=enc.attention_mask).last_hidden_state
+            cost = (time.perf_counter() - start) / len(missing)
+            saved += cost * (len(texts) - hits - len(missing))
+            lengths = enc.attention_mask.sum(-1).tolist()
+            with self._lock:
+                for text, row, length in zip(missing, hidden, lengths):
+                    found[text] = row[:length].clone()
+                    self._store((checkpoint, text), found[text], cost)
+
+        hits = len(texts) - len(missing)
+        with self._lock:
+            self._counts["hit"] += hits
+            self._counts["miss"] += len(missing)
+            self._saved += saved
+            size = self._bytes
+        ENCODER_CACHE.inc(hits, result="hit")
+        ENCODER_CACHE.inc(len(missing), result="miss")
+        ENCODER_SAVED.inc(saved)
+        ENCODER_BYTES.set(size)
+        return self._stack([found[t] for t in texts])
+
+    @staticmethod
+    def _stack(rows: List[torch.Tensor]) -> Tuple[BaseModelOutput, torch.Tensor]:
+        width = max(len(row) for row in rows)
+        hidden = rows[0].new_zeros(len(rows), width, rows[0].shape[-1])
+        mask = torch.zeros(len(rows), width, dtype=torch.long, device=rows[0].device)
+        for i, row in enumerate(rows):
+            hidden[i, :len(row)] = row
+            mask[i, :len(row)] = 1
+        return BaseModelOutput(last_hidden_state=hidden), mask
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        ENCODER_BYTES.set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, saved, entries, size = dict(self._counts), self._saved, len(self._entries), self._bytes
+        lookups = counts["hit"] + counts["miss"]
+        return {
+            "entries": entries,
+            **counts,
+            "hit_ratio": round(counts["hit"] / lookups, 4) if lookups else None,
+            "saved_seconds": round(saved, 4),
+            "memory_mb": round(size / 2 ** 20, 3),
+            "max_mb": round(self.max_bytes / 2 ** 20, 1),
+        }
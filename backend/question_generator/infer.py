@@ -2,14 +2,25 @@ from __future__ import annotations
 
 import re
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
 
 import torch
 from omegaconf import DictConfig
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
 
-from question_generator.model import QuestionGenerator
-from common.context_provider import load_qa_contexts
+from question_generator.encoder_cache import EncoderOutputCache
+from question_generator.prompts import QUESTION_PROMPT
+from common.context_store import qa_context_store
+from common.metrics import INFERENCE_BATCH, INFERENCE_STAGE, INFERENCE_TOKENS
+from common.shared_weights import is_shared_dir, load_shared
+
+GENERATION_KWARGS = dict(
+    max_new_tokens=16,
+    do_sample=True,
+    temperature=0.5,
+    top_p=0.9,
+)
 
 
 def _latest_artifact(root: str | Path) -> Path:
@@ -22,34 +33,50 @@ def _latest_artifact(root: str | Path) -> Path:
 
 def _load_model(path: str | Path) -> AutoModelForSeq2SeqLM:
     path = Path(path)
+    if is_shared_dir(path):
+        return load_shared(path, AutoModelForSeq2SeqLM)[0]
     if path.suffix == ".ckpt":
+        from question_generator.model import QuestionGenerator
+
         lm: QuestionGenerator = QuestionGenerator.load_from_checkpoint(path, strict=False)
         return lm.model
     raise ValueError(f"Unsupported checkpoint path: {path}")
 
 
-def infer_qgen(
-    prompt: str,
-    cfg: DictConfig = None,
+def _load_tokenizer(model: AutoModelForSeq2SeqLM):
+    tok_name = (
+        getattr(model, "hparams", None) and getattr(model.hparams, "model_name", None)
+    ) or model.config._name_or_path
+    return AutoTokenizer.from_pretrained(tok_name, legacy=True if "t5" in tok_name.lower() else False)
+
+
+def load_qgen(
     checkpoint: Optional[str] = None,
     model_root: str = "./models",
-    use_context: bool = True,
-) -> Dict[str, str]:
-    ckpt = Path(checkpoint) if checkpoint else _latest_artifact(model_root)
-    model = _load_model(ckpt)
+) -> Tuple[AutoModelForSeq2SeqLM, AutoTokenizer, Path]:
+    with INFERENCE_STAGE.time(model="qgen", stage="discover"):
+        ckpt = Path(checkpoint) if checkpoint else _latest_artifact(model_root)
 
-    contexts: Dict[str, str] = {}
-    if use_context and cfg:
-        contexts = load_qa_contexts(cfg.base.ctx_file)
+    with INFERENCE_STAGE.time(model="qgen", stage="load"):
+        model = _load_model(ckpt)
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model.to(device).eval()
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model.to(device).eval()
 
-    tok_name = (
-        getattr(model, "hparams", None) and getattr(model.hparams, "model_name", None)
-    ) or model.config._name_or_path
-    tok = AutoTokenizer.from_pretrained(tok_name, legacy=True if "t5" in tok_name.lower() else False)
+        tokenizer = _load_tokenizer(model)
+
+    return model, tokenizer, ckpt
+
+
+def _count_tokens(tokens_in: int, tokens_out: int, batch: int) -> None:
+    INFERENCE_BATCH.observe(batch, model="qgen")
+    INFERENCE_TOKENS.inc(tokens_in, model="qgen", direction="in")
+    INFERENCE_TOKENS.inc(tokens_out, model="qgen", direction="out")
 
+
+def _build_input(
+    prompt: str, contexts: Optional[Mapping[str, str]], use_context: bool
+) -> Tuple[str, Optional[str], Optional[str]]:
     input_text = prompt
     topic = None
     context = None
@@ -62,20 +89,124 @@ def infer_qgen(
             if context:
                 input_text = f"{prompt} [SEP] {context}"
 
-    ids = tok(input_text, return_tensors="pt").input_ids.to(device)
-    with torch.no_grad():
+    return input_text, topic, context
+
+
+def padding_side(model) -> str:
+    return "right" if model.config.is_encoder_decoder else "left"
+
+
+def _generation_inputs(model, tokenizer, texts: List[str], checkpoint: str, encoder_cache=None) -> Dict[str, Any]:
+    if encoder_cache is not None and model.config.is_encoder_decoder:
+        with INFERENCE_STAGE.time(model="qgen", stage="encode"):
+            encoder_outputs, attention_mask = encoder_cache.encode(model, tokenizer, texts, checkpoint)
+        return {"encoder_outputs": encoder_outputs, "attention_mask": attention_mask}
+
+    device = next(model.parameters()).device
+    with INFERENCE_STAGE.time(model="qgen", stage="tokenize"):
+        enc = tokenizer(texts, return_tensors="pt", padding=True, padding_side=padding_side(model)).to(device)
+    return {"input_ids": enc.input_ids, "attention_mask": enc.attention_mask}
+
+
+def topic_prompts(topics: Sequence[str]) -> List[str]:
+    return [QUESTION_PROMPT.format(topic=topic) for topic in topics]
+
+
+def infer_qgen(
+    prompt: str,
+    cfg: DictConfig = None,
+    checkpoint: Optional[str] = None,
+    model_root: str = "./models",
+    use_context: bool = True,
+    model: Optional[AutoModelForSeq2SeqLM] = None,
+    tokenizer: Optional[AutoTokenizer] = None,
+    contexts: Optional[Mapping[str, str]] = None,
+    streamer: Optional[BaseStreamer] = None,
+    stopping_criteria: Optional[StoppingCriteriaList] = None,
+    encoder_cache: Optional[EncoderOutputCache] = None,
+) -> Dict[str, str]:
+    if model is None or tokenizer is None:
+        model, tokenizer, ckpt = load_qgen(checkpoint, model_root)
+    else:
+        ckpt = Path(checkpoint) if checkpoint else None
+
+    if contexts is None:
+        contexts = {}
+        if use_context and cfg:
+            contexts = qa_context_store(cfg)
+
+    input_text, topic, context = _build_input(prompt, contexts, use_context)
+    inputs = _generation_inputs(model, tokenizer, [input_text], str(ckpt), encoder_cache)
+
+    with INFERENCE_STAGE.time(model="qgen", stage="generate"), torch.no_grad():
         out = model.generate(
-            ids,
-            max_new_tokens=16,
-            do_sample=True,
-            temperature=0.5,
-            top_p=0.9,
+            **inputs,
+            streamer=streamer,
+            stopping_criteria=stopping_criteria,
+            **GENERATION_KWARGS,
         )
+    _count_tokens(int(inputs["attention_mask"].sum()), out.numel(), batch=1)
+
+    with INFERENCE_STAGE.time(model="qgen", stage="decode"):
+        generated_question = tokenizer.decode(out[0], skip_special_tokens=True)
 
     return {
         "prompt": prompt,
         "topic": topic,
         "context": context,
-        "generated_question": tok.decode(out[0], skip_special_tokens=True),
+        "generated_question": generated_question,
         "checkpoint": str(ckpt),
     }
+
+
+def infer_qgen_batch(
+    prompts: Sequence[str],
+    cfg: DictConfig = None,
+    checkpoint: Optional[str] = None,
+    model_root: str = "./models",
+    use_context: bool = True,
+    num_return_sequences: int = 1,
+    model: Optional[AutoModelForSeq2SeqLM] = None,
+    tokenizer: Optional[AutoTokenizer] = None,
+    contexts: Optional[Mapping[str, str]] = None,
+    encoder_cache: Optional[EncoderOutputCache] = None,
+) -> List[Dict[str, Any]]:
+    if model is None or tokenizer is None:
+        model, tokenizer, ckpt = load_qgen(checkpoint, model_root)
+    else:
+        ckpt = Path(checkpoint) if checkpoint else None
+
+    if contexts is None:
+        contexts = {}
+        if use_context and cfg:
+            contexts = qa_context_store(cfg)
+
+    if not prompts:
+        return []
+
+    inputs = [_build_input(prompt, contexts, use_context) for prompt in prompts]
+    model_inputs = _generation_inputs(model, tokenizer, [text for text, _, _ in inputs], str(ckpt), encoder_cache)
+
+    with INFERENCE_STAGE.time(model="qgen", stage="generate"), torch.no_grad():
+        out = model.generate(
+            **model_inputs,
+            num_return_sequences=num_return_sequences,
+            **GENERATION_KWARGS,
+        )
+    _count_tokens(
+        int(model_inputs["attention_mask"].sum()), int((out != tokenizer.pad_token_id).sum()), batch=out.shape[0]
+    )
+
+    with INFERENCE_STAGE.time(model="qgen", stage="decode"):
+        decoded = tokenizer.batch_decode(out, skip_special_tokens=True)
+
+    return [
+        {
+            "prompt": prompt,
+            "topic": topic,
+            "context": context,
+            "generated_questions": decoded[i * num_return_sequences:(i + 1) * num_return_sequences],
+            "checkpoint": str(ckpt),
+        }
+        for i, (prompt, (_, topic, context)) in enumerate(zip(prompts, inputs))
+    ]
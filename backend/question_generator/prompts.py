@@ -0,0 +1 @@
+QUESTION_PROMPT = "Generate a question about: {topic}"
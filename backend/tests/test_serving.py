@@ -0,0 +1,864 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from api.batching import GradingBatcher
+from api.checkpoint_watcher import CheckpointWatcher
+from api.executor import DeadlineExceeded, ExecutorSaturated, InferenceExecutor
+from api.grading_cache import GradingCache
+from api.question_pool import QuestionPool
+from api.rooms import RoomError, RoomManager
+from api.sessions import SessionFinished, SessionManager, SessionNotFound
+from common.metrics import MetricsRegistry
+
+
+def test_grading_batcher_coalesces_concurrent_requests():
+    batches = []
+
+    def grade(items):
+        batches.append(len(items))
+        return [{"student_answer": item["student_answer"], "predicted_score": 1} for item in items]
+
+    async def run():
+        batcher = GradingBatcher(grade, max_batch_size=8, max_wait_ms=20)
+        await batcher.start()
+        try:
+            return await asyncio.gather(
+                *[batcher.submit("What is the mean?", f"answer {i}", ["The average"]) for i in range(10)]
+            )
+        finally:
+            await batcher.stop()
+
+    results = asyncio.run(run())
+
+    assert [r["student_answer"] for r in results] == [f"answer {i}" for i in range(10)]
+    assert sum(batches) == 10
+    assert max(batches) <= 8
+    assert len(batches) < 10
+
+
+def test_inference_executor_rejects_when_saturated_and_drops_expired_work():
+    release = threading.Event()
+    calls = []
+
+    def blocking(tag):
+        calls.append(tag)
+        release.wait(5)
+        return tag
+
+    async def run():
+        executor = InferenceExecutor(max_workers=1, max_queue=1, retry_after=2)
+        running = asyncio.ensure_future(executor.run(blocking, "running"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.run(blocking, "expired", deadline=time.monotonic() + 0.05))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(ExecutorSaturated) as saturated:
+            await executor.run(blocking, "rejected")
+        with pytest.raises(DeadlineExceeded):
+            await queued
+
+        release.set()
+        assert await running == "running"
+        await asyncio.sleep(0.05)
+        return saturated.value, executor.stats()
+
+    saturated, stats = asyncio.run(run())
+
+    assert saturated.retry_after_header == "2"
+    assert calls == ["running"]
+    assert stats["rejected"] == 1
+    assert stats["queued"] == 0 and stats["running"] == 0
+
+
+def test_inference_executor_background_lane_yields_to_foreground():
+    release = threading.Event()
+    calls = []
+
+    def blocking(tag):
+        calls.append(tag)
+        release.wait(5)
+        return tag
+
+    async def run():
+        executor = InferenceExecutor(max_workers=1, max_queue=1, background_workers=1, background_queue=0)
+        running = asyncio.ensure_future(executor.run(blocking, "running"))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.run(blocking, "queued"))
+        refill = asyncio.ensure_future(executor.run_background(calls.append, "refill"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run_background(calls.append, "rejected")
+        assert calls == ["running"]
+
+        release.set()
+        assert await asyncio.gather(running, queued, refill) == ["running", "queued", None]
+        return executor.stats()
+
+    stats = asyncio.run(run())
+
+    assert calls == ["running", "queued", "refill"]
+    assert stats["rejected"] == 0
+    assert stats["background"]["rejected"] == 1 and stats["background"]["admitted"] == 0
+
+
+def test_metrics_registry_renders_prometheus_text():
+    metrics = MetricsRegistry()
+    requests = metrics.counter("requests_total", "Requests", ["route"])
+    latency = metrics.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+
+    requests.inc(route="/v1/classify_answer")
+    requests.inc(route="/v1/classify_answer")
+    latency.observe(0.05)
+    latency.observe(2.0)
+
+    lines = metrics.render().splitlines()
+
+    assert "# TYPE requests_total counter" in lines
+    assert 'requests_total{route="/v1/classify_answer"} 2' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in lines
+    assert "latency_seconds_count 2" in lines
+
+
+def test_grading_cache_coalesces_identical_answers_and_evicts_lru():
+    cache = GradingCache(max_entries=2)
+    calls = []
+
+    async def grade():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"predicted_score": 3}
+
+    key = cache.key("What is the mean?", "Mean is the average.", ["The average"], "ckpt")
+    assert key == cache.key("what is the mean", "mean is  the average", ["the average!"], "ckpt")
+    assert key != cache.key("what is the mean", "mean is the average", ["the average"], "other-ckpt")
+    assert cache.key("q", "p < 0.05", [], "ckpt") != cache.key("q", "p > 0.05", [], "ckpt")
+    assert cache.key("q", "-1", [], "ckpt") != cache.key("q", "1", [], "ckpt")
+    assert cache.key("q", "0.5", [], "ckpt") != cache.key("q", "05", [], "ckpt")
+
+    async def run():
+        return await asyncio.gather(*[cache.get_or_compute(key, grade) for _ in range(5)])
+
+    assert asyncio.run(run()) == [{"predicted_score": 3}] * 5
+    assert len(calls) == 1
+
+    cache.put("b", {"predicted_score": 1})
+    cache.put("c", {"predicted_score": 2})
+    assert cache.get(key) is None
+    stats = cache.stats()
+    assert stats["miss"] == 1 and stats["coalesced"] == 4
+    assert stats["evictions"]["lru"] == 1
+
+    async def expired():
+        await asyncio.sleep(0.01)
+        raise DeadlineExceeded()
+
+    async def follow():
+        leader = asyncio.ensure_future(cache.get_or_compute("d", expired))
+        follower = asyncio.ensure_future(cache.get_or_compute("d", grade))
+        with pytest.raises(DeadlineExceeded):
+            await leader
+        return await follower
+
+    assert asyncio.run(follow()) == {"predicted_score": 3}
+    assert cache.get("d") == {"predicted_score": 3}
+
+
+def test_checkpoint_watcher_swaps_only_settled_checkpoints(tmp_path):
+    class Loaded:
+        def __init__(self, checkpoint):
+            self.checkpoint = checkpoint
+
+    class Registry:
+        pinned = {"qgen": None, "grader": None}
+        qgen = None
+        grader = None
+        swaps = []
+
+        def swap(self, name, checkpoint):
+            self.swaps.append(checkpoint)
+            setattr(self, name, Loaded(checkpoint))
+
+    registry = Registry()
+    watcher = CheckpointWatcher(registry, tmp_path, settle_s=0.5)
+    old = time.time() - 60
+
+    ckpt = tmp_path / "grader-epoch=00.ckpt"
+    ckpt.write_bytes(b"weights")
+    os.utime(ckpt, (old, old))
+    asyncio.run(watcher.poll_once())
+    assert registry.swaps == []
+
+    asyncio.run(watcher.poll_once())
+    assert registry.swaps == [str(ckpt)]
+
+    writing = tmp_path / "grader-epoch=01.ckpt"
+    writing.write_bytes(b"partial")
+    asyncio.run(watcher.poll_once())
+    writing.write_bytes(b"partial weights")
+    asyncio.run(watcher.poll_once())
+    assert registry.swaps == [str(ckpt)]
+
+    registry.pinned["grader"] = str(ckpt)
+    os.utime(writing, (old + 30, old + 30))
+    asyncio.run(watcher.poll_once())
+    asyncio.run(watcher.poll_once())
+    assert registry.swaps == [str(ckpt)]
+
+    registry.pinned["grader"] = None
+    asyncio.run(watcher.poll_once())
+    assert registry.swaps == [str(ckpt), str(writing)]
+
+
+def test_session_prefetches_in_batches_and_releases_work_on_expiry():
+    calls = []
+
+    def generate(prompts, n):
+        calls.append(len(prompts))
+        return [
+            {"prompt": p, "topic": None, "context": "ctx", "generated_questions": [f"Q{len(calls)}.{i}"]}
+            for i, p in enumerate(prompts)
+        ]
+
+    async def run():
+        manager = SessionManager(generate, "about: {topic}", prefetch=2, ttl_s=0.05, reap_interval_s=60)
+        session = manager.create(["mean"], 5)
+        await asyncio.sleep(0.05)
+        assert session.ready.qsize() == 2
+
+        served = [await manager.next(session.id) for _ in range(5)]
+        with pytest.raises(SessionFinished):
+            await manager.next(session.id)
+
+        abandoned = manager.create(["median"], 10)
+        await asyncio.sleep(0.1)
+        assert manager.reap() == 2
+        await asyncio.sleep(0)
+        assert abandoned.task.done()
+        with pytest.raises(SessionNotFound):
+            await manager.next(session.id)
+
+        release = threading.Event()
+
+        def queued(fn, *args):
+            release.wait(5)
+            return fn(*args)
+
+        manager.runner = lambda fn, *args: asyncio.to_thread(queued, fn, *args)
+        before = len(calls)
+        closed = manager.create(["mode"], 3)
+        await asyncio.sleep(0.05)
+        manager.close(closed.id)
+        release.set()
+        await asyncio.sleep(0.05)
+        assert len(calls) == before
+        return served
+
+    served = asyncio.run(run())
+
+    assert [q["index"] for q in served] == [1, 2, 3, 4, 5]
+    assert served[-1]["remaining"] == 0
+    assert all(q["topic"] == "mean" for q in served)
+    assert max(calls) <= 2
+
+
+def test_review_store_batches_writes_survives_failures_and_pages_queries(tmp_path):
+    import json
+
+    from api.review_store import ReviewStore, export_jsonl
+
+    store = ReviewStore(tmp_path / "reviews.db", max_batch=64, flush_interval_ms=50)
+    batches, broken = [], []
+    commit = store._commit
+
+    def recording_commit(conn, pending):
+        if broken:
+            raise broken.pop()
+        batches.append(sum(len(items) for items, _ in pending))
+        commit(conn, pending)
+
+    store._commit = recording_commit
+    store.start()
+
+    def review(i):
+        return {"i": i, "question": {"topic": "mean" if i % 2 == 0 else "variance"}, "evaluation": {"score": i % 4}}
+
+    futures = [store.submit([review(i)]) for i in range(10)]
+    assert [f.result(5) for f in futures] == [1] * 10
+    assert sum(batches) == 10 and len(batches) < 10
+
+    bad, good = store.submit([{**review(10), "blob": object()}]), store.submit([review(10)])
+    with pytest.raises(TypeError):
+        bad.result(5)
+    assert good.result(5) == 1
+    broken.append(RuntimeError("boom"))
+    with pytest.raises(RuntimeError):
+        store.submit([review(11)]).result(5)
+    assert store.submit([review(12)]).result(5) == 1
+
+    page = store.query(topic="mean", min_score=1, limit=1, offset=1)
+    assert page["total"] == 3 and [item["i"] for item in page["items"]] == [6]
+    assert store.query(max_score=0, limit=50)["total"] == 4
+
+    store.stop()
+    with pytest.raises(RuntimeError):
+        store.submit([review(13)])
+
+    out = tmp_path / "reviews.jsonl"
+    assert export_jsonl(tmp_path / "reviews.db", out) == 12
+    assert [json.loads(line)["i"] for line in out.read_text(encoding="utf-8").splitlines()] == [*range(11), 12]
+
+
+def test_question_pool_counts_hits_refills_low_topics_and_clears_on_qgen_swap(monkeypatch):
+    import api.api as service
+
+    calls = []
+
+    def generate(prompts, n):
+        calls.append(sorted(prompts))
+        return [
+            {"prompt": p, "topic": None, "context": "", "generated_questions": [f"{p} #{len(calls)}.{i}" for i in range(n)]}
+            for p in prompts
+        ]
+
+    async def run():
+        pool = QuestionPool(generate, ["mean", "median"], "{topic}", capacity=3, low_watermark=2, refill_per_topic=3)
+        monkeypatch.setattr(service, "pool", pool)
+        await pool.start()
+        await asyncio.sleep(0.05)
+        assert calls == [["mean", "median"]]
+
+        first = pool.take("mean")
+        await asyncio.sleep(0.05)
+        assert len(calls) == 1
+        pool.take("mean")
+        await asyncio.sleep(0.05)
+        assert calls[1:] == [["mean"]]
+        assert pool.take("unknown") is None
+
+        await asyncio.to_thread(service.on_model_swap, "grader")
+        await asyncio.sleep(0.05)
+        assert len(calls) == 2
+        await asyncio.to_thread(service.on_model_swap, "qgen")
+        await asyncio.sleep(0.05)
+        swapped = pool.take("median")
+        stats = pool.stats()
+        await pool.stop()
+        return first, swapped, stats
+
+    first, swapped, stats = asyncio.run(run())
+
+    assert first["topic"] == "mean" and first["generated_question"] == "mean #1.0"
+    assert calls[2] == ["mean", "median"] and swapped["generated_question"] == "median #3.0"
+    assert stats["hits"] == 3 and stats["misses"] == 1 and stats["hit_rate"] == 0.75
+    assert stats["refilled"] == 15 and stats["buffered"] == 5
+
+
+def test_question_pool_clear_from_swap_thread_drops_stale_refill():
+    gate = threading.Event()
+    calls = []
+
+    def generate(prompts, n):
+        calls.append(prompts)
+        gate.wait(5)
+        return [{"prompt": p, "topic": None, "context": "", "generated_questions": [f"v{len(calls)}"] * n} for p in prompts]
+
+    async def run():
+        pool = QuestionPool(generate, ["mean"], "about {topic}", capacity=4, low_watermark=2, refill_per_topic=2)
+        await pool.start()
+        await asyncio.sleep(0.05)
+        await asyncio.to_thread(pool.clear)
+        gate.set()
+        await asyncio.sleep(0.1)
+        item = pool.take("mean")
+        await pool.stop()
+        return item
+
+    item = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert item["generated_question"] == "v2"
+
+
+def test_room_grades_all_answers_of_a_round_in_one_call():
+    calls = []
+    inboxes = {"alice": [], "bob": []}
+
+    hold = []
+
+    async def grade(items):
+        calls.append(items)
+        if hold:
+            await hold[0].wait()
+        return [{"student_answer": i["student_answer"], "predicted_score": 2, "probabilities": [0, 0, 1, 0]} for i in items]
+
+    def sender(player):
+        async def send(message):
+            inboxes[player].append(message)
+        return send
+
+    async def run():
+        manager = RoomManager(grade, round_s=5)
+        for player in inboxes:
+            await manager.join("room", player, sender(player))
+        for bad in ({"ref_answers": "avg"}, {"ref_answers": 3}, {"duration_s": 0}, {"duration_s": 121}):
+            with pytest.raises(RoomError):
+                await manager.handle("room", "alice", {"type": "round", "question": "What is the mean?", **bad})
+        await manager.handle("room", "alice", {"type": "round", "question": "What is the mean?", "ref_answers": ["avg"]})
+        await manager.handle("room", "alice", {"type": "answer", "answer": "the average"})
+        await manager.handle("room", "bob", {"type": "answer", "answer": "no idea"})
+        await asyncio.sleep(0.05)
+        first = {player: inbox[-1] for player, inbox in inboxes.items()}
+
+        hold.append(asyncio.Event())
+        await manager.handle("room", "alice", {"type": "round", "question": "What is variance?", "duration_s": 0.05})
+        await manager.handle("room", "alice", {"type": "answer", "answer": "spread"})
+        await asyncio.sleep(0.1)
+        with pytest.raises(RoomError):
+            await manager.handle("room", "bob", {"type": "answer", "answer": "too late"})
+        hold[0].set()
+        await asyncio.sleep(0.05)
+        return first
+
+    first = asyncio.run(run())
+
+    assert len(calls) == 2
+    assert [i["student_answer"] for i in calls[0]] == ["the average", "no idea"]
+    assert [i["student_answer"] for i in calls[1]] == ["spread"]
+    for player, inbox in inboxes.items():
+        assert first[player]["type"] == "scores" and first[player]["reason"] == "all_answered"
+        assert set(first[player]["results"]) == {"alice", "bob"}
+        scores = inbox[-1]
+        assert scores["reason"] == "deadline" and set(scores["results"]) == {"alice"} and scores["missing"] == ["bob"]
+        assert not any(m["type"] == "answered" and m.get("player_id") == "bob" and m["round"] == 2 for m in inbox)
+
+
+def test_stream_events_emit_tokens_done_and_errors_and_cancel_on_disconnect(tmp_path):
+    import json
+
+    torch = pytest.importorskip("torch")
+    from transformers import AutoTokenizer
+
+    from api.streaming import CancelOnDisconnect, CountingStreamer, stream_events
+    from benchmarks.stub_models import build_stub_workdir
+
+    tokenizer = AutoTokenizer.from_pretrained(str(build_stub_workdir(tmp_path, ["variance"]) / "hf" / "qgen"))
+    ids = tokenizer("what is the variance of the data", add_special_tokens=False).input_ids
+    steps = []
+
+    def generate(streamer, cancel, fail=False, endless=False):
+        streamer.put(torch.tensor([[tokenizer.bos_token_id or 0]]))
+        for i in range(1000 if endless else len(ids)):
+            if cancel(None, None):
+                break
+            steps.append(i)
+            streamer.put(torch.tensor([ids[i % len(ids)]]))
+            time.sleep(0.005 if endless else 0)
+            if fail and i == 2:
+                raise RuntimeError("decoder exploded")
+        streamer.end()
+        return {"prompt": "p", "topic": "variance", "context": None, "generated_question": tokenizer.decode(ids)}
+
+    def parse(chunk):
+        event, data = chunk.strip().split("\n")
+        return event[len("event: "):], json.loads(data[len("data: "):])
+
+    async def run(**mode):
+        executor = InferenceExecutor()
+        streamer = CountingStreamer(tokenizer, skip_special_tokens=True)
+        cancel = CancelOnDisconnect()
+        generation = executor.submit(generate, streamer, cancel, **mode)
+        events = stream_events(generation, streamer, cancel, time.perf_counter())
+        if not mode.get("endless"):
+            return [parse(chunk) async for chunk in events]
+        first = parse(await events.__anext__())
+        await events.aclose()
+        await generation
+        return [first, ("cancelled", cancel.cancelled.is_set())]
+
+    done = asyncio.run(run())
+    assert {name for name, _ in done[:-1]} == {"token"}
+    assert "".join(data["text"] for _, data in done[:-1]).strip() == tokenizer.decode(ids).strip()
+    assert done[-1][0] == "done" and done[-1][1]["tokens"] == len(ids) and done[-1][1]["ttft_ms"] is not None
+
+    failed = asyncio.run(run(fail=True))
+    assert failed[-1] == ("error", {"detail": "decoder exploded"})
+
+    steps.clear()
+    disconnected = asyncio.run(run(endless=True))
+    assert disconnected[0][0] == "token" and disconnected[1] == ("cancelled", True)
+    assert len(steps) < 1000
+
+
+def test_reduce_logits_groups_pairs_by_item():
+    torch = pytest.importorskip("torch")
+    from answer_classifier.infer import reduce_logits
+
+    logits = torch.tensor([[1.0, 0.0], [3.0, 0.0], [0.0, 5.0], [0.0, 0.0]])
+    owners = torch.tensor([0, 0, 1, 2])
+
+    assert reduce_logits(logits, owners, 3, "mean").tolist() == [[2.0, 0.0], [0.0, 5.0], [0.0, 0.0]]
+    assert reduce_logits(logits, owners, 3, "max").tolist() == [[3.0, 0.0], [0.0, 5.0], [0.0, 0.0]]
+
+    weighted = reduce_logits(logits, owners, 3, "weighted")
+    assert 2.0 < weighted[0, 0] < 3.0
+    assert torch.allclose(weighted[1:], logits[2:])
+
+    with pytest.raises(ValueError):
+        reduce_logits(logits, owners, 3, "median")
+
+
+
+def test_onnx_grader_matches_torch(tmp_path):
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnxscript")
+    pytest.importorskip("pytorch_lightning")
+    from answer_classifier.backends import PROBE, OnnxGrader, export_onnx, quantize_onnx
+    from answer_classifier.infer import infer_classifier, load_classifier
+    from benchmarks.stub_models import build_stub_workdir
+
+    workdir = build_stub_workdir(tmp_path, ["variance"])
+    model, tokenizer, _ = load_classifier(str(workdir / "models" / "grader-stub.ckpt"))
+    onnx_dir = export_onnx(model, tokenizer, tmp_path / "onnx")
+    int8_dir = quantize_onnx(onnx_dir, tmp_path / "onnx-int8")
+
+    enc = tokenizer(*PROBE, padding=True, return_tensors="pt")
+    with torch.no_grad():
+        expected = model(**enc).logits
+    assert torch.allclose(OnnxGrader(onnx_dir)(**enc).logits, expected, atol=1e-4)
+    assert torch.allclose(OnnxGrader(int8_dir)(**enc).logits, expected, atol=5e-2)
+
+    result = infer_classifier("What is variance?", "spread", ["spread of data"], checkpoint=str(int8_dir))
+    assert result["checkpoint_used"] == str(int8_dir)
+    assert len(result["probabilities"]) == model.config.num_labels
+
+
+def test_shared_weights_round_trip_is_memory_mapped_and_dispatched(tmp_path):
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("pytorch_lightning")
+    from answer_classifier.infer import load_classifier
+    from benchmarks.stub_models import build_stub_workdir
+    from common.shared_weights import WEIGHTS_FILE, export_shared, is_shared_dir
+    from question_generator.infer import load_qgen
+
+    workdir = build_stub_workdir(tmp_path, ["variance"])
+    grader, grader_tok, _ = load_classifier(str(workdir / "models" / "grader-stub.ckpt"))
+    qgen, qgen_tok, _ = load_qgen(str(workdir / "models" / "qgen-stub.ckpt"))
+
+    grader_dir = export_shared(grader, grader_tok, tmp_path / "shared" / "grader", "grader-stub.ckpt")
+    qgen_dir = export_shared(qgen, qgen_tok, tmp_path / "shared" / "qgen", "qgen-stub.ckpt")
+    assert is_shared_dir(grader_dir) and is_shared_dir(qgen_dir) and not is_shared_dir(workdir / "models")
+
+    shared_grader, shared_grader_tok, path = load_classifier(str(grader_dir))
+    shared_qgen, shared_qgen_tok, _ = load_qgen(str(qgen_dir))
+    assert path == grader_dir
+
+    enc = grader_tok(["what is variance"], ["the spread of the data"], return_tensors="pt")
+    prompt = qgen_tok(["generate a question about: variance"], return_tensors="pt")
+    prompt = {"input_ids": prompt.input_ids, "attention_mask": prompt.attention_mask}
+    with torch.no_grad():
+        assert torch.equal(shared_grader(**enc).logits, grader(**enc).logits)
+        assert torch.equal(
+            shared_qgen.generate(**prompt, max_new_tokens=8, do_sample=False),
+            qgen.generate(**prompt, max_new_tokens=8, do_sample=False),
+        )
+    assert shared_grader_tok("what is variance").input_ids == grader_tok("what is variance").input_ids
+    assert shared_qgen_tok("variance").input_ids == qgen_tok("variance").input_ids
+
+    if os.path.exists("/proc/self/maps"):
+        with open("/proc/self/maps") as f:
+            mapped = [
+                tuple(int(a, 16) for a in line.split()[0].split("-"))
+                for line in f
+                if line.rstrip().endswith(str(grader_dir / WEIGHTS_FILE))
+            ]
+        param = next(shared_grader.parameters())
+        assert not param.requires_grad
+        assert any(lo <= param.data_ptr() < hi for lo, hi in mapped)
+
+
+def test_cascade_calibrates_and_short_circuits(tmp_path):
+    from answer_classifier.cascade import Cascade, calibrate, evaluate
+
+    refs = ["the average value of the data", "sum divided by the count"]
+    rows = (
+        [{"question": "mean?", "student_answer": "", "ref_answers": refs, "score": 0}] * 5
+        + [{"question": "mean?", "student_answer": "The average value of the data!", "ref_answers": refs, "score": 3}] * 5
+        + [{"question": "mean?", "student_answer": "bananas are yellow", "ref_answers": refs, "score": 0}] * 5
+        + [{"question": "mean?", "student_answer": "the value in the middle", "ref_answers": refs, "score": 1}]
+        + [{"question": "mean?", "student_answer": "the middle value", "ref_answers": refs, "score": 2}]
+    )
+
+    cascade = Cascade.load(calibrate(rows, num_classes=4, target_precision=0.95, min_support=3).save(tmp_path / "c.json"))
+
+    assert cascade.empty_score == 0
+    assert cascade.decide("  ?! ", refs) == (0, "empty")
+    assert cascade.decide("the average value of the data", refs) == (3, "verbatim")
+    assert cascade.decide("bananas are yellow", refs) == (0, "unrelated")
+    assert cascade.decide("the middle value", refs) is None
+    assert cascade.decide("anything", []) is None
+    assert cascade.decide("not the average value of the data", refs) is None
+    assert cascade.decide("p > 0.05", ["p < 0.05"]) is None
+    assert cascade.decide("p < 0.05", ["p < 0.05"]) == (3, "verbatim")
+
+    result = cascade.grade({"question": "mean?", "student_answer": "", "ref_answers": refs})
+    assert result["predicted_score"] == 0 and result["probabilities"] == [1.0, 0.0, 0.0, 0.0]
+    assert cascade.grade({"question": "mean?", "student_answer": "the middle value", "ref_answers": refs}) is None
+    assert cascade.stats()["short_circuit_fraction"] == 0.5
+    negated = {"question": "mean?", "student_answer": "The average value of the data is not it", "ref_answers": refs}
+    assert cascade.grade(negated) is None and cascade.stats()["deferred"] == 2
+
+    report = evaluate(cascade, rows, model_scores=[1] * len(rows))
+    assert report["short_circuit_fraction"] == round(15 / 17, 4)
+    assert report["short_circuit_accuracy"] == 1.0
+    assert report["cascade_accuracy"] > report["model_accuracy"]
+
+    pytest.importorskip("torch")
+    from answer_classifier.infer import infer_classifier_batch
+
+    ckpt = tmp_path / "models" / "grader-epoch=00.ckpt"
+    ckpt.parent.mkdir()
+    ckpt.write_bytes(b"weights")
+    graded = infer_classifier_batch(rows[:1], model_root=str(ckpt.parent), cascade=cascade)
+    assert graded[0]["stage"] == "empty" and graded[0]["checkpoint_used"] == str(ckpt)
+
+
+def test_cascade_holdout_excludes_grader_training_pairs(tmp_path):
+    import json
+
+    pytest.importorskip("pytorch_lightning")
+    from answer_classifier.datamodule import GradedAnswerDM, heldout_split
+    from benchmarks.stub_models import build_stub_workdir
+
+    workdir = build_stub_workdir(tmp_path, ["variance"])
+    rows = [
+        {"question": "q", "student_answer": f"answer {i}", "ref_answers": [f"ref {j}" for j in range(i % 3 + 1)], "score": i % 4}
+        for i in range(60)
+    ]
+    data = tmp_path / "graded.jsonl"
+    data.write_text("".join(json.dumps(r) + "\n" for r in rows), encoding="utf-8")
+
+    dm = GradedAnswerDM(str(data), str(workdir / "hf" / "grader"), use_ref_answers=True, val_split=0.3, seed=7)
+    dm.setup()
+    train_rows, heldout = heldout_split(rows, val_split=0.3, seed=7)
+
+    assert heldout and len(train_rows) + len(heldout) == len(rows)
+    assert not {r["student_answer"] for r in heldout} & {r["student"] for r in dm.train_rows}
+    assert {r["student_answer"] for r in train_rows} == {r["student"] for r in dm.train_rows}
+
+
+def test_prefix_encoding_cache_matches_tokenizer():
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("tokenizers")
+    from answer_classifier.encoding_cache import PrefixEncodingCache
+    from benchmarks.stub_models import BERT_SPECIALS, _tokenizer, _words
+
+    tokenizer = _tokenizer(
+        BERT_SPECIALS, _words(["variance"]), "[CLS] $A [SEP]", "[CLS] $A [SEP] $B:1 [SEP]:1", "[CLS]", "[SEP]"
+    )
+    cache = PrefixEncodingCache(max_entries=8)
+    prompts = ["what is the mean ? [SEP] the average value"] * 3 + ["what is variance ? [SEP] " + "data " * 40]
+    answers = ["the average", "", "the mean value of the sample", "sample " * 30]
+
+    for max_length in (128, 32):
+        expected = tokenizer(prompts, answers, truncation=True, padding=True, max_length=max_length, return_tensors="pt")
+        got = cache.encode(tokenizer, prompts, answers, max_length)
+        assert set(got) == set(expected)
+        for key in expected:
+            assert torch.equal(got[key], expected[key]), key
+
+    stats = cache.stats()
+    assert stats["templates"] == {next(iter(stats["templates"])): True}
+    assert stats["hit"] == 6 and stats["miss"] == 2
+    assert stats["overflow"] == 1
+
+
+def test_compiled_grader_pads_to_buckets():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from answer_classifier.compiled import CompiledGrader
+
+    torch.manual_seed(0)
+    model = transformers.BertForSequenceClassification(
+        transformers.BertConfig(
+            vocab_size=50, hidden_size=16, num_hidden_layers=1, num_attention_heads=2, intermediate_size=32, num_labels=4
+        )
+    ).eval()
+    compiled = CompiledGrader(model, pad_token_id=0, buckets=(8, 16), mode="trace")
+    compiled.warm_buckets((1, 2))
+
+    for batch, length in ((1, 3), (3, 8), (2, 12), (2, 20)):
+        ids = torch.randint(1, 50, (batch, length))
+        inputs = {"input_ids": ids, "attention_mask": torch.ones_like(ids), "token_type_ids": torch.zeros_like(ids)}
+        with torch.no_grad():
+            expected = model(**inputs).logits
+        assert torch.allclose(compiled(**inputs).logits, expected, atol=1e-5)
+
+    assert compiled.bucket(5) == 8 and compiled.bucket(16) == 16 and compiled.bucket(17) is None
+    assert sorted(compiled._graphs) == [8, 16]
+
+
+def test_early_exit_model_stops_at_confident_layer():
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    from answer_classifier.early_exit import EarlyExitModel, build_exit_heads, default_exit_layers
+
+    torch.manual_seed(0)
+    backbone = transformers.BertForSequenceClassification(
+        transformers.BertConfig(
+            vocab_size=50, hidden_size=16, num_hidden_layers=3, num_attention_heads=2, intermediate_size=32, num_labels=4
+        )
+    ).eval()
+    layers = default_exit_layers(3)
+    model = EarlyExitModel(backbone, build_exit_heads(16, 4, layers), layers).eval()
+
+    ids = torch.randint(1, 50, (5, 7))
+    inputs = {"input_ids": ids, "attention_mask": torch.ones_like(ids), "token_type_ids": torch.zeros_like(ids)}
+    with torch.no_grad():
+        expected = backbone(**inputs).logits
+
+    model.threshold = float("inf")
+    assert torch.allclose(model(**inputs).logits, expected, atol=1e-6)
+    assert model.stats()["avg_layers"] == 3
+
+    model.reset_stats()
+    model.threshold = 0.0
+    early = model(**inputs).logits
+    assert model.stats()["avg_layers"] == 1
+    with torch.no_grad():
+        first = model.exit_heads[0](backbone.bert.encoder.layer[0](
+            backbone.bert.embeddings(input_ids=ids, token_type_ids=inputs["token_type_ids"])
+        )[0][:, 0])
+    assert torch.allclose(early, first, atol=1e-6)
+
+
+def test_distillation_caches_teacher_logits_and_mixes_soft_labels(tmp_path):
+    torch = pytest.importorskip("torch")
+    pytest.importorskip("pytorch_lightning")
+    from answer_classifier.distill import TeacherLogits
+    from answer_classifier.model import DistilledGrader
+    from benchmarks.stub_models import build_stub_workdir
+
+    workdir = build_stub_workdir(tmp_path, ["variance"])
+    checkpoint = str(workdir / "models" / "grader-stub.ckpt")
+    rows = [{"context": "what is variance", "student": answer, "label": 1} for answer in ("the data", "the value", "")]
+
+    first = TeacherLogits(checkpoint, None, tmp_path / "cache", batch_size=2)
+    logits = first(rows)
+    assert logits.shape == (3, 4) and len(list((tmp_path / "cache").glob("*.pt"))) == 1
+
+    second = TeacherLogits(checkpoint, None, tmp_path / "cache")
+    assert torch.equal(second(rows), logits) and second._teacher is None
+    assert second.key(rows[:2]) != second.key(rows)
+
+    student = DistilledGrader(model_name=str(workdir / "hf" / "grader"))
+    model, tokenizer, _ = first.teacher()
+    batch = dict(tokenizer([r["context"] for r in rows], [r["student"] for r in rows], padding=True, return_tensors="pt"))
+    batch["labels"] = torch.tensor([r["label"] for r in rows])
+    with torch.no_grad():
+        own = student(batch)
+        student.alpha = 1.0
+        _, hard = student._logits_and_loss({**batch, "teacher_logits": logits})
+        assert torch.allclose(hard, student.loss_fn(own, batch["labels"]))
+        student.alpha = 0.0
+        _, soft = student._logits_and_loss({**batch, "teacher_logits": own})
+        assert float(soft) < 1e-6
+
+
+def test_context_store_indexes_appends_and_reports_duplicates(tmp_path):
+    import json
+
+    from common.context_store import ContextStore
+
+    path = tmp_path / "context_data.jsonl"
+
+    def append(text):
+        with path.open("a", encoding="utf-8") as f:
+            f.write(text)
+
+    def line(topic, context):
+        return json.dumps({"topic": topic, "context": context}, ensure_ascii=False) + "\n"
+
+    append(line("mean", "the average") + "not json\n" + line("variance", "spread") + line("mean", "the expected value"))
+    store = ContextStore(path, hot_entries=1, reload_interval=0)
+    first = ContextStore(tmp_path / "context_data.jsonl", duplicates="first", reload_interval=0)
+
+    assert store["mean"] == "the expected value" and first["mean"] == "the average"
+    assert sorted(store) == ["mean", "variance"] and store.get("median") is None
+    assert store.stats()["duplicate_lines"] == 1
+
+    append(line("median", "the middle value") + '{"topic": "mode", "cont')
+    assert store["median"] == "the middle value" and "mode" not in store
+    append('ext": "the most common value"}\n')
+    assert store["mode"] == "the most common value" and len(store) == 4
+    assert store["variance"] == "spread" and store.stats()["hot"] == 1
+
+    reopened = ContextStore(path, reload_interval=0)
+    assert reopened.stats()["indexed_bytes"] == path.stat().st_size
+    assert dict(reopened) == dict(store)
+
+    path.write_text(line("sd", "square root of variance"), encoding="utf-8")
+    assert dict(store) == {"sd": "square root of variance"}
+
+
+def test_qgen_batch_matches_single_prompt_generation(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("pytorch_lightning")
+    import question_generator.infer as qgen
+    from benchmarks.stub_models import build_stub_workdir
+
+    workdir = build_stub_workdir(tmp_path, ["variance", "mean"])
+    model, tokenizer, _ = qgen.load_qgen(str(workdir / "models" / "qgen-stub.ckpt"))
+    contexts = {"mean": "the mean is a value of the data"}
+    prompts = qgen.topic_prompts(["variance", "mean"])
+
+    sampled = qgen.infer_qgen_batch(prompts, model=model, tokenizer=tokenizer, contexts=contexts, num_return_sequences=3)
+    assert [(r["topic"], r["context"]) for r in sampled] == [("variance", None), ("mean", contexts["mean"])]
+    assert [len(r["generated_questions"]) for r in sampled] == [3, 3]
+
+    monkeypatch.setitem(qgen.GENERATION_KWARGS, "do_sample", False)
+    assert qgen.padding_side(model) == "right"
+    batch = qgen.infer_qgen_batch(prompts, model=model, tokenizer=tokenizer, contexts=contexts)
+    for prompt, result in zip(prompts, batch):
+        single = qgen.infer_qgen(prompt, model=model, tokenizer=tokenizer, contexts=contexts)
+        assert result["generated_questions"] == [single["generated_question"]]
+    assert qgen.infer_qgen_batch([], model=model, tokenizer=tokenizer) == []
+
+
+def test_qgen_encoder_cache_reuses_hidden_states_within_budget(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("pytorch_lightning")
+    import question_generator.infer as qgen
+    from benchmarks.stub_models import build_stub_workdir
+    from question_generator.encoder_cache import EncoderOutputCache
+
+    workdir = build_stub_workdir(tmp_path, ["variance", "mean"])
+    model, tokenizer, _ = qgen.load_qgen(str(workdir / "models" / "qgen-stub.ckpt"))
+    monkeypatch.setitem(qgen.GENERATION_KWARGS, "do_sample", False)
+
+    contexts = {"mean": "the mean is a value of the data"}
+    prompts = qgen.topic_prompts(["variance", "mean", "variance"])
+    expected = qgen.infer_qgen_batch(prompts, model=model, tokenizer=tokenizer, contexts=contexts)
+
+    cache = EncoderOutputCache(max_mb=1)
+    for _ in range(2):
+        got = qgen.infer_qgen_batch(prompts, model=model, tokenizer=tokenizer, contexts=contexts, encoder_cache=cache)
+        assert [r["generated_questions"] for r in got] == [r["generated_questions"] for r in expected]
+    single = qgen.infer_qgen(prompts[1], model=model, tokenizer=tokenizer, contexts=contexts, encoder_cache=cache)
+    assert single["generated_question"] == expected[1]["generated_questions"][0]
+
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["miss"] == 2 and stats["hit"] == 5
+    assert 0 < stats["memory_mb"] <= stats["max_mb"]
+
+    probe = EncoderOutputCache()
+    probe.encode(model, tokenizer, [prompts[0]], "a")
+    tight = EncoderOutputCache(max_mb=1.5 * probe._bytes / 2 ** 20)
+    tight.encode(model, tokenizer, [prompts[0]], "a")
+    tight.encode(model, tokenizer, [prompts[0]], "b")
+    assert tight.stats()["entries"] == 1 and tight.stats()["evicted"] == 1
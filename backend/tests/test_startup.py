@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+TRAINING = {"pytorch_lightning", "torchmetrics", "bert_score", "mlflow", "openai"}
+MODELS = {"torch", "transformers"}
+
+
+def cold_import(module):
+    code = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "print(json.dumps({'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    return report["seconds"], {name.split(".")[0] for name in report["modules"]}
+
+
+@pytest.mark.parametrize(
+    "module, forbidden, budget_s",
+    [
+        ("commands", TRAINING | MODELS | {"hydra"}, 1.5),
+        ("api.api", TRAINING | MODELS | {"hydra"}, 3.0),
+        ("answer_classifier.infer", TRAINING, 15.0),
+        ("question_generator.infer", TRAINING, 15.0),
+    ],
+)
+def test_cold_import_stays_within_budget(module, forbidden, budget_s):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("fire")
+
+    seconds, loaded = cold_import(module)
+
+    assert not loaded & forbidden, f"{module} eagerly imports {sorted(loaded & forbidden)}"
+    assert seconds < budget_s, f"{module} took {seconds:.2f}s to import (budget {budget_s}s)"